@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# Parallel re-processing of recorded footage with the CPU backend (see ofe_cpu.py). Every video file is split
+# into time segments; a segment starts decoding at a keyframe some overlap before its first frame, so that the
+# detector and the tracker are warmed up when it starts, and the segments are decoded, detected and tracked
+# in a process pool. The overlap is never shorter than the warm-up of the detector (its warmup_frames, the
+# background model history for background subtraction) and the tracker (trackerMinHits); a shorter
+# --overlap-seconds is raised to it, as the first detections of a cold segment differ from a single pass.
+# The merge step stitches the tracks of consecutive segments by matching their boxes in the overlap, so
+# that a vehicle crossing a segment boundary keeps one track instead of turning into two
+# vehicles, and renumbers the tracks in order of appearance. The stitched detections then run through the
+# Extractor in frame order, exactly as a single pass would, and the optimal frames are cropped by seeking
+# back into the segments in parallel. With a detection cache configured (detectionCache in config.ini), the
+# stitched detections of a video are cached, and a re-run with other road geometry or lifecycle settings
+# skips decoding and detection and only seeks to the optimal frames for the crops.
+#
+# usage: python3 archive.py [--workers N] [--segment-seconds 300] [--overlap-seconds 0] [--verify] <video1> [video2] ... <folder to save frames>
+
+import configparser
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from detection_cache import DetectionCache, detector_fingerprint, fingerprint
+from extractor import Extractor, LANE_NAMES
+from frame_scoring import scorer_from_config
+from fragments import linker_from_config
+from iou_tracker import iou_matrix, greedy_assignment
+from lane_geometry import LaneMap
+from ofe_cpu import BASE, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, load_detector, tracker_from_config
+from replay import lifecycle_from_config
+from source_state import Road, SourceState
+from vehicle_output import VehicleOutput
+
+STITCH_IOU = 0.5    # least overlap of two segments' boxes in the same frame to take them for the same vehicle
+
+def keyframes(path):
+    # keyframe indices of a video file with ffprobe, or None when ffprobe is not available
+    if shutil.which('ffprobe') is None:
+        return None
+    out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey', '-show_entries', 'frame=pts_time',
+                          '-of', 'csv=p=0', path], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    fps = cv2.VideoCapture(path).get(cv2.CAP_PROP_FPS) or 30
+    return sorted({int(round(float(t) * fps)) for t in out.stdout.split() if t.strip() not in ('', 'N/A')})
+
+def recording_start(path):
+    # wall clock time (epoch seconds) of the first frame of a video file: the container's creation_time with ffprobe,
+    # or else the file's modification time less its duration, as a recorder closes the file when the recording ends
+    if shutil.which('ffprobe') is not None:
+        out = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format_tags=creation_time', '-of', 'csv=p=0', path], capture_output=True, text=True)
+        created = out.stdout.strip()
+        if out.returncode == 0 and created:
+            try:
+                return datetime.datetime.fromisoformat(created.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                pass
+    capture = cv2.VideoCapture(path)
+    duration = capture.get(cv2.CAP_PROP_FRAME_COUNT) / (capture.get(cv2.CAP_PROP_FPS) or 30)
+    capture.release()
+    return os.path.getmtime(path) - duration
+
+def warmup_frames(config, detector_spec):
+    # least overlap in frames: the detector's warm-up (0 for a detector without memory of earlier frames) and the frames a track takes to be confirmed
+    return getattr(load_detector(detector_spec), 'warmup_frames', 0) + config.getint('OFEConfig', 'trackerMinHits', fallback=2)
+
+def plan_segments(frame_count, segment_frames, overlap, keys=None):
+    # [(decode from, first frame, end frame)]; every segment owns [first, end) and decodes from the last
+    # keyframe at least overlap frames before its first frame (from any frame if keys is None)
+    bounds = list(range(0, max(frame_count, 1), max(segment_frames, 1))) + [frame_count]
+    segments = []
+    for first, end in zip(bounds, bounds[1:]):
+        decode_from = max(first - overlap, 0)
+        if keys is not None and first:
+            earlier = [k for k in keys if k <= decode_from]
+            decode_from = earlier[-1] if earlier else 0
+        segments.append((decode_from, first, end))
+    segments[-1] = segments[-1][:2] + (None,)   # the frame count of a container can be off; the last segment runs to the end of the file
+    return segments
+
+def read_frames(capture, first, end=None):
+    # (frame number, BGR frame scaled to the muxer output) from first up to end
+    capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+    frame_number = first
+    while end is None or frame_number < end:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if (frame.shape[1], frame.shape[0]) != (MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT):
+            frame = cv2.resize(frame, (MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT), interpolation=cv2.INTER_LINEAR)
+        yield frame_number, frame
+        frame_number += 1
+
+def track_segment(task):
+    # pool worker; detections with segment-local tracking ids of every decoded frame, warm-up frames included
+    path, decode_from, end, config_path, detector_spec = task
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    detector = load_detector(detector_spec)
+    tracker = tracker_from_config(config)
+    capture = cv2.VideoCapture(path)
+    frames = []
+    for frame_number, frame in read_frames(capture, decode_from, end):
+        boxes, confidence = detector.detect(frame)
+        frames.append(tracker.update(boxes, 0, confidence))
+    capture.release()
+    return frames
+
+def crop_frames(task):
+    # pool worker; [(index, crop)] of the optimal frames of one segment, seeking forward through it
+    path, wanted = task     # [(index, frame number, left, top, width, height)] in frame order
+    capture = cv2.VideoCapture(path)
+    crops = []
+    position = -1
+    frame = None
+    for index, frame_number, left, top, width, height in wanted:
+        if frame_number != position:
+            if frame_number < position or frame_number > position + 30:     # far ahead; seek instead of decoding through
+                capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                position = frame_number - 1
+            while position < frame_number:
+                ok, frame = capture.read()
+                position += 1
+                if not ok:
+                    frame = None
+                    break
+            if frame is not None and (frame.shape[1], frame.shape[0]) != (MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT):
+                frame = cv2.resize(frame, (MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT), interpolation=cv2.INTER_LINEAR)
+        if frame is None:
+            crops.append((index, None))
+            continue
+        x1, y1 = int(left), int(top)
+        crops.append((index, frame[y1:y1 + int(height), x1:x1 + int(width)].copy()))
+    capture.release()
+    return crops
+
+def stitch(segments, results, iou_threshold=STITCH_IOU):
+    # merge the segments of one video; returns ([(frame number, detections)] of the owned frames with global
+    # tracking ids numbered in order of appearance, tracks continued across a segment boundary)
+    owned = []     # (frame number, detections with segment-local ids, token by local id of the segment)
+    previous = None     # (first frame, owned detections, token by local id) of the previous segment
+    stitched = 0
+    for k, ((decode_from, first, end), frames) in enumerate(zip(segments, results)):
+        tokens = {}     # local id: track token; a track continued from the previous segment keeps its token
+        if previous is not None:
+            prev_first, prev_frames, prev_tokens = previous
+            used = set()
+            for frame_number in range(first - 1, decode_from - 1, -1):     # latest overlap frame first; the warm-up has settled the most there
+                if not 0 <= frame_number - prev_first < len(prev_frames) or frame_number - decode_from >= len(frames):
+                    continue
+                mine = frames[frame_number - decode_from]
+                theirs = prev_frames[frame_number - prev_first]
+                if not len(mine) or not len(theirs):
+                    continue
+                rows, cols = greedy_assignment(iou_matrix(_boxes(mine), _boxes(theirs)), iou_threshold)
+                for r, c in zip(rows.tolist(), cols.tolist()):
+                    local, token = int(mine['object_id'][r]), prev_tokens.get(int(theirs['object_id'][c]))
+                    if local in tokens or token is None or token in used:
+                        continue
+                    tokens[local] = token
+                    used.add(token)
+            stitched += len(tokens)
+        segment_frames = frames[first - decode_from:]
+        for i, detections in enumerate(segment_frames):
+            for local in detections['object_id'].tolist():
+                tokens.setdefault(local, (k, local))
+            owned.append((first + i, detections, tokens))
+        previous = (first, segment_frames, tokens)
+    global_ids = {}     # token: tracking id, in order of first appearance
+    merged = []
+    for frame_number, detections, tokens in owned:
+        detections = detections.copy()
+        detections['object_id'] = [global_ids.setdefault(tokens[local], len(global_ids) + 1) for local in detections['object_id'].tolist()]
+        merged.append((frame_number, detections))
+    return merged, stitched
+
+def _boxes(detections):
+    return np.stack((detections['left'], detections['top'], detections['width'], detections['height']), axis=1).astype(np.float64)
+
+def extract(merged, config, roads, fps, submit, folder, extension='.jpg', starts=None):
+    # the stitched detections of every video through one Extractor, in frame order; returns the extractor. Event times
+    # are recorded times, offset by the start time of every video (see recording_start) when starts is given
+    extractor = Extractor(lifecycle_from_config(config), submit, LANE_NAMES, None, extension, config.getboolean('OFEConfig', 'verbose', fallback=False),
+                          scorer=scorer_from_config(config, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT), linker=linker_from_config(config),
+                          batch_threshold=config.getint('OFEConfig', 'batchThreshold', fallback=32))     # detections only at this stage; geometric terms
+    for source, road in enumerate(roads):
+        lanes = LaneMap(road.boundaries(), MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, config.getint('OFEConfig', 'laneRasterScale', fallback=4), len(LANE_NAMES) - 1)
+        state = extractor.add_source(SourceState(source, road, lanes, folder + "/stream_" + str(source)))
+        start = starts[source] if starts is not None else 0.0
+        for frame_number, detections in merged[source]:
+            extractor.update(state, frame_number, detections)
+            extractor.sweep(state, frame_number, start + frame_number / fps[source])     # recorded time; fixed per file, so the event log of an archive run is reproducible
+        extractor.drain(start + len(merged[source]) / fps[source], source)
+    return extractor
+
+def process(paths, config, config_path, detector_spec, segment_seconds, overlap_seconds, workers, cache=None):
+    # segment, track in parallel and stitch every video, or take its detections from the cache; returns
+    # ({source: merged frames}, fps by source, segments, stitched tracks)
+    settings = fingerprint(detector_fingerprint(detector_spec), {k: v for k, v in config['OFEConfig'].items() if k.startswith('tracker')} if config.has_section('OFEConfig') else {},
+                           segment_seconds, overlap_seconds, STITCH_IOU, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT)     # everything that shapes the detections
+    warmup = warmup_frames(config, detector_spec) if segment_seconds else 0
+    merged, plans, fps, keys = {}, {}, [], {}
+    for source, path in enumerate(paths):
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise IOError("unable to open %s" % path)
+        rate = capture.get(cv2.CAP_PROP_FPS) or 30
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+        fps.append(rate)
+        if cache is not None:
+            keys[source] = cache.key(path, settings)
+            cached = cache.get(keys[source])
+            if cached is not None:      # extraction re-runs straight from the cached detections
+                merged[source] = cached
+                continue
+        segment_frames = int(segment_seconds * rate) if segment_seconds else max(frame_count, 1)
+        overlap = int(overlap_seconds * rate)
+        if overlap < warmup:
+            if overlap_seconds:     # 0 asks for the warm-up
+                    sys.stderr.write("Overlap of %d frames is shorter than the detector and tracker warm-up of %d frames; using %d (%.1f s) for %s\n"
+                                 % (overlap, warmup, warmup, warmup / rate, path))
+            overlap = warmup
+        plans[source] = plan_segments(frame_count, segment_frames, overlap, keyframes(path) if segment_seconds else None)
+    tasks = [(paths[source], decode_from, end, config_path, detector_spec) for source, plan in plans.items() for decode_from, _, end in plan]
+    if workers == 1 or len(tasks) <= 1:
+        results = [track_segment(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(track_segment, tasks))
+    stitched = 0
+    for source, plan in plans.items():
+        merged[source], s = stitch(plan, results[:len(plan)])
+        results = results[len(plan):]
+        stitched += s
+        if cache is not None:
+            cache.put(keys[source], merged[source], fps[source])
+    return merged, fps, sum(len(plan) for plan in plans.values()), stitched
+
+def crop_events(paths, events, workers, segment_frames=9000):
+    # crops of the optimal frames, decoded in parallel by groups of nearby frames of each video
+    groups = {}
+    for index, event in enumerate(events):
+        groups.setdefault((event['stream'], event['frame_number'] // segment_frames), []).append(
+            (index, event['frame_number'], event['x'], event['y'], event['width'], event['height']))
+    tasks = [(paths[stream], sorted(wanted, key=lambda w: w[1])) for (stream, _), wanted in sorted(groups.items())]
+    if workers == 1 or len(tasks) <= 1:
+        results = [crop_frames(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(crop_frames, tasks))
+    for crops in results:
+        for index, crop in crops:
+            events[index]['crop'] = crop
+
+def event_key(event):
+    return (event['stream'], event['vehicle_id'], event['frame_number'], event['x'], event['y'], event['width'], event['height'], event['lane_id'])
+
+def main(args):
+    parser = ArgumentParser(description='Re-process recorded video files in parallel time segments with the CPU backend.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes; one per core if omitted')
+    parser.add_argument('--segment-seconds', type=float, default=300, help='segment length; 0 processes every file in one piece')
+    parser.add_argument('--overlap-seconds', type=float, default=0, help='warm-up decoded before every segment and used to stitch tracks; at least, and by default, the detector and tracker warm-up')
+    parser.add_argument('--detector', help="detector factory as 'module:name'; background subtraction if omitted")
+    parser.add_argument('--no-server', action='store_true', help='do not put vehicle records to the server')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--road', default='road.txt')
+    parser.add_argument('--verify', action='store_true', help='also run a single sequential pass and compare the vehicle events')
+    parser.add_argument('paths', nargs='+', help='video files, followed by the folder to save frames')
+    options = parser.parse_args(args[1:])
+    if len(options.paths) < 2:
+        parser.error('at least one video file and the output folder are required')
+    paths, folder_name = options.paths[:-1], options.paths[-1]
+    if os.path.exists(folder_name):
+        sys.stderr.write("The output folder %s already exists. Please remove it first.\n" % folder_name)
+        return 1
+
+    config = configparser.ConfigParser()
+    config.read(options.config)
+    roads = [Road.from_file(options.road)] * len(paths)
+
+    vehicle_output = VehicleOutput(config, BASE, server=not options.no_server)
+    start = time.perf_counter()
+    cache_folder = config.get('OFEConfig', 'detectionCache', fallback='')
+    cache = DetectionCache(cache_folder, int(config.getfloat('OFEConfig', 'detectionCacheMegabytes', fallback=2048) * 1024 * 1024)) if cache_folder else None
+    merged, fps, segments, stitched = process(paths, config, options.config, options.detector, options.segment_seconds, options.overlap_seconds, options.workers, cache)
+    tracked = time.perf_counter()
+    events = []
+    starts = [recording_start(path) for path in paths]
+    extractor = extract(merged, config, roads, fps, events.append, folder_name, vehicle_output.extension, starts)
+    extracted = time.perf_counter()
+    frames = sum(len(m) for m in merged.values())
+    print(len(paths), "videos,", frames, "frames in", segments, "segments;", stitched, "tracks stitched across segment boundaries")
+    if cache is not None:
+        print("Detection cache:", cache.metrics())
+    print("segments tracked in", "{0:.1f}".format(tracked - start), "s, extraction", "{0:.2f}".format(extracted - tracked), "s,", len(events), "vehicles")
+
+    if options.verify:
+        reference = []
+        single, _, _, _ = process(paths, config, options.config, options.detector, 0, 0, 1)
+        extract(single, config, roads, fps, reference.append, folder_name, vehicle_output.extension, starts)
+        differences = set(map(event_key, events)) ^ set(map(event_key, reference))
+        print("sequential pass:", len(reference), "vehicles;", "identical" if not differences else "%d vehicle events differ" % len(differences))
+
+    os.mkdir(folder_name)
+    print("Frames will be saved in ", folder_name)
+    for source in range(len(paths)):
+        os.mkdir(folder_name + "/stream_" + str(source))
+    crop_events(paths, events, options.workers)
+    vehicle_output.open(folder_name)
+    for event in events:
+        vehicle_output.submit(event)
+    vehicle_output.close()
+    for state in extractor.sources.values():
+        print(state)
+    vehicle_output.report()
+    print("total", "{0:.1f}".format(time.perf_counter() - start), "s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Benchmark of the per-frame detection processing of the buffer probes: the per-object loop the probes
+# used before (cast, optimal range filter, centre, score and lane chain, track append one object at a time)
+# against the probe's path today: always batched (a DetectionBuffer gather and Extractor.update()), and
+# adaptive, as with the default walkThreshold, below which the probe walks only the vehicles in the lane
+# windows (walk_vehicles) and updates them one at a time (Extractor.update_vehicles). Runs without DeepStream; the
+# object metadata list is emulated with plain Python objects shaped like the pyds ones. Like the pybind11
+# bindings, every rect_params access builds a new wrapper object, which is the main cost the per-object loop
+# pays per attribute read.
+#
+# usage: python3 bench_detections.py [objects per frame ...]
+
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from detections import DetectionBuffer, class_counts, walk_vehicles
+from extractor import Extractor, LANE_NAMES
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from source_state import Road, SourceState
+from track_store import TrackStore
+
+PGIE_CLASS_ID_VEHICLE = 0
+FRAMES = 2000
+WALK_THRESHOLD = 256   # walkThreshold in config.ini
+ROAD = dict(x11=540, x12=840, x13=1110, x14=1410, x21=340, x22=760, x23=1170, x24=1610, y11=0, y22=1080, y1=384, y2=633)
+
+class RectParams:
+    __slots__ = ('left', 'top', 'width', 'height')
+
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+class ObjMeta:
+    __slots__ = ('class_id', 'object_id', 'confidence', '_rect')
+
+    def __init__(self, class_id, object_id, confidence, rect):
+        self.class_id = class_id
+        self.object_id = object_id
+        self.confidence = confidence
+        self._rect = rect
+
+    @property
+    def rect_params(self):
+        return RectParams(*self._rect)     # a fresh wrapper per access, as pyds returns
+
+def make_frames(objects, frames=FRAMES, seed=0):
+    # one emulated obj_meta_list per frame; the same vehicles drift down the frame so tracks grow
+    rng = np.random.default_rng(seed)
+    left = rng.uniform(0, 1800, objects)
+    top = rng.uniform(0, 900, objects)
+    width = rng.uniform(60, 200, objects)
+    height = rng.uniform(40, 160, objects)
+    class_id = rng.choice(4, objects, p=(0.85, 0.05, 0.05, 0.05))
+    lists = []
+    for f in range(frames):
+        node = None
+        for i in reversed(range(objects)):
+            rect = (float(left[i]), float((top[i] + 2 * f) % 1000), float(width[i]), float(height[i]))
+            meta = ObjMeta(int(class_id[i]), i + 1, 0.9, rect)
+            node = SimpleNamespace(data=meta, next=node)
+        lists.append(node)
+    return lists
+
+def cast(data):
+    return data
+
+def per_object(lists):
+    store = TrackStore()
+    midpoint = int((ROAD['y1'] + ROAD['y2']) / 2)
+    x11, x12, x13, x21, x22, x23 = (ROAD[k] for k in ('x11', 'x12', 'x13', 'x21', 'x22', 'x23'))
+    for frame_number, l_obj in enumerate(lists):
+        obj_counter = {0: 0, 1: 0, 2: 0, 3: 0}
+        while l_obj is not None:
+            obj_meta = cast(l_obj.data)
+            if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:
+                if obj_meta.rect_params.top >= ROAD['y1'] and obj_meta.rect_params.top <= ROAD['y2']:
+                    track = store.append(0, obj_meta.object_id, frame_number, obj_meta.rect_params.left, obj_meta.rect_params.top,
+                                         obj_meta.rect_params.width, obj_meta.rect_params.height)
+                    y_center = int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2))
+                    score = -abs(y_center - midpoint)
+                    if score > track.best_score:
+                        x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
+                        if x_center > min(x13, x23):
+                            lane = 3
+                        elif x_center > min(x12, x22):
+                            lane = 2
+                        elif x_center > min(x11, x21):
+                            lane = 1
+                        else:
+                            lane = 0
+                        track.set_best(score, frame_number, obj_meta.rect_params.left, obj_meta.rect_params.top, obj_meta.rect_params.width, obj_meta.rect_params.height, lane)
+            obj_counter[obj_meta.class_id] += 1
+            l_obj = l_obj.next
+    return store
+
+def extracted(lists, batch_threshold):
+    # as ofe.py's probe without a recorder; tracks are not swept, so that every optimal frame can be compared
+    road = Road(**ROAD)
+    extractor = Extractor(TrackLifecycle(), None, LANE_NAMES, batch_threshold=batch_threshold)
+    state = extractor.add_source(SourceState(0, road, LaneMap(road.boundaries(), 1920, 1080, 4, 3), 'bench'))
+    buffer = DetectionBuffer()
+    objects = count_objects(lists[0]) if lists else 0     # frame_meta.num_obj_meta
+    for frame_number, l_obj in enumerate(lists):
+        if objects < WALK_THRESHOLD and not extractor.batched(0):
+            _, vehicles = walk_vehicles(l_obj, cast, PGIE_CLASS_ID_VEHICLE, state.windows.low, state.windows.high)
+            extractor.update_vehicles(state, frame_number, vehicles)
+        else:
+            detections = buffer.gather(l_obj, cast)
+            class_counts(detections)
+            extractor.update(state, frame_number, detections)
+    return extractor.store
+
+def count_objects(l_obj):
+    count = 0
+    while l_obj is not None:
+        count += 1
+        l_obj = l_obj.next
+    return count
+
+def batched(lists):
+    return extracted(lists, 0)
+
+def adaptive(lists):
+    return extracted(lists, Extractor(None, None).batch_threshold)
+
+def best_of(fn, lists, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(lists)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main(args):
+    counts = [int(a) for a in args[1:]] or [4, 16, 64, 256]
+    print('%8s %16s %14s %8s %15s %8s' % ('objects', 'per-object us/f', 'batched us/f', 'speedup', 'adaptive us/f', 'speedup'))
+    for objects in counts:
+        lists = make_frames(objects)
+        expected = sorted((t.vehicle_id, t.best_frame) for t in per_object(lists))
+        for path in (batched, adaptive):
+            assert sorted((t.vehicle_id, t.best_frame) for t in path(lists)) == expected    # same optimal frames
+        loop_seconds = best_of(per_object, lists)
+        batch_seconds = best_of(batched, lists)
+        adaptive_seconds = best_of(adaptive, lists)
+        print('%8d %16.1f %14.1f %7.2fx %15.1f %7.2fx' % (objects, 1e6 * loop_seconds / FRAMES, 1e6 * batch_seconds / FRAMES, loop_seconds / batch_seconds,
+                                                      1e6 * adaptive_seconds / FRAMES, loop_seconds / adaptive_seconds))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Benchmark suite of the tracking and optimal frame extraction logic. Every scenario drives the Extractor
+# with synthetic traffic (see synthetic_traffic.py) and reports frames per second, per-frame latency
+# percentiles, peak traced memory and finalized vehicles against the vehicles generated. Results are saved
+# as JSON and can be compared with the results of another version.
+#
+# usage: python3 bench_extraction.py [--frames 9000] [--scenario NAME ...] [--output FILE] [--compare FILE]
+
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+
+from extractor import Extractor, LANE_NAMES
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+SCENARIOS = {   # name: (streams, traffic generator settings)
+    'light': (1, dict(rate=0.2)),
+    'heavy': (1, dict(rate=1.5, speed=6.0)),
+    'occluded': (1, dict(rate=0.8, occlusion=0.05, occlusion_frames=15)),
+    'id-switch': (1, dict(rate=0.8, id_switch=0.02)),
+    'multistream': (8, dict(rate=0.8)),
+}
+
+def generate(streams, frames, traffic, seed=0):
+    # pre-generated frames, so that only the extraction logic is timed; [(stream, frame number, detections)]
+    generators = [TrafficGenerator(DEFAULT_ROAD, seed=seed + s, **traffic) for s in range(streams)]
+    batches = [(s, f, g.frame()) for f in range(frames) for s, g in enumerate(generators)]
+    return batches, sum(g.arrived for g in generators)
+
+def drive(batches, streams):
+    # run the batches through a fresh Extractor; returns (per-frame seconds, finalized vehicles)
+    events = []
+    extractor = Extractor(TrackLifecycle(), events.append, LANE_NAMES)
+    lanes = LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1)
+    states = [extractor.add_source(SourceState(s, DEFAULT_ROAD, lanes, 'bench/stream_' + str(s))) for s in range(streams)]
+    seconds = np.empty(len(batches), dtype=np.float64)
+    for i, (stream, frame_number, detections) in enumerate(batches):
+        start = time.perf_counter()
+        extractor.update(states[stream], frame_number, detections)
+        extractor.sweep(states[stream], frame_number, frame_number / 30)
+        seconds[i] = time.perf_counter() - start
+    extractor.drain(len(batches) / 30)
+    return seconds, len(events)
+
+def run(name, frames, seed=0):
+    streams, traffic = SCENARIOS[name]
+    batches, generated = generate(streams, frames, traffic, seed)
+    detections = sum(len(d) for _, _, d in batches)
+    seconds, finalized = drive(batches, streams)
+    tracemalloc.start()     # separate pass; tracing slows the run down
+    drive(batches, streams)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(seconds, (50, 95, 99)) * 1e6
+    return {'streams': streams, 'frames': len(batches), 'detections': detections, 'fps': round(len(batches) / seconds.sum(), 1),
+            'p50_us': round(float(p50), 2), 'p95_us': round(float(p95), 2), 'p99_us': round(float(p99), 2),
+            'peak_mb': round(peak / (1024 * 1024), 2), 'generated': generated, 'finalized': finalized}
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main(args):
+    parser = ArgumentParser(description='Benchmark the optimal frame extraction logic on synthetic traffic.')
+    parser.add_argument('--frames', type=int, default=9000, help='frames per stream')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these scenarios')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file; bench_extraction_<revision>.json if omitted')
+    parser.add_argument('--compare', help='results file of another version to compare against')
+    options = parser.parse_args(args[1:])
+
+    results = {'revision': revision(), 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+               'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'frames': options.frames, 'seed': options.seed, 'scenarios': {}}
+    baseline = None
+    if options.compare:
+        with open(options.compare) as compare_file:
+            baseline = json.load(compare_file)['scenarios']
+    print('%-12s %8s %10s %9s %9s %9s %8s %10s %10s' % ('scenario', 'frames', 'fps', 'p50 us', 'p95 us', 'p99 us', 'peak MB', 'finalized', 'generated'))
+    for name in options.scenario or SCENARIOS:
+        r = run(name, options.frames, options.seed)
+        results['scenarios'][name] = r
+        line = '%-12s %8d %10.1f %9.2f %9.2f %9.2f %8.2f %10d %10d' % (name, r['frames'], r['fps'], r['p50_us'], r['p95_us'], r['p99_us'], r['peak_mb'], r['finalized'], r['generated'])
+        if baseline and name in baseline:
+            line += '   fps %+.1f%%, p99 %+.1f%%' % (100 * (r['fps'] / baseline[name]['fps'] - 1), 100 * (r['p99_us'] / baseline[name]['p99_us'] - 1))
+        print(line)
+    output = options.output or 'bench_extraction_%s.json' % results['revision']
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print('results saved to', output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
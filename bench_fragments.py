@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Benchmark of track fragment re-association (fragments.py) against the ground truth of synthetic traffic
+# (synthetic_traffic.py), whose tracker switches vehicles to new ids and loses them behind occlusions. The
+# same traffic runs through an Extractor with and without the linker; every finalized event is mapped back
+# to the vehicle it shows, and each setting is scored on
+#   duplicates - events beyond the first of a vehicle, per finalized vehicle,
+#   missed     - vehicles that crossed the optimal range without any event,
+#   false      - merges of two different vehicles,
+# together with the merges made and the extraction time per frame.
+#
+# usage: python3 bench_fragments.py [--frames 9000] [--rate 0.8] [--id-switch 0.002 0.01 0.02] [--seed 0]
+
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from extractor import Extractor, LANE_NAMES
+from fragments import FragmentLinker
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+def traffic(frames, rate, id_switch, seed):
+    # [(frame number, detections)] and the ground truth vehicle of every tracking id
+    generator = TrafficGenerator(rate=rate, id_switch=id_switch, seed=seed)
+    batches, vehicle_of = [], {}
+    for frame_number in range(frames):
+        batches.append((frame_number, generator.frame()))
+        vehicle_of.update(zip(generator.vehicles['object_id'].tolist(), generator.vehicles['vehicle'].tolist()))
+    return batches, vehicle_of
+
+########## Logging Extractor Class ##########     # Extractor that keeps (track id, fragment id) of every merge
+
+class LoggingExtractor(Extractor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.merges = []
+
+    def merge(self, state, fragment, track):
+        self.merges.append((track.vehicle_id, fragment.vehicle_id))
+        super().merge(state, fragment, track)
+
+########## Logging Extractor Class ##########
+
+def run(batches, vehicle_of, linker):
+    events = []
+    extractor = LoggingExtractor(TrackLifecycle(), events.append, LANE_NAMES, linker=linker)
+    state = extractor.add_source(SourceState(0, DEFAULT_ROAD, LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1), 'bench'))
+    in_window = set()   # ground truth vehicles with a detection in the optimal range
+    start = time.perf_counter()
+    for frame_number, detections in batches:
+        extractor.update(state, frame_number, detections)
+        extractor.sweep(state, frame_number, 0.0)
+    extractor.drain(0.0)
+    elapsed = time.perf_counter() - start
+    for _, detections in batches:
+        vehicles = detections[(detections['class_id'] == 0) & (detections['top'] >= DEFAULT_ROAD.y1) & (detections['top'] <= DEFAULT_ROAD.y2)]
+        in_window.update(vehicle_of[object_id] for object_id in vehicles['object_id'].tolist())
+    shown = [vehicle_of[e['vehicle_id']] for e in events]
+    counts = np.bincount(shown) if shown else np.zeros(0, dtype=np.int64)
+    false = sum(vehicle_of[track_id] != vehicle_of[fragment_id] for track_id, fragment_id in extractor.merges)
+    return len(events), int(np.maximum(counts - 1, 0).sum()), len(in_window - set(shown)), state.merged_count, false, 1e6 * elapsed / len(batches)
+
+def main(args):
+    parser = ArgumentParser(description='Score track fragment re-association against synthetic ground truth.')
+    parser.add_argument('--frames', type=int, default=9000)
+    parser.add_argument('--rate', type=float, default=0.8, help='arrivals per second and lane')
+    parser.add_argument('--id-switch', type=float, nargs='+', default=[0.002, 0.01, 0.02], help='chances per vehicle and frame of a tracker id switch')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(args[1:])
+
+    print('%9s %-8s %7s %11s %7s %7s %6s %9s' % ('id switch', 'linker', 'events', 'duplicates', 'missed', 'merges', 'false', 'us/frame'))
+    for id_switch in options.id_switch:
+        batches, vehicle_of = traffic(options.frames, options.rate, id_switch, options.seed)
+        for name, linker in (('off', None), ('on', FragmentLinker())):
+            events, duplicates, missed, merges, false, us = run(batches, vehicle_of, linker)
+            print('%9.3f %-8s %7d %5d %4.1f%% %7d %7d %6d %9.1f' % (id_switch, name, events, duplicates, 100 * duplicates / max(events - duplicates, 1), missed, merges, false, us))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
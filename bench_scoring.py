@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Benchmark of the optimal frame scorers (frame_scoring.py). Synthetic traffic (synthetic_traffic.py) runs
+# through an Extractor once per scorer setting, over a textured stand-in frame so that the sharpness term has
+# pixels to work on; the scorer call is timed per frame and reported per scored candidate, together with
+# what the chosen optimal frames look like (area, truncated at the frame border, distance from the midpoint).
+# The sharpness term is also timed on its own, per crop size.
+#
+# usage: python3 bench_scoring.py [--frames 3000] [--rate 1.0] [--seed 0]
+
+import sys
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from extractor import Extractor, LANE_NAMES
+from frame_scoring import MidpointScorer, QualityScorer, sharpness
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+SETTINGS = {    # name: scorer factory, and whether the frame is passed in
+    'midpoint': (MidpointScorer, False),
+    'quality (geometric)': (lambda: QualityScorer(sharpness=0), False),
+    'quality': (QualityScorer, True),
+}
+
+########## Timed Scorer Class ##########     # described by the wrapped scorer and its time and candidate counters
+
+class TimedScorer:
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.needs_frame = scorer.needs_frame
+        self.seconds = 0.0
+        self.candidates = 0
+
+    def scores(self, windows, vehicles, y_center, lanes, tracks, frame=None):
+        start = time.perf_counter()
+        scores = self.scorer.scores(windows, vehicles, y_center, lanes, tracks, frame)
+        self.seconds += time.perf_counter() - start
+        self.candidates += len(scores)
+        return scores
+
+########## Timed Scorer Class ##########
+
+def texture(width=1920, height=1080, seed=0):
+    # stand-in frame; smoothed noise, so that crops have a finite, varying Laplacian variance
+    noise = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 1.5)
+
+def run(name, frames, rate, seed):
+    factory, with_frame = SETTINGS[name]
+    scorer = TimedScorer(factory())
+    events = []
+    extractor = Extractor(TrackLifecycle(), events.append, LANE_NAMES, scorer=scorer)
+    state = extractor.add_source(SourceState(0, DEFAULT_ROAD, LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1), 'bench'))
+    traffic = TrafficGenerator(rate=rate, seed=seed)
+    image = texture(seed=seed) if with_frame else None
+    for frame_number in range(frames):
+        extractor.update(state, frame_number, traffic.frame(), image)
+        extractor.sweep(state, frame_number, 0.0)
+    extractor.drain(0.0)
+    area = np.array([e['width'] * e['height'] for e in events], dtype=np.float64)
+    truncated = np.array([e['x'] <= 2 or e['y'] <= 2 or e['x'] + e['width'] >= 1918 or e['y'] + e['height'] >= 1078 for e in events])
+    offset = np.array([abs(e['y'] + e['height'] / 2 - DEFAULT_ROAD.midpoint) for e in events], dtype=np.float64)
+    sharpened = getattr(scorer.scorer, 'sharpened', 0)
+    return (name, scorer.candidates, 1e6 * scorer.seconds / max(scorer.candidates, 1), 1e6 * scorer.seconds / frames, sharpened,
+            len(events), area.mean() if len(area) else 0, truncated.mean() if len(truncated) else 0, offset.mean() if len(offset) else 0)
+
+def main(args):
+    parser = ArgumentParser(description='Time the optimal frame scorers per candidate.')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--rate', type=float, default=1.0, help='vehicles entering per frame')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(args[1:])
+
+    print('%-20s %10s %10s %10s %10s %8s %10s %9s %8s' % ('scorer', 'candidates', 'us/cand', 'us/frame', 'sharpened', 'events', 'area px', 'truncated', 'offset'))
+    for name in SETTINGS:
+        print('%-20s %10d %10.2f %10.1f %10d %8d %10.0f %9.3f %8.1f' % run(name, options.frames, options.rate, options.seed))
+
+    image = texture(seed=options.seed)
+    print('\n%-12s %12s' % ('crop', 'us/sharpness'))
+    for size in (48, 96, 192, 384):
+        repeats = 2000
+        start = time.perf_counter()
+        for i in range(repeats):
+            sharpness(image, (i * 7) % (1920 - size), (i * 5) % (1080 - size), size * 1.3, size)
+        print('%-12s %12.1f' % ('%dx%d' % (int(size * 1.3), size), 1e6 * (time.perf_counter() - start) / repeats))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
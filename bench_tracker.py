@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Benchmark of the IoU tracker (iou_tracker.py) at crowded-scene load. Ground truth boxes drive across the
+# frame at their own velocity; detections jitter and drop out, and boxes leaving the frame are replaced.
+# Every tracker setting is timed per frame and scored by identity switches against the ground truth.
+#
+# usage: python3 bench_tracker.py [--objects 100] [--frames 3000] [--fps 30]
+
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from iou_tracker import IouTracker
+
+SETTINGS = {    # name: IouTracker settings
+    'greedy': dict(association='greedy'),
+    'greedy+cv': dict(association='greedy', predict=True),
+    'hungarian': dict(association='hungarian'),
+    'hungarian+cv': dict(association='hungarian', predict=True),
+}
+
+def scene(objects, frames, miss=0.05, jitter=2.0, width=1920, height=1080, seed=0):
+    # [(ground truth ids, boxes)] per frame
+    rng = np.random.default_rng(seed)
+
+    def spawn(k):
+        size = rng.uniform(40, 160, (k, 1)) * np.array([1.3, 1.0])
+        position = rng.uniform((0, 0), (width, height), (k, 2)) - size / 2
+        return np.hstack((position, size)), rng.uniform(-12, 12, (k, 2))
+
+    boxes, velocity = spawn(objects)
+    gt = np.arange(objects)
+    next_gt = objects
+    out = []
+    for _ in range(frames):
+        boxes[:, :2] += velocity
+        gone = (boxes[:, 0] + boxes[:, 2] < 0) | (boxes[:, 0] > width) | (boxes[:, 1] + boxes[:, 3] < 0) | (boxes[:, 1] > height)
+        k = int(gone.sum())
+        if k:
+            boxes[gone], velocity[gone] = spawn(k)
+            gt[gone] = np.arange(next_gt, next_gt + k)
+            next_gt += k
+        seen = rng.random(objects) >= miss
+        noisy = boxes[seen] + rng.normal(0, jitter, (int(seen.sum()), 4))
+        noisy[:, 2:] = np.maximum(noisy[:, 2:], 4)
+        out.append((gt[seen].copy(), noisy))
+    return out
+
+def run(frames, settings):
+    tracker = IouTracker(**settings)
+    seconds = np.empty(len(frames), dtype=np.float64)
+    track_of = {}   # ground truth id: last tracking id
+    switches = 0
+    for i, (gt, boxes) in enumerate(frames):
+        start = time.perf_counter()
+        detections = tracker.update(boxes)
+        seconds[i] = time.perf_counter() - start
+        # records are in box order, less the boxes of tentative tracks; map them back by position
+        index = np.nonzero(np.isin(boxes[:, 0].astype(np.float32), detections['left']))[0]
+        for g, object_id in zip(gt[index].tolist(), detections['object_id'].tolist()):
+            if track_of.get(g, object_id) != object_id:
+                switches += 1
+            track_of[g] = object_id
+    return seconds, switches, len(track_of)
+
+def main(args):
+    parser = ArgumentParser(description='Benchmark the IoU tracker settings.')
+    parser.add_argument('--objects', type=int, default=100, help='objects per frame')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--fps', type=float, default=30, help='frame rate to keep up with')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(args[1:])
+
+    frames = scene(options.objects, options.frames, seed=options.seed)
+    print('%d objects per frame, %d frames; budget %.2f ms per frame' % (options.objects, options.frames, 1000 / options.fps))
+    print('%-14s %10s %9s %9s %9s %9s %9s' % ('setting', 'fps', 'mean ms', 'p50 ms', 'p99 ms', 'objects', 'switches'))
+    for name, settings in SETTINGS.items():
+        seconds, switches, objects = run(frames, settings)
+        p50, p99 = np.percentile(seconds, (50, 99)) * 1000
+        print('%-14s %10.1f %9.3f %9.3f %9.3f %9d %9d' % (name, len(seconds) / seconds.sum(), seconds.mean() * 1000, p50, p99, objects, switches))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Streaming calibration of the optimal range [y1, y2] of a camera, for orc.py. Instead of keeping the full y
+# history of every track until a fixed frame, each track only keeps its entry (smallest) and exit (largest)
+# top while it is live; when it retires, those go into P² quantile sketches of constant size. The estimate is
+#   y1 = exit quantile (low) of the track exit tops - margin,   y2 = entry quantile (high) of the track entry tops,
+# the streaming, outlier-robust form of orc.py's min(y_max) - 100 and max(y_min). Calibration has converged
+# once enough tracks were seen and the estimate stayed within a tolerance over a run of retired tracks.
+# Every retired track also leaves the sums of a least-squares line x = a + b * y through its centres, and
+# fit_lanes() clusters those lines into lanes and fits the right edge of every lane, for a complete road configuration.
+
+import collections
+
+import numpy as np
+import requests
+
+from source_state import Road
+
+########## P² Quantile Class ##########     # described by the quantile, the five marker heights and their actual and desired positions
+
+class P2Quantile:
+    # P² algorithm (Jain and Chlamtac, 1985); one quantile of a stream in constant memory
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.q = []     # marker heights
+        self.n = [0, 1, 2, 3, 4]    # marker positions
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increment = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.count += 1
+        q, n = self.q, self.n
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increment[i]
+        for i in (1, 2, 3):     # adjust the middle markers
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                              (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if not self.count:
+            return None
+        if self.count <= 5:     # exact, from the few samples kept
+            return self.q[min(int(self.p * self.count), self.count - 1)]
+        return self.q[2]
+
+########## P² Quantile Class ##########
+
+########## Calibrator Class ##########     # described by the live tracks of one source, the entry and exit sketches and the convergence state
+
+class Calibrator:
+    def __init__(self, min_frames=10, entry_quantile=0.95, exit_quantile=0.05, margin=100, tolerance=4, stable_tracks=50, min_tracks=100, retire_after=20,
+                 line_tracks=5000):
+        self.min_frames = min_frames    # tracks with fewer detections are ignored as false tracking instances
+        self.entry = P2Quantile(entry_quantile)     # of the smallest top of every track
+        self.exit = P2Quantile(exit_quantile)       # of the largest top of every track
+        self.margin = margin    # pixels y1 is kept above the exit quantile
+        self.tolerance = tolerance      # pixels the estimate may move and still count as stable
+        self.stable_tracks = stable_tracks  # retired tracks the estimate has to stay stable for
+        self.min_tracks = min_tracks    # least tracks before calibration can converge
+        self.retire_after = retire_after    # frames without a detection before a track is retired
+        self.tracks = 0     # tracks fed into the sketches
+        self.stable = 0     # tracks since the estimate last moved by more than the tolerance
+        self._anchor = None
+        self._live = {}     # object_id: [last frame, detections, smallest top, largest top, sum y, sum x, sum y*y, sum x*y, sum width, smallest y, largest y] of the centres
+        self.lines = collections.deque(maxlen=line_tracks)     # (sum y, sum x, sum y*y, sum x*y, detections, sum width, smallest y, largest y) of the latest retired tracks
+
+    def update(self, frame_number, object_ids, tops, x_centers, y_centers, widths):
+        for object_id, top, x, y, width in zip(object_ids, tops, x_centers, y_centers, widths):
+            track = self._live.get(object_id)
+            if track is None:
+                self._live[object_id] = [frame_number, 1, top, top, y, x, y * y, x * y, width, y, y]
+            else:
+                track[0] = frame_number
+                track[1] += 1
+                if top < track[2]:
+                    track[2] = top
+                elif top > track[3]:
+                    track[3] = top
+                track[4] += y
+                track[5] += x
+                track[6] += y * y
+                track[7] += x * y
+                track[8] += width
+                if y < track[9]:
+                    track[9] = y
+                elif y > track[10]:
+                    track[10] = y
+
+    def sweep(self, frame_number):
+        # retire the tracks not seen for retire_after frames; returns True once calibration has converged
+        limit = frame_number - self.retire_after
+        stale = [object_id for object_id, track in self._live.items() if track[0] < limit]
+        for object_id in stale:
+            self._retire(self._live.pop(object_id))
+        return self.converged
+
+    def flush(self):
+        # end of stream; every live track is retired
+        for track in self._live.values():
+            self._retire(track)
+        self._live.clear()
+
+    def _retire(self, track):
+        if track[1] < self.min_frames:
+            return
+        self.entry.add(track[2])
+        self.exit.add(track[3])
+        self.lines.append((track[4], track[5], track[6], track[7], track[1], track[8], track[9], track[10]))
+        self.tracks += 1
+        estimate = self.estimate
+        if self._anchor is not None and max(abs(estimate[0] - self._anchor[0]), abs(estimate[1] - self._anchor[1])) <= self.tolerance:
+            self.stable += 1
+        else:
+            self._anchor = estimate
+            self.stable = 0
+
+    @property
+    def estimate(self):
+        # (y1, y2), or None before the first track
+        if not self.tracks:
+            return None
+        return int(self.exit.value() - self.margin), int(self.entry.value())
+
+    @property
+    def converged(self):
+        return self.tracks >= self.min_tracks and self.stable >= self.stable_tracks
+
+    def __repr__(self):
+        return 'Calibrator(tracks=%d, live=%d, stable=%d, estimate=%s)' % (self.tracks, len(self._live), self.stable, self.estimate)
+
+########## Calibrator Class ##########
+
+def fit_lanes(lines, max_lanes=4, bin_px=4, peak_fraction=0.15, iterations=20):
+    # lanes from retired track lines, in one vectorized pass; returns ([(x at y_top, x at y_bottom)] of the right
+    # edge of every lane from the leftmost, y_top, y_bottom), or None without enough moving tracks. This is the
+    # road schema's convention: x11 is the right edge of lane 0, and left of it is lane 0. Every track line is
+    # normalised to its x at a reference height; the lane count is the number of well separated peaks of the
+    # histogram of those (at most max_lanes), refined by 1-D k-means, and a lane edge runs halfway between the
+    # median lines of two adjacent lanes. The right edge of the last lane mirrors the edge before it, or lies a
+    # vehicle width from the lane centre with a single lane.
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 8)
+    sy, sx, syy, sxy, n, sw, y_min, y_max = lines.T
+    spread = n * syy - sy * sy
+    moving = spread > n * n     # tracks whose centres moved down the frame at all
+    if moving.sum() < 2 * max_lanes:
+        return None
+    sy, sx, syy, sxy, n, sw, y_min, y_max, spread = (v[moving] for v in (sy, sx, syy, sxy, n, sw, y_min, y_max, spread))
+    b = (n * sxy - sy * sx) / spread    # x = a + b * y of every track
+    a = (sx - b * sy) / n
+    width = np.median(sw / n)   # vehicle width
+    y_top, y_bottom = np.percentile(y_min, 5), np.percentile(y_max, 95)
+    u = a + b * (y_top + y_bottom) / 2  # x normalised to the reference height
+
+    edges = np.arange(u.min() - width, u.max() + width + bin_px, bin_px)
+    histogram, _ = np.histogram(u, edges)
+    sigma = max(width / 4, bin_px) / bin_px
+    kernel = np.exp(-0.5 * (np.arange(-3 * sigma, 3 * sigma + 1) / sigma) ** 2)
+    smooth = np.convolve(histogram, kernel / kernel.sum(), mode='same')
+    peaks = np.flatnonzero((smooth[1:-1] > smooth[:-2]) & (smooth[1:-1] >= smooth[2:]) & (smooth[1:-1] >= peak_fraction * smooth.max())) + 1
+    centers = []
+    for p in peaks[np.argsort(-smooth[peaks])]:     # strongest first; lanes are at least most of a vehicle width apart
+        x = (edges[p] + edges[p + 1]) / 2
+        if len(centers) < max_lanes and all(abs(x - c) >= 0.8 * width for c in centers):
+            centers.append(x)
+    centers = np.sort(np.array(centers))
+    for _ in range(iterations):     # 1-D k-means from the histogram peaks
+        label = np.argmin(np.abs(u[:, None] - centers[None, :]), axis=1)
+        updated = np.array([u[label == k].mean() if (label == k).any() else centers[k] for k in range(len(centers))])
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    label = np.argmin(np.abs(u[:, None] - centers[None, :]), axis=1)
+    lanes = np.array([(np.median(a[label == k] + b[label == k] * y_top), np.median(a[label == k] + b[label == k] * y_bottom)) for k in range(len(centers))])
+    if len(lanes) == 1:
+        inner = np.zeros((0, 2))
+        right = lanes[0] + width
+    else:
+        inner = (lanes[:-1] + lanes[1:]) / 2
+        right = 2 * lanes[-1] - inner[-1]
+    edges = np.vstack((inner, right))
+    return [(int(round(top)), int(round(bottom))) for top, bottom in edges], int(y_top), int(y_bottom)
+
+def road_from_lanes(edges, y_top, y_bottom, y1, y2, width=1920):
+    # complete road configuration from the right lane edges of fit_lanes(); a road has four lanes, so with fewer
+    # the missing edges lie at the right border of the frame (the extra lanes have no width on screen)
+    edges = (list(edges) + [(width, width)] * 4)[:4]
+    return Road(*[top for top, _ in edges], *[bottom for _, bottom in edges], y_top, y_bottom, y1, y2)
+
+def publish_road(base, road_id, road):
+    # a complete road configuration to /road/<road_id>; created if the camera has none yet
+    record = {k: str(v) for k, v in road._asdict().items()}
+    if requests.get(base + "road/" + str(road_id)).status_code == 200:
+        return requests.patch(base + "road/" + str(road_id), record)
+    return requests.put(base + "road/" + str(road_id), record)
+
+def publish_window(base, road_id, y1, y2, fallback=None):
+    # write y1 and y2 to /road/<road_id>; the API takes complete records, so the other values come from the
+    # server's record, or from the fallback Road when the camera has none yet (then it is created)
+    response = requests.get(base + "road/" + str(road_id))
+    if response.status_code == 200:
+        road = Road.from_json(response.json())._replace(y1=y1, y2=y2)
+        response = requests.patch(base + "road/" + str(road_id), {k: str(v) for k, v in road._asdict().items()})
+    elif fallback is not None:
+        response = publish_road(base, road_id, fallback._replace(y1=y1, y2=y2))
+    return response
+
+def publish_lane_window(base, road_id, lane, y1, y2, midpoint):
+    # optimal range and midpoint of one lane to /road/<road_id>/lane/<lane>; created if the lane has none yet
+    url = base + "road/" + str(road_id) + "/lane/" + str(lane)
+    record = {'y1': str(y1), 'y2': str(y2), 'midpoint': str(midpoint)}
+    if requests.get(url).status_code == 200:
+        return requests.patch(url, record)
+    return requests.put(url, record)
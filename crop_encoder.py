@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Parallel crop encoder for the optimal frame extractor. Vehicle crops are encoded with cv2.imencode on a
+# thread pool (OpenCV releases the GIL while encoding) in JPEG, WebP or PNG, optionally downscaled first.
+# The encoded bytes are handed to every registered consumer (crop files, ALPR, HTTP upload, ...) so that
+# nothing has to read the crop back from disk.
+
+import collections
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+FORMATS = {     # format name: (file extension, quality parameter)
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION),
+}
+
+########## Crop Encoder Class ##########     # described by the encoding format and quality, the downscaling limit and the encoder thread pool
+
+class CropEncoder:
+    def __init__(self, workers=2, fmt='jpg', quality=90, max_width=0):
+        if fmt not in FORMATS:
+            raise ValueError("unknown crop format %r; expected one of %s" % (fmt, ', '.join(FORMATS)))
+        self.fmt = fmt
+        self.extension, quality_flag = FORMATS[fmt]
+        self.params = [quality_flag, int(quality)]     # JPEG/WebP quality 0-100, PNG compression level 0-9
+        self.max_width = max_width      # crops wider than this are downscaled before encoding; 0 keeps the original size
+        self.consumers = []     # callables taking (event, encoded bytes)
+        self.fallbacks = []     # consumers also called, with None for the bytes, when a crop cannot be encoded
+        self.stats = collections.Counter()      # crops, bytes, errors
+        self.encode_seconds = collections.deque(maxlen=1024)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crop-encoder')
+
+    def add_consumer(self, consumer, fallback=False):
+        # fallback consumers still get the event of a crop that failed to encode, e.g. the database record
+        self.consumers.append(consumer)
+        if fallback:
+            self.fallbacks.append(consumer)
+
+    def encode(self, crop):
+        # encode one crop synchronously; returns the encoded bytes
+        if self.max_width and crop.shape[1] > self.max_width:
+            height = max(1, int(round(crop.shape[0] * self.max_width / crop.shape[1])))
+            crop = cv2.resize(crop, (self.max_width, height), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(self.extension, crop, self.params)
+        if not ok:
+            raise RuntimeError("cv2.imencode failed for a %s crop" % self.fmt)
+        return encoded.tobytes()
+
+    def submit(self, event):
+        # encode event['crop'] on the pool and hand the bytes to the consumers; returns a future
+        return self._pool.submit(self._encode_event, event)
+
+    def _encode_event(self, event):
+        start = time.perf_counter()
+        try:
+            data = self.encode(event['crop'])
+        except Exception as e:
+            with self._lock:
+                self.stats['errors'] += 1
+            sys.stderr.write("Unable to encode crop of vehicle %s: %s\n" % (event.get('vehicle_id'), e))
+            self._consume(self.fallbacks, event, None)     # the vehicle is still recorded, as one whose crop is no longer buffered
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats['crops'] += 1
+            self.stats['bytes'] += len(data)
+            self.encode_seconds.append(elapsed)
+        event['encode_ms'] = elapsed * 1000
+        event['encoded_bytes'] = len(data)
+        self._consume(self.consumers, event, data)
+        return data
+
+    def _consume(self, consumers, event, data):
+        for consumer in consumers:
+            try:
+                consumer(event, data)
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                sys.stderr.write("Crop consumer %s failed: %s\n" % (getattr(consumer, '__name__', consumer), e))
+
+    def metrics(self):
+        # crops and bytes written, plus mean and worst encode time in milliseconds
+        with self._lock:
+            result = dict(self.stats)
+            samples = list(self.encode_seconds)
+        if samples:
+            result['encode_ms_mean'] = round(1000 * sum(samples) / len(samples), 3)
+            result['encode_ms_max'] = round(1000 * max(samples), 3)
+        if result.get('crops'):
+            result['bytes_per_crop'] = result['bytes'] // result['crops']
+        return result
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+########## Crop Encoder Class ##########
+
+def write_crop_file(event, data):
+    # crop consumer; writes the encoded crop to event['image_path']
+    with open(event['image_path'], 'wb') as crop_file:
+        crop_file.write(data)
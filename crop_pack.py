@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Append-only crop pack storage for the optimal frame extractor. Instead of one small image file per
+# vehicle, encoded crops are appended to a pack file per stream that rotates every hour (or day), and a
+# fixed-size index record maps (stream, tracking id, frame number) to the offset and length of the crop.
+# A crop is addressed by a 'pack:<pack path>:<offset>:<length>' locator, which is what goes into the
+# image_path column of the vehicle database.
+#
+# usage: python3 crop_pack.py list <pack file>
+#        python3 crop_pack.py export <pack file> <folder>
+
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([('stream', '<u2'), ('track', '<u8'), ('frame', '<u8'), ('offset', '<u8'), ('length', '<u4')])
+ROTATIONS = {'hourly': '%Y%m%d%H', 'daily': '%Y%m%d'}
+
+def make_locator(pack_path, offset, length):
+    return 'pack:%s:%d:%d' % (pack_path, offset, length)
+
+def parse_locator(locator):
+    # 'pack:<pack path>:<offset>:<length>' -> (pack path, offset, length)
+    if not locator.startswith('pack:'):
+        raise ValueError("not a crop pack locator: %r" % locator)
+    pack_path, offset, length = locator[5:].rsplit(':', 2)
+    return pack_path, int(offset), int(length)
+
+def read_locator(locator):
+    pack_path, offset, length = parse_locator(locator)
+    with open(pack_path, 'rb') as pack_file:
+        pack_file.seek(offset)
+        return pack_file.read(length)
+
+def image_extension(data):
+    # file extension of an encoded crop, from its magic bytes
+    if data[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return '.bin'
+
+########## Pack Writer Class ##########     # described by the output folder, the rotation period and the open pack and index file of each stream
+
+class PackWriter:
+    def __init__(self, folder, rotation='hourly'):
+        if rotation not in ROTATIONS:
+            raise ValueError("unknown pack rotation %r; expected one of %s" % (rotation, ', '.join(ROTATIONS)))
+        self.folder = folder
+        self.rotation = rotation
+        self._lock = threading.Lock()   # crops arrive from several encoder threads
+        self._open = {}     # stream: (period, pack path, pack file, index file)
+
+    def _files(self, stream):
+        period = time.strftime(ROTATIONS[self.rotation])
+        current = self._open.get(stream)
+        if current is not None and current[0] == period:
+            return current
+        if current is not None:     # period is over; rotate
+            current[2].close()
+            current[3].close()
+        stream_folder = os.path.join(self.folder, 'stream_' + str(stream))
+        os.makedirs(stream_folder, exist_ok=True)
+        pack_path = os.path.join(stream_folder, period + '.pack')
+        current = (period, pack_path, open(pack_path, 'ab'), open(pack_path[:-5] + '.idx', 'ab'))
+        self._open[stream] = current
+        return current
+
+    def append(self, stream, track, frame, data):
+        # append one encoded crop; returns its locator
+        with self._lock:
+            _, pack_path, pack_file, index_file = self._files(stream)
+            offset = pack_file.seek(0, os.SEEK_END)
+            pack_file.write(data)
+            pack_file.flush()
+            record = np.array([(stream, track, frame, offset, len(data))], dtype=INDEX_DTYPE)
+            index_file.write(record.tobytes())
+            index_file.flush()
+        return make_locator(pack_path, offset, len(data))
+
+    def close(self):
+        with self._lock:
+            for _, _, pack_file, index_file in self._open.values():
+                pack_file.close()
+                index_file.close()
+            self._open.clear()
+
+########## Pack Writer Class ##########
+
+########## Pack Reader Class ##########     # described by the pack file and its index records
+
+class PackReader:
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.index = np.fromfile(pack_path[:-5] + '.idx', dtype=INDEX_DTYPE)
+        self._lookup = {(int(r['stream']), int(r['track']), int(r['frame'])): i for i, r in enumerate(self.index)}
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, offset, length):
+        with open(self.pack_path, 'rb') as pack_file:
+            pack_file.seek(offset)
+            return pack_file.read(length)
+
+    def get(self, stream, track, frame):
+        i = self._lookup.get((stream, track, frame))
+        if i is None:
+            return None
+        return self.read(int(self.index[i]['offset']), int(self.index[i]['length']))
+
+    def __iter__(self):
+        # (stream, tracking id, frame number, encoded crop) in the order they were written
+        with open(self.pack_path, 'rb') as pack_file:
+            for r in self.index:
+                pack_file.seek(int(r['offset']))
+                yield int(r['stream']), int(r['track']), int(r['frame']), pack_file.read(int(r['length']))
+
+########## Pack Reader Class ##########
+
+def export_pack(pack_path, folder):
+    # unpack every crop of a pack into one file per crop; returns the number of files written
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    for stream, track, frame, data in PackReader(pack_path):
+        name = 'stream_%d_frno_trid=%d_%d%s' % (stream, frame, track, image_extension(data))
+        with open(os.path.join(folder, name), 'wb') as crop_file:
+            crop_file.write(data)
+        count += 1
+    return count
+
+def main(args):
+    parser = ArgumentParser(description='List or export the crops of a crop pack file.')
+    commands = parser.add_subparsers(dest='command')
+    list_parser = commands.add_parser('list', help='list the index of a pack')
+    list_parser.add_argument('pack')
+    export_parser = commands.add_parser('export', help='write every crop of a pack to a folder')
+    export_parser.add_argument('pack')
+    export_parser.add_argument('folder')
+    options = parser.parse_args(args[1:])
+    if options.command == 'list':
+        reader = PackReader(options.pack)
+        print('stream track frame offset length')
+        for r in reader.index:
+            print(r['stream'], r['track'], r['frame'], r['offset'], r['length'])
+        print(len(reader), 'crops')
+    elif options.command == 'export':
+        print(export_pack(options.pack, options.folder), 'crops exported to', options.folder)
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
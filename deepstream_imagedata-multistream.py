@@ -37,6 +37,7 @@ import platform
 from common.is_aarch_64 import is_aarch64
 from common.bus_call import bus_call
 from common.FPS import GETFPS
+from track_store import TrackStore
 import numpy as np
 import pyds
 import cv2
@@ -83,26 +84,11 @@ x24 = par[7]     # rightmost 'vertical' segment bottom
 y1 = par[8]    # optimal range filter start 
 y2 = par[9]    # optimal range filter end 
 
-vehicle_list = []
+vehicle_store = TrackStore()
 rgb_frames_list = []
 vehicle_count = 0
+LANE_NAMES = ('fast', 'medium', 'slow', 'shoulder')
 
-########## Vehicle Class ##########
-
-class Vehicle:
-    def __init__(self, vehicle_id, frames_list=[], x_list=[], y_list=[], xc_list=[], yc_list=[], width_list=[], height_list=[], lane_list=[]):
-        self.vehicle_id = vehicle_id
-        self.frames_list = frames_list
-        self.x_list = x_list
-        self.y_list = y_list
-        self.xc_list = xc_list
-        self.yc_list = yc_list
-        self.width_list = width_list
-        self.height_list = height_list
-        self.lane_list = lane_list
-
-########## Vehicle Class ##########
-        
 ########## RGB Frame Class ##########
 
 class RGB_Frame:
@@ -159,91 +145,53 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
                 obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
                 if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:  # vehicle detected
                     if obj_meta.rect_params.top >= y1 and obj_meta.rect_params.top <= y2:
-                        car_found = 0
-                        for x in vehicle_list:
-                            if x.vehicle_id == obj_meta.object_id:
-                                x.frames_list.append(frame_number)
-                                x.x_list.append(obj_meta.rect_params.left)
-                                x.y_list.append(obj_meta.rect_params.top)
-                                x.xc_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                                x.yc_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                                x.width_list.append(obj_meta.rect_params.width)
-                                x.height_list.append(obj_meta.rect_params.height)
-                                x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                                if x_center > min(x13, x23):
-                                    x.lane_list.append('shoulder')
-                                elif x_center > min(x12, x22):
-                                    x.lane_list.append('slow')
-                                elif x_center > min(x11, x21):
-                                    x.lane_list.append('medium')
-                                else:
-                                    x.lane_list.append('fast')
-                                car_found = 1
-                                break
-                            
-                        if car_found == 0:
-                            frames_temp_list = []
-                            frames_temp_list.append(frame_number)
-                            x_temp_list = []
-                            x_temp_list.append(obj_meta.rect_params.left)
-                            y_temp_list = []
-                            y_temp_list.append(obj_meta.rect_params.top)
-                            xc_temp_list = []
-                            xc_temp_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                            yc_temp_list = []
-                            yc_temp_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                            width_temp_list = []
-                            width_temp_list.append(obj_meta.rect_params.width)
-                            height_temp_list = []
-                            height_temp_list.append(obj_meta.rect_params.height)
-                            x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                            lane_temp_list = []
-                            if x_center > min(x13, x23):
-                                lane_temp_list.append('shoulder')
-                            elif x_center > min(x12, x22):
-                                lane_temp_list.append('slow')
-                            elif x_center > min(x11, x21):
-                                lane_temp_list.append('medium')
-                            else:
-                                lane_temp_list.append('fast')
-                                
-                            vehicle_list.append(Vehicle(obj_meta.object_id, frames_temp_list, x_temp_list, y_temp_list, xc_temp_list, yc_temp_list, width_temp_list, height_temp_list, lane_temp_list))
+                        x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
+                        if x_center > min(x13, x23):
+                            lane = 3
+                        elif x_center > min(x12, x22):
+                            lane = 2
+                        elif x_center > min(x11, x21):
+                            lane = 1
+                        else:
+                            lane = 0
+                        if (frame_meta.pad_index, obj_meta.object_id) not in vehicle_store:
                             vehicle_count += 1
-                        
+                        vehicle_store.append(frame_meta.pad_index, obj_meta.object_id, frame_number, obj_meta.rect_params.left, obj_meta.rect_params.top,
+                                             obj_meta.rect_params.width, obj_meta.rect_params.height, lane)
+
                     print('Vehicle ID = ', obj_meta.object_id, ', Frame Number = ', frame_number, ', Top X = ', obj_meta.rect_params.left,', Top Y = ', obj_meta.rect_params.top, ', Width = ', obj_meta.rect_params.width, ', Height = ', obj_meta.rect_params.height)
 
-                    for i, o in enumerate(vehicle_list):        
-                        frame_lag = abs(int(o.frames_list[-1]) - int(frame_number))
-                        if (frame_lag > 20) and int(len(o.frames_list)) <= 6:   # vehicle count rectifier; eliminates false tracking instances
+                    for o in vehicle_store:
+                        frame_lag = abs(o.last_frame - int(frame_number))
+                        if (frame_lag > 20) and len(o) <= 6:   # vehicle count rectifier; eliminates false tracking instances
                             print('inadequate number of frames in train, deleting...', '\n')
-                            del vehicle_list[i]
+                            vehicle_store.retire(o.source, o.vehicle_id)
                             vehicle_count -= 1
                             break
                         
                         if frame_lag > 20 and frame_lag < 100:      # optimal frame extractor
                             midpoint = int((y1 + y2) / 2)
-                            my_array = np.array(o.yc_list)
-                            pos = (np.abs(my_array - midpoint)).argmin()
-                            temp_frame_number = o.frames_list[pos]
+                            pos = (np.abs(o.yc - midpoint)).argmin()
+                            temp_frame_number = o.frames[pos]
                             temp_id = o.vehicle_id
                             with open('optimal_frame_extraction.txt', 'a') as the_file:
-                                the_file.write(str(o.frames_list[pos]))
+                                the_file.write(str(o.frames[pos]))
                                 the_file.write(' ')
                                 the_file.write(str(o.vehicle_id))
                                 the_file.write(' ')
-                                the_file.write(str(o.width_list[pos]))
+                                the_file.write(str(o.width[pos]))
                                 the_file.write(' ')
-                                the_file.write(str(o.height_list[pos]))
+                                the_file.write(str(o.height[pos]))
                                 the_file.write(' ')
-                                the_file.write(str(o.x_list[pos]))
+                                the_file.write(str(o.x[pos]))
                                 the_file.write(' ')
-                                the_file.write(str(o.y_list[pos]))
+                                the_file.write(str(o.y[pos]))
                                 the_file.write('\n')
-                            xx1 = int(o.x_list[pos])
-                            xx2 = int(o.x_list[pos]) + int(o.width_list[pos])
-                            yy1 = int(o.y_list[pos])
-                            yy2 = int(o.y_list[pos]) + int(o.height_list[pos])
-                            del vehicle_list[i]
+                            xx1 = int(o.x[pos])
+                            xx2 = int(o.x[pos]) + int(o.width[pos])
+                            yy1 = int(o.y[pos])
+                            yy2 = int(o.y[pos]) + int(o.height[pos])
+                            vehicle_store.retire(o.source, o.vehicle_id)
                             finder = 0
                             for f in rgb_frames_list:
                                 if f.frame_iterator == temp_frame_number:
@@ -256,7 +204,7 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
                             
                         if frame_lag > 100:     # vehicle buffer cleaner; eliminates expired tracking instances
                             print('train expired, deleting...', '\n')
-                            del vehicle_list[i]
+                            vehicle_store.retire(o.source, o.vehicle_id)
                             break
                             
                         
@@ -34,6 +34,9 @@ gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst
 from common.is_aarch_64 import is_aarch64
 from common.bus_call import bus_call
+from track_store import TrackStore
+from lane_geometry import LaneMap
+from detections import DetectionBuffer, class_counts, select, centers
 import pyds
 
 PGIE_CLASS_ID_VEHICLE = 0
@@ -41,24 +44,6 @@ PGIE_CLASS_ID_BICYCLE = 1
 PGIE_CLASS_ID_PERSON = 2
 PGIE_CLASS_ID_ROADSIGN = 3
 
-########## Gate Class ##########
-
-class Gate:
-    def __init__(self, vehicle_id, x_smallest, x_largest, y_smallest, y_largest, frames_list=[], x_list=[], y_list=[], xc_list=[], yc_list=[], lane=[]):
-        self.vehicle_id = vehicle_id
-        self.x_smallest = x_smallest
-        self.x_largest = x_largest
-        self.y_smallest = y_smallest
-        self.y_largest = y_largest
-        self.frames_list = frames_list
-        self.x_list = x_list
-        self.y_list = y_list
-        self.xc_list = xc_list
-        self.yc_list = yc_list
-        self.lane = lane
-
-########## Gate Class ##########
-
 stream_width = 1920     # horizontal scale of inference geometry as opposed to the width of input stream
 stream_height = 1080    # vertical scale of inference geometry as opposed to the height of input stream
 total_cars = 0  # total cars detected in the stream, i.e., total cars assigned unique tracking IDs
@@ -72,18 +57,14 @@ x23 = 1170
 x24 = 1610     # rightmost 'vertical' segment bottom
 y1 = 384    # optimal range filter start
 y2 = 633    # optimal range filter end
-gate_list = []  # list for the detected vehicles and their frames
+gate_store = TrackStore()  # tracks of the detected vehicles and their frames; indexed by (source, tracking id)
+detection_buffer = DetectionBuffer()   # object metadata of the current frame; reused by every frame
+LANE_NAMES = ('shoulder', 'slow', 'medium', 'fast')    # lane names by lane index, from the leftmost lane
+lane_map = LaneMap([((x11, y1), (x21, y2)), ((x12, y1), (x22, y2)), ((x13, y1), (x23, y2)), ((x14, y1), (x24, y2))],
+                   stream_width, stream_height, 4, len(LANE_NAMES) - 1)     # lane id raster; lane of a point is the number of boundaries to its left
 
 def osd_sink_pad_buffer_probe(pad, info, u_data):
     
-    # Intiallizing object counter with 0.
-    obj_counter = {
-        PGIE_CLASS_ID_VEHICLE: 0,
-        PGIE_CLASS_ID_PERSON: 0,
-        PGIE_CLASS_ID_BICYCLE: 0,
-        PGIE_CLASS_ID_ROADSIGN: 0
-    }
-    
     num_rects = 0
     global total_cars  # explicit mention of the global variable inside the function
     global x11, x12, x13, x14, x21, x22, x23, x24   # lanes
@@ -110,75 +91,17 @@ def osd_sink_pad_buffer_probe(pad, info, u_data):
 
         frame_number = frame_meta.frame_num
         num_rects = frame_meta.num_obj_meta
-        l_obj = frame_meta.obj_meta_list
-        while l_obj is not None:
-            try:
-                # Casting l_obj.data to pyds.NvDsObjectMeta
-                obj_meta = pyds.glist_get_nvds_object_meta(l_obj.data)
-                if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:
-                    if obj_meta.rect_params.top >= y1 and obj_meta.rect_params.top <= y2:
-                        car_found = 0
-                        for x in gate_list:
-                            if x.vehicle_id == obj_meta.object_id:
-                                x.frames_list.append(frame_number)
-                                x.x_list.append(obj_meta.rect_params.left)
-                                x.y_list.append(obj_meta.rect_params.top)
-                                x.xc_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                                x.yc_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                                x.x_smallest = min(x.x_list)
-                                x.x_largest = max(x.x_list)
-                                x.y_smallest = min(x.y_list)
-                                x.y_largest = max(x.y_list)
-                                x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                                y_center = int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2))
-                                if x_center > min(x13, x23):
-                                    x.lane.append('fast')
-                                elif x_center > min(x12, x22):
-                                    x.lane.append('medium')
-                                elif x_center > min(x11, x21):
-                                    x.lane.append('slow')
-                                else:
-                                    x.lane.append('shoulder')
-                                car_found = 1
-                                break
-    
-                        if car_found == 0:
-                            frame_temp_list = []
-                            frame_temp_list.append(frame_number)
-                            x_temp_list = []
-                            x_temp_list.append(obj_meta.rect_params.left)
-                            y_temp_list = []
-                            y_temp_list.append(obj_meta.rect_params.top)
-                            xc_temp_list = []
-                            xc_temp_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                            yc_temp_list = []
-                            yc_temp_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                            x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                            y_center = int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2))
-                            lane_temp_list = []
-                            if x_center > min(x13, x23):
-                                lane_temp_list.append('fast')
-                            elif x_center > min(x12, x22):
-                                lane_temp_list.append('medium')
-                            elif x_center > min(x11, x21):
-                                lane_temp_list.append('slow')
-                            else:
-                                lane_temp_list.append('shoulder')
-                            gate_list.append(Gate(obj_meta.object_id, min(x_temp_list), max(x_temp_list), min(y_temp_list), max(y_temp_list), frame_temp_list, x_temp_list, y_temp_list, xc_temp_list, yc_temp_list, lane_temp_list))
-                     
-                    if obj_meta.object_id > total_cars:
-                        total_cars = obj_meta.object_id  # total cars assigned unique tracing IDs
-                  
-                    print('Vehicle ID = ', obj_meta.object_id, ', Frame Number = ', frame_number, ', Top X = ', obj_meta.rect_params.left,
-                          ', Top Y = ', obj_meta.rect_params.top, ', Width = ', obj_meta.rect_params.width, ', Height = ', obj_meta.rect_params.height)
-                    
-            except StopIteration:
-                break
-            obj_counter[obj_meta.class_id] += 1
-            try:
-                l_obj = l_obj.next
-            except StopIteration:
-                break
+        detections = detection_buffer.gather(frame_meta.obj_meta_list, pyds.glist_get_nvds_object_meta)    # object metadata of the frame, walked once into a record array
+        obj_counter = class_counts(detections)
+        cars = select(detections, PGIE_CLASS_ID_VEHICLE)
+        vehicles = select(cars, PGIE_CLASS_ID_VEHICLE, y1, y2)     # optimal range filter
+        x_center, y_center = centers(vehicles)
+        gate_store.extend(frame_meta.pad_index, frame_number, vehicles, lane_map.lanes(x_center, y_center))
+        if len(cars):
+            total_cars = max(total_cars, int(cars['object_id'].max()))  # total cars assigned unique tracing IDs
+        for _, object_id, left, top, width, height, _ in cars.tolist():
+            print('Vehicle ID = ', object_id, ', Frame Number = ', frame_number, ', Top X = ', left,
+                  ', Top Y = ', top, ', Width = ', width, ', Height = ', height)
 
         # Acquiring a display meta object. The memory ownership remains in
         # the C code so downstream plugins can still access it. Otherwise
@@ -463,13 +386,17 @@ def main(args):
     y_max_list = []
     id_list = []
     print('Data of all vehicles detected after a quarter of the maximum pixel height:')
-    for car_objects in gate_list:
-        x_min_list.append(car_objects.x_smallest)
-        x_max_list.append(car_objects.x_largest)
-        y_min_list.append(car_objects.y_smallest)
-        y_max_list.append(car_objects.y_largest)
+    for car_objects in gate_store:
+        x_smallest = float(car_objects.x.min())
+        x_largest = float(car_objects.x.max())
+        y_smallest = float(car_objects.y.min())
+        y_largest = float(car_objects.y.max())
+        x_min_list.append(x_smallest)
+        x_max_list.append(x_largest)
+        y_min_list.append(y_smallest)
+        y_max_list.append(y_largest)
         id_list.append(car_objects.vehicle_id)
-        print(car_objects.vehicle_id, car_objects.frames_list, car_objects.x_list, car_objects.y_list, car_objects.xc_list, car_objects.yc_list, car_objects.lane, car_objects.x_smallest, car_objects.x_largest, car_objects.y_smallest, car_objects.y_largest, sep=' ')
+        print(car_objects.vehicle_id, car_objects.frames.tolist(), car_objects.x.tolist(), car_objects.y.tolist(), car_objects.xc.tolist(), car_objects.yc.tolist(), [LANE_NAMES[l] for l in car_objects.lane], x_smallest, x_largest, y_smallest, y_largest, sep=' ')
             
     print('\n','Tracking IDs of all vehicles detected after (below) a quarter of the maximum pixel height:', id_list, len(id_list), '\n')
     
@@ -488,19 +415,17 @@ def main(args):
     midpoint = int(midpoint)
     print('Midpoint of y = ', midpoint)
     id_list_gate = []
-    for c in gate_list:
-        for y in c.yc_list:
-            if c.vehicle_id not in id_list_gate:
-                id_list_gate.append(c.vehicle_id)            
+    for c in gate_store:
+        if len(c) and c.vehicle_id not in id_list_gate:
+            id_list_gate.append(c.vehicle_id)            
                 
     print('\n', 'Tracking IDs of all vehicles detected in the optimal frame range:', id_list_gate)
     print('\n', 'Number of vehicles =', len(id_list_gate), '\n')
     
-    for f in gate_list:
+    for f in gate_store:
         if f.vehicle_id in id_list_gate:
-            my_array = np.array(f.yc_list)
-            pos = (np.abs(my_array - midpoint)).argmin()
-            print('tracking id =', f.vehicle_id, ', optimal frame number =', f.frames_list[pos], ', optimal coordinate = (', f.xc_list[pos], ',', f.yc_list[pos], ')', ', lane =', f.lane[pos])
+            pos = (np.abs(f.yc - midpoint)).argmin()
+            print('tracking id =', f.vehicle_id, ', optimal frame number =', f.frames[pos], ', optimal coordinate = (', f.xc[pos], ',', f.yc[pos], ')', ', lane =', LANE_NAMES[f.lane[pos]])
             
     optimal_frame = {
          "x1": min(x_min_list),
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# On-disk cache of the per-frame detections of video files, for re-running the extraction with other road
+# geometry or lifecycle settings without running the detector again. An entry is keyed by the content hash
+# of the video and the fingerprint of everything that produced the detections (detector, tracker settings,
+# segmentation), and is stored as a detection recording (see recording.py). The cache is bounded in size;
+# the least recently used entries are evicted first.
+
+import hashlib
+import importlib.util
+import json
+import os
+
+from recording import DetectionRecorder, read_recording
+
+CACHE_VERSION = 1   # bump when the cached detections change meaning
+HASH_CHUNK = 4 * 1024 * 1024
+
+def content_hash(path):
+    # SHA-256 of the file contents
+    digest = hashlib.sha256()
+    with open(path, 'rb') as video_file:
+        for chunk in iter(lambda: video_file.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def detector_fingerprint(spec):
+    # a 'module:factory' detector is identified by its fingerprint attribute (e.g. a model weights hash) when
+    # the factory has one, otherwise by the source of its module; the built-in detector by its module
+    module, _, factory = (spec or 'ofe_cpu:BackgroundSubtractionDetector').partition(':')
+    found = importlib.util.find_spec(module)
+    if found is None:
+        raise ImportError("no detector module %s" % module)
+    fingerprint = getattr(getattr(importlib.import_module(module), factory, None), 'fingerprint', None)
+    if fingerprint is not None:
+        return '%s:%s=%s' % (module, factory, fingerprint)
+    with open(found.origin, 'rb') as module_file:
+        return '%s:%s#%s' % (module, factory, hashlib.sha256(module_file.read()).hexdigest())
+
+def fingerprint(*parts):
+    # SHA-256 of the settings that produced the detections, in a stable order
+    return hashlib.sha256(json.dumps([CACHE_VERSION] + list(parts), sort_keys=True, default=str).encode()).hexdigest()
+
+########## Detection Cache Class ##########     # described by the cache folder, its size bound and the known content hashes
+
+class DetectionCache:
+    def __init__(self, folder, max_bytes=2 * 1024 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(folder, exist_ok=True)
+        self._hash_index_path = os.path.join(folder, 'hashes.json')     # (path, size, mtime) : content hash; saves re-hashing unchanged files
+        try:
+            with open(self._hash_index_path) as index_file:
+                self._hashes = json.load(index_file)
+        except (OSError, ValueError):
+            self._hashes = {}
+
+    def video_hash(self, path):
+        stat = os.stat(path)
+        known = '%s|%d|%d' % (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._hashes.get(known)
+        if digest is None:
+            digest = self._hashes[known] = content_hash(path)
+            with open(self._hash_index_path + '.tmp', 'w') as index_file:
+                json.dump(self._hashes, index_file)
+            os.replace(self._hash_index_path + '.tmp', self._hash_index_path)
+        return digest
+
+    def key(self, path, settings):
+        return hashlib.sha256((self.video_hash(path) + settings).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.det')
+
+    def get(self, key):
+        # [(frame number, detections)], or None on a miss; a hit becomes the most recently used entry
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return [(int(header['frame']), detections.copy()) for header, detections in read_recording(path)]
+
+    def put(self, key, frames, fps=30):
+        # store [(frame number, detections)], then evict down to the size bound
+        path = self._path(key)
+        temporary = '%s.%d.tmp' % (path, os.getpid())   # written aside and renamed; readers never see a partial entry
+        recorder = DetectionRecorder(temporary)
+        for frame_number, detections in frames:
+            recorder.write(0, frame_number, int(frame_number * 1e9 / fps), frame_number / fps, detections)
+        recorder.close()
+        os.replace(temporary, path)
+        self.evict()    # the new entry is the most recently used; it only goes if it alone is over the bound
+
+    def entries(self):
+        # [(last use, bytes, path)], least recently used first
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.det'):
+                stat = os.stat(os.path.join(self.folder, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.folder, name)))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.evicted += 1
+        return total
+
+    def metrics(self):
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted}
+
+########## Detection Cache Class ##########
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Per-frame detection batches for the DeepStream buffer probes (ofe.py, orc.py and deepstream_test_2.py).
+# The object metadata list of a frame is walked once and copied into a preallocated NumPy record array;
+# the optimal range filter, bounding box centres, scores and lanes are then computed for all the
+# detections of the frame as array operations instead of one object at a time. Small frames do not pay off
+# the NumPy call overhead; walk_vehicles() reads only the vehicles of interest for the one-at-a-time path.
+
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([('class_id', '<i4'), ('object_id', '<u8'), ('left', '<f4'), ('top', '<f4'),
+                            ('width', '<f4'), ('height', '<f4'), ('confidence', '<f4')])
+
+########## Detection Buffer Class ##########     # described by the record array the detections of one frame are gathered into
+
+class DetectionBuffer:
+    def __init__(self, capacity=64):
+        self._records = np.zeros(capacity, dtype=DETECTION_DTYPE)
+
+    def gather(self, l_obj, cast):
+        # copy the object metadata list of a frame; cast is pyds.NvDsObjectMeta.cast or pyds.glist_get_nvds_object_meta
+        # returns a view of the filled records, valid until the next gather
+        rows = []
+        while l_obj is not None:
+            try:
+                obj_meta = cast(l_obj.data)
+            except StopIteration:
+                break
+            rect = obj_meta.rect_params
+            rows.append((obj_meta.class_id, obj_meta.object_id, rect.left, rect.top, rect.width, rect.height, obj_meta.confidence))
+            try:
+                l_obj = l_obj.next
+            except StopIteration:
+                break
+        return self.fill(rows)
+
+    def fill(self, rows):
+        # (class_id, object_id, left, top, width, height, confidence) tuples into the records; also used by replay and benchmarks
+        n = len(rows)
+        if n > len(self._records):      # more objects than ever before; grow the buffer
+            self._records = np.zeros(max(n, 2 * len(self._records)), dtype=DETECTION_DTYPE)
+        records = self._records[:n]
+        if n:
+            records[:] = rows
+        return records
+
+########## Detection Buffer Class ##########
+
+def walk_vehicles(l_obj, cast, vehicle_class, y1, y2, classes=4):
+    # the object metadata list of a small frame, for Extractor.update_vehicles(); returns the detections per class id
+    # and (object_id, left, top, width, height) of the vehicles whose top lies in [y1, y2]. Only vehicles have their
+    # rect_params read, once each, so this costs less than gather() when the record array is not needed
+    counts = [0] * classes
+    vehicles = []
+    while l_obj is not None:
+        try:
+            obj_meta = cast(l_obj.data)
+        except StopIteration:
+            break
+        class_id = obj_meta.class_id
+        if class_id >= len(counts):     # a class id beyond classes; the list grows as np.bincount does in class_counts()
+            counts.extend([0] * (class_id + 1 - len(counts)))
+        counts[class_id] += 1
+        if class_id == vehicle_class:
+            rect = obj_meta.rect_params
+            top = rect.top
+            if y1 <= top <= y2:
+                vehicles.append((obj_meta.object_id, rect.left, top, rect.width, rect.height))
+        try:
+            l_obj = l_obj.next
+        except StopIteration:
+            break
+    return counts, vehicles
+
+def class_counts(detections, classes=4):
+    # detections per class id, as obj_counter of the probes
+    return np.bincount(detections['class_id'], minlength=classes)
+
+def select(detections, class_id, y1=None, y2=None):
+    # detections of one class, optionally only those whose top lies in the optimal range [y1, y2]
+    mask = detections['class_id'] == class_id
+    if y1 is not None:
+        mask &= detections['top'] >= y1
+    if y2 is not None:
+        mask &= detections['top'] <= y2
+    return detections[mask]
+
+def centers(detections):
+    # bounding box centres, truncated to integers as Track.append stores them
+    x_center = np.add(detections['left'], detections['width'] / 2, dtype=np.float64).astype(np.int32)
+    y_center = np.add(detections['top'], detections['height'] / 2, dtype=np.float64).astype(np.int32)
+    return x_center, y_center
+
+def midpoint_scores(y_center, midpoint):
+    # optimal frame score of every detection; closer to the midpoint of optimal range is better
+    return -np.abs(y_center - midpoint)
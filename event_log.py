@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Buffered, rotating event log of finalized vehicles; replaces optimal_frame_extraction.txt. Events are
+# collected in a preallocated NumPy record buffer and written in blocks, either as CSV with a header or as
+# raw little-endian records of EVENT_DTYPE that load back into NumPy (or pandas) without any parsing.
+# A new file is started on every run and whenever the current one grows too large or too old.
+#
+# usage: python3 event_log.py <event log file>
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+EVENT_DTYPE = np.dtype([('timestamp', '<f8'), ('stream', '<u2'), ('track', '<u8'), ('frame', '<u8'),
+                        ('left', '<f4'), ('top', '<f4'), ('width', '<f4'), ('height', '<f4'), ('lane', 'i1')])
+FORMATS = {'csv': '.csv', 'bin': '.ev'}
+CSV_FORMATS = ('%.3f', '%d', '%d', '%d', '%.1f', '%.1f', '%.1f', '%.1f', '%d')
+
+def load_events(path):
+    # structured array of EVENT_DTYPE from a csv or binary event log
+    if path.endswith(FORMATS['csv']):
+        return np.atleast_1d(np.loadtxt(path, dtype=EVENT_DTYPE, delimiter=',', skiprows=1, ndmin=1))
+    return np.fromfile(path, dtype=EVENT_DTYPE)
+
+########## Event Logger Class ##########     # described by the file format, the record buffer and the flush and rotation limits
+
+class EventLogger:
+    def __init__(self, prefix='optimal_frame_extraction', fmt='bin', flush_rows=64, flush_seconds=5.0, rotate_bytes=64 * 1024 * 1024, rotate_seconds=86400):
+        if fmt not in FORMATS:
+            raise ValueError("unknown event log format %r; expected one of %s" % (fmt, ', '.join(FORMATS)))
+        self.prefix = prefix
+        self.fmt = fmt
+        self.flush_seconds = flush_seconds      # buffered events are written at least this often
+        self.rotate_bytes = rotate_bytes        # start a new file past this size; 0 disables
+        self.rotate_seconds = rotate_seconds    # start a new file past this age; 0 disables
+        self._buffer = np.zeros(flush_rows, dtype=EVENT_DTYPE)
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self.path = None
+        self._opened = 0.0
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name='event-log-flush', daemon=True)
+        self._flusher.start()
+
+    def log(self, timestamp, stream, track, frame, left, top, width, height, lane):
+        with self._lock:
+            row = self._buffer[self._rows]
+            row['timestamp'] = timestamp
+            row['stream'] = stream
+            row['track'] = track
+            row['frame'] = frame
+            row['left'] = left
+            row['top'] = top
+            row['width'] = width
+            row['height'] = height
+            row['lane'] = lane
+            self._rows += 1
+            if self._rows == len(self._buffer):     # buffer full
+                self._flush()
+
+    def _open(self):
+        now = time.time()
+        path = self.prefix + time.strftime('_%Y%m%d_%H%M%S', time.localtime(now)) + FORMATS[self.fmt]
+        suffix = 1
+        while os.path.exists(path):     # more than one rotation within a second
+            path = self.prefix + time.strftime('_%Y%m%d_%H%M%S', time.localtime(now)) + '_%d' % suffix + FORMATS[self.fmt]
+            suffix += 1
+        self._file = open(path, 'wb')
+        if self.fmt == 'csv':
+            self._file.write((','.join(EVENT_DTYPE.names) + '\n').encode())
+        self.path = path
+        self._opened = now
+
+    def _rotate_due(self):
+        if self.rotate_bytes and self._file.tell() >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened >= self.rotate_seconds
+
+    def _flush(self):
+        # lock held by the caller
+        if not self._rows:
+            return
+        if self._file is None or self._rotate_due():
+            if self._file is not None:
+                self._file.close()
+            self._open()
+        rows = self._buffer[:self._rows]
+        if self.fmt == 'csv':
+            np.savetxt(self._file, rows, fmt=CSV_FORMATS, delimiter=',')
+        else:
+            self._file.write(rows.tobytes())
+        self._file.flush()
+        self._rows = 0
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_seconds):
+            self.flush()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+########## Event Logger Class ##########
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: %s <event log file>\n" % sys.argv[0])
+        sys.exit(1)
+    events = load_events(sys.argv[1])
+    print(' '.join(EVENT_DTYPE.names))
+    for e in events:
+        print(*e.tolist())
+    print(len(events), 'events')
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Tracking and optimal frame extraction logic of ofe.py, free of DeepStream. The buffer probe, the offline
+# replay engine and the other backends gather the detections of a frame into a DETECTION_DTYPE batch and
+# hand it to the same Extractor, which extends the tracks, keeps the running best candidate of every
+# track, sweeps the stale tracks and turns every finalized track into a vehicle event. With a fragment
+# linker (fragments.py), a track the tracker lost and re-issued under a new id is merged back into one.
+
+import time
+
+from detections import select, centers
+from frame_scoring import MidpointScorer
+from lifecycle import RECTIFY, EXPIRE
+from track_store import TrackStore
+
+PGIE_CLASS_ID_VEHICLE = 0
+LANE_NAMES = ('fast', 'medium', 'slow', 'shoulder')     # lane names by lane index, from the leftmost lane
+
+def vehicle_event(state, track, extension, timestamp, lane_names, crop=None, fragments=0):
+    # output event of a finalized track; the record handed to the output stage
+    return {'stream': track.source, 'vehicle_id': track.vehicle_id, 'frame_number': track.best_frame, 'width': track.best_width, 'height': track.best_height,
+            'x': track.best_x, 'y': track.best_y, 'lane': lane_names[track.best_lane], 'lane_id': track.best_lane,
+            'datetime': time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(timestamp)), 'timestamp': timestamp,
+            'image_path': state.folder + "/numb_frno_trid=" + str(state.vehicle_count) + '_' + str(track.best_frame) + '_' + str(track.vehicle_id) + extension,
+            'crop': crop, 'fragments': fragments}     # tracking ids merged into the vehicle's track
+
+########## Extractor Class ##########     # described by the track store, the track lifecycle stage, the optimal frame scorer, the fragment linker, the per-source state and the event sink
+
+class Extractor:
+    def __init__(self, lifecycle, submit, lane_names=LANE_NAMES, roi_buffer=None, extension='.jpg', verbose=False, vehicle_class=PGIE_CLASS_ID_VEHICLE,
+                 scorer=None, linker=None, batch_threshold=32):
+        self.store = TrackStore()   # vehicle bounding box metadata buffer; tracks indexed by (source, tracking id)
+        self.lifecycle = lifecycle
+        self.submit = submit    # callable taking one finalized vehicle event
+        self.lane_names = lane_names
+        self.roi_buffer = roi_buffer    # vehicle crop buffer in 'roi' capture mode; otherwise crops come from the frame ring of the source
+        self.extension = extension      # crop file extension of the image paths
+        self.verbose = verbose
+        self.vehicle_class = vehicle_class
+        self.scorer = scorer if scorer is not None else MidpointScorer()     # see frame_scoring.py
+        self.linker = linker    # FragmentLinker, or None to keep every tracking id a vehicle of its own
+        self.batch_threshold = batch_threshold  # frames with fewer detections are updated one detection at a time, when the scorer allows it
+        self.sources = {}   # SourceState by source index
+
+    def add_source(self, state):
+        self.sources[state.source] = state
+        return state
+
+    def update(self, state, frame_number, detections, frame=None):
+        # extend the tracks with the detections of one frame; returns the new best candidates as (tracking id, left, top, width, height).
+        # frame is the image of the frame, for scorers that look at pixels (scorer.needs_frame)
+        if not self.batched(len(detections)):
+            vehicle_class = self.vehicle_class
+            return self.update_vehicles(state, frame_number, [(object_id, left, top, width, height) for class_id, object_id, left, top, width, height, _ in detections.tolist()
+                                                              if class_id == vehicle_class])
+        state.frame_count += 1
+        windows = state.windows
+        vehicles = select(detections, self.vehicle_class, windows.low, windows.high)    # optimal range filter; the union of the lane windows
+        x_center, y_center = centers(vehicles)
+        lanes = state.lanes.lanes(x_center, y_center)   # lane raster lookup; follows the slant of the lane boundaries
+        if not windows.single:  # per-lane windows; every lane keeps only its own band
+            inside = windows.inside(vehicles['top'], lanes)
+            vehicles, y_center, lanes = vehicles[inside], y_center[inside], lanes[inside]
+        if self.linker is not None:     # newborn tracks that continue a recently ended one are merged into it first
+            for fragment, track in self.linker.due(state.source, frame_number, self.store):
+                self.merge(state, fragment, track)
+            self.linker.rename(state.source, vehicles)
+        tracks = self.store.extend(state.source, frame_number, vehicles, lanes)    # initialize or extend the vehicle metadata tracks
+        scores = self.scorer.scores(windows, vehicles, y_center, lanes, tracks, frame)  # optimal frame score of every detection; higher is better
+        candidates = []
+        for track, score, lane, (_, object_id, left, top, width, height, _) in zip(tracks, scores.tolist(), lanes.tolist(), vehicles.tolist()):
+            self.lifecycle.seen(track)
+            if score > track.best_score:    # new best candidate for the optimal frame
+                if self.roi_buffer is not None:     # the previous best crop can no longer win
+                    self.roi_buffer.discard(track.source, track.vehicle_id, track.best_frame)
+                candidates.append((object_id, left, top, width, height))
+                track.set_best(score, frame_number, left, top, width, height, lane)
+        if self.linker is not None:
+            self.linker.observe(state.source, frame_number, tracks)
+        return candidates
+
+    def batched(self, count):
+        # whether a frame of count detections takes the batched path; the rest go through update_vehicles()
+        return count >= self.batch_threshold or not hasattr(self.scorer, 'score')
+
+    def update_vehicles(self, state, frame_number, vehicles):
+        # update() one detection at a time, for small frames, where a handful of NumPy calls cost more than a short loop;
+        # vehicles are (tracking id, left, top, width, height) of the vehicle detections, at least those in the union of
+        # the lane windows. Same lanes, scores and candidates as the batched path; needs a scorer with score()
+        state.frame_count += 1
+        windows, lanes, store, linker, source = state.windows, state.lanes, self.store, self.linker, state.source
+        low, high, bands = windows.low, windows.high, windows.bands
+        if linker is not None:
+            for fragment, track in linker.due(source, frame_number, store):
+                self.merge(state, fragment, track)
+        tracks = []
+        candidates = []
+        for object_id, left, top, width, height in vehicles:
+            if top < low or top > high:
+                continue
+            y_center = int(top + (height / 2))
+            lane = lanes.lane(int(left + (width / 2)), y_center)
+            y1, y2, _ = bands[lane]
+            if top < y1 or top > y2:    # outside its lane's window
+                continue
+            if linker is not None:
+                object_id = linker.alias(source, object_id)
+            track = store.append(source, object_id, frame_number, left, top, width, height, lane)
+            tracks.append(track)
+            self.lifecycle.seen(track)
+            score = self.scorer.score(windows, y_center, lane)
+            if score > track.best_score:
+                if self.roi_buffer is not None:
+                    self.roi_buffer.discard(track.source, track.vehicle_id, track.best_frame)
+                candidates.append((object_id, left, top, width, height))
+                track.set_best(score, frame_number, left, top, width, height, lane)
+        if linker is not None:
+            linker.observe(source, frame_number, tracks)
+        return candidates
+
+    def merge(self, state, fragment, track):
+        # fold a newborn fragment into the track it continues; its detections follow the track's, and the better of the two best candidates wins
+        self.store.retire(fragment.source, fragment.vehicle_id)
+        for frame_number, left, top, width, height, lane in zip(fragment.frames.tolist(), fragment.x.tolist(), fragment.y.tolist(),
+                                                                 fragment.width.tolist(), fragment.height.tolist(), fragment.lane.tolist()):
+            track.append(frame_number, left, top, width, height, lane)
+        if fragment.best_score > track.best_score:
+            if self.roi_buffer is not None:     # the crop moves with the candidate
+                crop = self.roi_buffer.get(fragment.source, fragment.vehicle_id, fragment.best_frame)
+                self.roi_buffer.discard(track.source, track.vehicle_id, track.best_frame)
+                if crop is not None:
+                    self.roi_buffer.put(track.source, track.vehicle_id, fragment.best_frame, crop)
+            track.set_best(fragment.best_score, fragment.best_frame, fragment.best_x, fragment.best_y, fragment.best_width, fragment.best_height, fragment.best_lane)
+        if self.roi_buffer is not None:
+            self.roi_buffer.release(fragment.source, fragment.vehicle_id)
+        state.merged_count += 1
+        if self.verbose:
+            print('track', fragment.vehicle_id, 'continues track', track.vehicle_id, ', merged', '\n')
+
+    def sweep(self, state, frame_number, timestamp):
+        # track lifecycle; every track of the source that went stale is finalized or dropped in one pass
+        resolved = self.lifecycle.sweep(self.store, state.source, frame_number)
+        for track, verdict in resolved:
+            self.resolve(track, verdict, timestamp)
+        return len(resolved)
+
+    def resolve(self, track, verdict, timestamp):
+        # finalize or drop a retired track; finalizing hands the optimal frame of the vehicle to the event sink
+        state = self.sources[track.source]
+        if verdict == RECTIFY:      # vehicle count rectifier; eliminates false tracking instances, i.e., ones not tracked long enough for conclusive tracking train resolution
+            if self.verbose:
+                print('inadequate number of frames in train, deleting...', '\n')
+        elif verdict == EXPIRE:     # vehicle buffer cleaner; eliminates expired tracking instances
+            if self.verbose:
+                print('train expired, deleting...', '\n')
+        else:       # optimal frame extractor...the business end
+            state.vehicle_count += 1
+            if self.linker is not None:     # merged fragments long enough to have been finalized on their own; duplicates avoided
+                state.duplicate_count += max(sum(n > self.lifecycle.min_frames for n in self.linker.segments(track)) - 1, 0)
+            state.saved_count += 1
+            self.submit(vehicle_event(state, track, self.extension, timestamp, self.lane_names, self.crop(state, track),
+                                      len(self.linker.fragments(track)) if self.linker is not None else 0))
+        if self.roi_buffer is not None:
+            self.roi_buffer.release(track.source, track.vehicle_id)
+        if self.linker is not None:
+            self.linker.forget(track)
+
+    def crop(self, state, track):
+        # optimal frame crop of a track, or None when it is no longer (or never was) buffered
+        if self.roi_buffer is not None:
+            return self.roi_buffer.get(track.source, track.vehicle_id, track.best_frame)    # crop captured around the vehicle's bounding box
+        if state.frame_ring is None:
+            return None
+        frame_image = state.frame_ring.get(track.best_frame)
+        if frame_image is None:
+            return None
+        x1 = int(track.best_x)
+        y1 = int(track.best_y)
+        return frame_image[y1:y1 + int(track.best_height), x1:x1 + int(track.best_width)].copy()     # copied, the ring slot is reused
+
+    def drain(self, timestamp, source=None):
+        # end of stream; no track is left behind unresolved
+        resolved = self.lifecycle.drain(self.store, source)
+        for track, verdict in resolved:
+            self.resolve(track, verdict, timestamp)
+        return len(resolved)
+
+########## Extractor Class ##########
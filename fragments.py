@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# Track fragment re-association for the Extractor. When the tracker loses a vehicle and gives it a new
+# tracking id, the two fragments would be finalized as two vehicles: two crops, two database rows and two
+# ALPR runs. The linker keeps a small index of the recently ended tracks of every source (in-window tracks
+# not seen in the latest frame, for at most maxGap frames) and holds every newborn track for a few confirm
+# frames; then the newborn track is gated against the ended tracks that stopped before it was born:
+#   position - its first centre within positionGate box heights of the ended track's constant velocity prediction,
+#   velocity - its velocity within velocityGate (relative) of the ended track's, once it has two detections,
+#   size     - its first box within sizeGate (relative) of the ended track's last box,
+#   lane     - the same lane, when laneGate is on,
+# and the closest passing track takes it over: the Extractor folds the fragment's detections and best
+# candidate into it, and later detections of the fragment's id extend it directly. Ended tracks are still
+# live in the track store (maxGap + confirmFrames stays below finalizeAfter), so a merge only ever delays
+# the fragment's own decision by the confirm frames, never an event.
+
+import math
+
+########## Fragment Linker Class ##########     # described by the gates, the ended and newborn tracks and id aliases of every source, and the merge counters
+
+class FragmentLinker:
+    def __init__(self, max_gap=15, confirm_frames=3, position_gate=0.75, velocity_gate=0.5, size_gate=0.3, lane_gate=True, history=5):
+        self.max_gap = max_gap      # frames between the end of a track and the birth of its continuation
+        self.confirm_frames = confirm_frames    # frames a newborn track is held before it is linked or left alone
+        self.position_gate = position_gate
+        self.velocity_gate = velocity_gate
+        self.size_gate = size_gate
+        self.lane_gate = lane_gate
+        self.history = history      # last detections of a track its velocity is estimated from
+        self.births = 0     # newborn tracks considered
+        self.merges = 0     # of which were linked to an ended track
+        self._seen = {}     # source: {object_id: track} seen in the latest frame
+        self._ended = {}    # source: {object_id: track} not seen since, for at most max_gap frames
+        self._newborn = {}  # source: {object_id: track} held for the confirm frames
+        self._aliases = {}  # (source, fragment id): id of the track it was merged into
+        self._merged_ids = {}   # (source, track id): fragment ids merged into it
+        self._detections = {}   # (source, fragment id): detections of the fragment, before and after its merge
+
+    def rename(self, source, vehicles):
+        # detections of merged fragments continue the track they were merged into; vehicles is modified in place
+        if self._aliases and len(vehicles):
+            vehicles['object_id'] = [self.alias(source, object_id) for object_id in vehicles['object_id'].tolist()]
+
+    def alias(self, source, object_id):
+        # tracking id one detection continues; its own, or that of the track its fragment was merged into
+        track_id = self._aliases.get((source, object_id))
+        if track_id is None:
+            return object_id
+        self._detections[(source, object_id)] += 1
+        return track_id
+
+    def observe(self, source, frame_number, tracks):
+        # after the tracks of one frame were extended; updates the ended and newborn tracks of the source
+        seen = {track.vehicle_id: track for track in tracks}
+        ended = self._ended.setdefault(source, {})
+        for object_id, track in self._seen.get(source, {}).items():
+            if object_id not in seen:
+                ended[object_id] = track
+        for object_id in seen:
+            ended.pop(object_id, None)
+        limit = frame_number - self.max_gap
+        for object_id in [object_id for object_id, track in ended.items() if track.last_frame < limit]:
+            del ended[object_id]
+        self._seen[source] = seen
+        newborn = self._newborn.setdefault(source, {})
+        for track in tracks:
+            if len(track) == 1:
+                newborn[track.vehicle_id] = track
+                self.births += 1
+
+    def due(self, source, frame_number, store):
+        # newborn tracks held for the confirm frames, linked to the ended track they continue if any; returns [(fragment, track)]
+        newborn = self._newborn.get(source)
+        if not newborn:
+            return []
+        links = []
+        ended = self._ended.get(source, {})
+        for object_id in [object_id for object_id, track in newborn.items() if frame_number - track.first_frame >= self.confirm_frames]:
+            fragment = newborn.pop(object_id)
+            if store.lookup(source, object_id) is not fragment:     # already retired
+                continue
+            track = self.match(fragment, [t for t in ended.values() if store.lookup(source, t.vehicle_id) is t])
+            if track is None:
+                continue
+            del ended[track.vehicle_id]
+            seen = self._seen.setdefault(source, {})
+            if seen.pop(object_id, None) is not None:   # the track takes the fragment's place; it may end again, e.g. on another id switch
+                seen[track.vehicle_id] = track
+            elif ended.pop(object_id, None) is not None:
+                ended[track.vehicle_id] = track
+            self._aliases[(source, object_id)] = track.vehicle_id
+            self._merged_ids.setdefault((source, track.vehicle_id), []).append(object_id)
+            self._detections[(source, object_id)] = len(fragment)
+            self.merges += 1
+            links.append((fragment, track))
+        return links
+
+    def match(self, fragment, candidates):
+        # the ended track the fragment continues, or None; the closest to its prediction of those passing every gate
+        best, best_distance = None, float('inf')
+        first = fragment.first_frame
+        for track in candidates:
+            gap = first - track.last_frame
+            if gap < 1 or gap > self.max_gap:
+                continue
+            if self.lane_gate and int(fragment.lane[0]) != int(track.lane[-1]):
+                continue
+            height, width = float(track.height[-1]), float(track.width[-1])
+            if abs(math.log(max(float(fragment.height[0]), 1) / max(height, 1))) > math.log1p(self.size_gate) or \
+               abs(math.log(max(float(fragment.width[0]), 1) / max(width, 1))) > math.log1p(self.size_gate):
+                continue
+            vx, vy = self.velocity(track)
+            distance = math.hypot(float(fragment.xc[0]) - (float(track.xc[-1]) + vx * gap), float(fragment.yc[0]) - (float(track.yc[-1]) + vy * gap))
+            if distance > self.position_gate * height or distance >= best_distance:
+                continue
+            if len(fragment) >= 2:
+                fx, fy = self.velocity(fragment)
+                if math.hypot(fx - vx, fy - vy) > self.velocity_gate * max(math.hypot(vx, vy), 1.0):
+                    continue
+            best, best_distance = track, distance
+        return best
+
+    def velocity(self, track):
+        # pixels per frame of the box centre over the last history detections
+        k = min(self.history, len(track))
+        frames = track.frames
+        span = int(frames[-1]) - int(frames[-k])
+        if span <= 0:
+            return 0.0, 0.0
+        return (float(track.xc[-1]) - float(track.xc[-k])) / span, (float(track.yc[-1]) - float(track.yc[-k])) / span
+
+    def fragments(self, track):
+        # tracking ids merged into a track
+        return self._merged_ids.get((track.source, track.vehicle_id), [])
+
+    def segments(self, track):
+        # detections of a track under each of its tracking ids, its own first; what the tracks would have been without merging
+        merged = [self._detections.get((track.source, object_id), 0) for object_id in self.fragments(track)]
+        return [len(track) - sum(merged)] + merged
+
+    def forget(self, track):
+        # a retired track; its aliases and index entries go
+        for object_id in self._merged_ids.pop((track.source, track.vehicle_id), []):
+            self._aliases.pop((track.source, object_id), None)
+            self._detections.pop((track.source, object_id), None)
+        for index in (self._seen, self._ended, self._newborn):
+            tracks = index.get(track.source)
+            if tracks is not None and tracks.get(track.vehicle_id) is track:
+                del tracks[track.vehicle_id]
+
+    def __repr__(self):
+        return 'FragmentLinker(births=%d, merges=%d, aliases=%d)' % (self.births, self.merges, len(self._aliases))
+
+########## Fragment Linker Class ##########
+
+def linker_from_config(config):
+    # fragment linker with the settings of config.ini, or None when fragmentLinking is off. The ended tracks must
+    # still be live when a newborn track is decided, so maxGap is kept below finalizeAfter - confirmFrames
+    if not config.getboolean('OFEConfig', 'fragmentLinking', fallback=True):
+        return None
+    confirm_frames = config.getint('OFEConfig', 'fragmentConfirmFrames', fallback=3)
+    max_gap = min(config.getint('OFEConfig', 'fragmentMaxGap', fallback=15), config.getint('OFEConfig', 'finalizeAfter', fallback=20) - confirm_frames - 1)
+    return FragmentLinker(max_gap, confirm_frames, config.getfloat('OFEConfig', 'fragmentPositionGate', fallback=0.75),
+                          config.getfloat('OFEConfig', 'fragmentVelocityGate', fallback=0.5), config.getfloat('OFEConfig', 'fragmentSizeGate', fallback=0.3),
+                          config.getboolean('OFEConfig', 'fragmentLaneGate', fallback=True))
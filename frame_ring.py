@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Fixed-capacity ring of captured frames for the DeepStream buffer probes; replaces rgb_frames_list.
+# All slots are preallocated as one NumPy slab when the ring is created, each frame is colour-converted
+# straight from the NvBufSurface into its slot, and a frame is found again by frame number in O(1).
+
+import numpy as np
+import cv2
+
+########## Frame Ring Class ##########     # described by the frame geometry, the number of slots and the frame number held in each slot
+
+class FrameRing:
+    def __init__(self, width, height, channels=4, capacity_frames=120, capacity_mb=0):
+        self.frame_shape = (height, width, channels)
+        frame_bytes = height * width * channels
+        if capacity_mb > 0:     # a memory budget takes precedence over a frame count
+            capacity_frames = int(capacity_mb * 1024 * 1024) // frame_bytes
+        if capacity_frames < 1:
+            raise ValueError("frame ring must hold at least one frame, got capacity of %d frames" % capacity_frames)
+        self.capacity = capacity_frames
+        self.slab = np.empty((self.capacity,) + self.frame_shape, dtype=np.uint8)
+        self.frame_numbers = np.full(self.capacity, -1, dtype=np.int64)     # frame number held in each slot; -1 for an empty slot
+
+    @property
+    def nbytes(self):
+        return self.slab.nbytes
+
+    def store(self, frame_number, surface, code=cv2.COLOR_RGBA2BGRA):
+        # overwrite the slot of the oldest frame; the colour conversion writes straight into the slab
+        # code=None copies a frame that is already in the ring's colour order (CPU backend)
+        slot = frame_number % self.capacity
+        self.frame_numbers[slot] = -1
+        if code is None:
+            np.copyto(self.slab[slot], surface)
+        else:
+            cv2.cvtColor(surface, code, dst=self.slab[slot])
+        self.frame_numbers[slot] = frame_number
+        return self.slab[slot]
+
+    def get(self, frame_number):
+        # view of the stored frame, or None if it was never stored or has been overwritten
+        slot = frame_number % self.capacity
+        if self.frame_numbers[slot] != frame_number:
+            return None
+        return self.slab[slot]
+
+    def __contains__(self, frame_number):
+        return self.frame_numbers[frame_number % self.capacity] == frame_number
+
+    def clear(self):
+        self.frame_numbers.fill(-1)
+
+########## Frame Ring Class ##########
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Optimal frame scoring of the Extractor. A scorer turns the in-window vehicle detections of one frame into
+# scores, and the highest scoring detection of a track is its optimal frame. MidpointScorer is the original
+# rule, closest centre to the midpoint of the lane's optimal range. QualityScorer adds what makes a crop
+# readable downstream:
+#   position    - 1 at the midpoint, 0 at the edge of the lane window,
+#   area        - bounding box area relative to a reference area, at most 1,
+#   aspect      - 1 at the expected width/height ratio, falling off with the log ratio,
+#   truncation  - penalty for a box touching the frame border,
+#   sharpness   - variance of the Laplacian of a downscaled grey crop, as v / (v + sharpnessScale),
+# as the weighted sum of the terms. Sharpness needs pixels, so it is only worked out when the frame is at
+# hand, and only for the detections the sharpness term could still lift above their track's best candidate;
+# the geometric terms are computed for the whole frame at once. Select with frameScoring in config.ini
+# ('midpoint', 'quality' or a 'module:factory' of a custom scorer). See bench_scoring.py for the cost.
+
+import importlib
+
+import cv2
+import numpy as np
+
+def sharpness(frame, left, top, width, height, size=64):
+    # variance of the Laplacian of the crop, downscaled by an integer factor to about size pixels wide; the green
+    # channel stands in for luminance, which works for BGR, RGB and RGBA frames alike. A contiguous single channel
+    # and an integer area factor keep the resize on OpenCV's fast path
+    x1, y1 = max(int(left), 0), max(int(top), 0)
+    x2, y2 = min(int(left + width), frame.shape[1]), min(int(top + height), frame.shape[0])
+    if x2 - x1 < 3 or y2 - y1 < 3:
+        return 0.0
+    crop = np.ascontiguousarray(frame[y1:y2, x1:x2, 1] if frame.ndim == 3 else frame[y1:y2, x1:x2])
+    step = (x2 - x1) // size
+    if step > 1 and (y2 - y1) // step >= 3:
+        crop = cv2.resize(crop, None, fx=1 / step, fy=1 / step, interpolation=cv2.INTER_AREA)
+    _, deviation = cv2.meanStdDev(cv2.Laplacian(crop, cv2.CV_16S))
+    return float(deviation[0, 0]) ** 2
+
+########## Midpoint Scorer Class ##########     # stateless; the original optimal frame rule
+
+class MidpointScorer:
+    needs_frame = False
+
+    def scores(self, windows, vehicles, y_center, lanes, tracks, frame=None):
+        # closer to the midpoint of the lane's optimal range is better
+        return windows.scores(y_center, lanes)
+
+    def score(self, windows, y_center, lane):
+        # one detection; scorers with this method let the Extractor take small frames one detection at a time
+        return -abs(y_center - windows.bands[lane][2])
+
+########## Midpoint Scorer Class ##########
+
+########## Quality Scorer Class ##########     # described by the frame size, the term weights and their reference values, and the sharpness counters
+
+class QualityScorer:
+    def __init__(self, width=1920, height=1080, position=1.0, area=0.5, aspect=0.25, truncation=1.0, sharpness=0.5, reference_area=250 * 250,
+                 aspect_ratio=1.3, edge_margin=2, sharpness_scale=100.0, sharpness_size=64):
+        self.width = width
+        self.height = height
+        self.weights = (position, area, aspect, truncation)
+        self.sharpness_weight = sharpness
+        self.reference_area = reference_area    # box area (pixels) that scores a full area term
+        self.aspect_ratio = aspect_ratio        # expected width / height of a vehicle box
+        self.edge_margin = edge_margin          # pixels from the frame border that count as touching it
+        self.sharpness_scale = sharpness_scale  # Laplacian variance that scores half the sharpness term
+        self.sharpness_size = sharpness_size    # crops are downscaled to this width before the Laplacian
+        self.candidates = 0     # in-window detections scored
+        self.sharpened = 0      # of which needed the sharpness term
+
+    @property
+    def needs_frame(self):
+        return self.sharpness_weight > 0
+
+    def scores(self, windows, vehicles, y_center, lanes, tracks, frame=None):
+        left, top = vehicles['left'].astype(np.float64), vehicles['top'].astype(np.float64)
+        width, height = np.maximum(vehicles['width'], 1).astype(np.float64), np.maximum(vehicles['height'], 1).astype(np.float64)
+        half = np.maximum((windows.y2[lanes] - windows.y1[lanes]) / 2, 1)
+        position = 1 - np.minimum(np.abs(y_center - windows.midpoint[lanes]) / half, 1)
+        area = np.minimum(width * height / self.reference_area, 1)
+        aspect = np.exp(-np.abs(np.log(width / height / self.aspect_ratio)))
+        m = self.edge_margin
+        truncated = (left <= m) | (top <= m) | (left + width >= self.width - m) | (top + height >= self.height - m)
+        w_position, w_area, w_aspect, w_truncation = self.weights
+        score = w_position * position + w_area * area + w_aspect * aspect - w_truncation * truncated
+        self.candidates += len(score)
+        if frame is not None and self.sharpness_weight > 0 and len(score):
+            best = np.fromiter((track.best_score for track in tracks), dtype=np.float64, count=len(tracks))
+            for i in np.flatnonzero(score + self.sharpness_weight > best).tolist():     # the rest cannot win even when perfectly sharp
+                s = sharpness(frame, left[i], top[i], width[i], height[i], self.sharpness_size)
+                score[i] += self.sharpness_weight * s / (s + self.sharpness_scale)
+                self.sharpened += 1
+        return score
+
+    def __repr__(self):
+        return 'QualityScorer(candidates=%d, sharpened=%d)' % (self.candidates, self.sharpened)
+
+########## Quality Scorer Class ##########
+
+def scorer_from_config(config, width=1920, height=1080):
+    # optimal frame scorer named by frameScoring in config.ini
+    spec = config.get('OFEConfig', 'frameScoring', fallback='midpoint')
+    if spec == 'midpoint':
+        return MidpointScorer()
+    if spec == 'quality':
+        return QualityScorer(width, height, config.getfloat('OFEConfig', 'qualityPositionWeight', fallback=1.0), config.getfloat('OFEConfig', 'qualityAreaWeight', fallback=0.5),
+                             config.getfloat('OFEConfig', 'qualityAspectWeight', fallback=0.25), config.getfloat('OFEConfig', 'qualityTruncationWeight', fallback=1.0),
+                             config.getfloat('OFEConfig', 'qualitySharpnessWeight', fallback=0.5), config.getint('OFEConfig', 'qualityReferenceArea', fallback=250 * 250),
+                             config.getfloat('OFEConfig', 'qualityAspectRatio', fallback=1.3), config.getint('OFEConfig', 'qualityEdgeMargin', fallback=2),
+                             config.getfloat('OFEConfig', 'qualitySharpnessScale', fallback=100.0))
+    module, _, factory = spec.partition(':')     # custom scorer; the factory returns an object with needs_frame and scores() like MidpointScorer
+    return getattr(importlib.import_module(module), factory)()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# IoU tracker for runs without nvtracker (ofe_cpu.py, replays of detector output). The boxes of a frame are
+# associated with the live tracks through a NumPy IoU matrix, either greedily from the best overlap down or
+# with the Hungarian method; tracks can be predicted forward with a constant velocity before matching. A track
+# is born tentative and confirmed after a number of matched frames; tracks unmatched for too long die. The
+# output is the (object_id, bbox) stream the probes get from nvtracker, as DETECTION_DTYPE records.
+
+import numpy as np
+
+from detections import DETECTION_DTYPE
+
+ASSOCIATIONS = ('greedy', 'hungarian')
+
+def iou_matrix(a, b):
+    # a (n, 4) and b (m, 4) boxes as left, top, width, height; returns the (n, m) intersection over union
+    a_right = a[:, 0] + a[:, 2]
+    a_bottom = a[:, 1] + a[:, 3]
+    b_right = b[:, 0] + b[:, 2]
+    b_bottom = b[:, 1] + b[:, 3]
+    w = np.minimum(a_right[:, None], b_right[None, :]) - np.maximum(a[:, 0][:, None], b[:, 0][None, :])
+    h = np.minimum(a_bottom[:, None], b_bottom[None, :]) - np.maximum(a[:, 1][:, None], b[:, 1][None, :])
+    inter = np.maximum(w, 0) * np.maximum(h, 0)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+def greedy_assignment(iou, threshold):
+    # pairs (rows, cols) from the best overlap down, each row and column used once; only overlaps >= threshold
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    row_used = np.zeros(iou.shape[0], dtype=bool)
+    col_used = np.zeros(iou.shape[1], dtype=bool)
+    pairs = []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if row_used[r] or col_used[c]:
+            continue
+        row_used[r] = col_used[c] = True
+        pairs.append((r, c))
+    pairs = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+def linear_assignment(cost):
+    # minimum cost assignment of the rows to the columns of cost (n, m) (Hungarian method with potentials,
+    # one augmenting path per row, the column scans vectorized); returns (rows, cols) sorted by row
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)     # row and column potentials; index 0 is the virtual start column
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)      # 1-based row matched to each column, 0 if free
+    way = np.zeros(m + 1, dtype=np.intp)    # previous column on the augmenting path
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improve = ~used[1:] & (reduced < minv[1:])
+            minv[1:][improve] = reduced[improve]
+            way[1:][improve] = j0
+            free_minv = np.where(used[1:], np.inf, minv[1:])
+            j1 = int(np.argmin(free_minv)) + 1
+            delta = free_minv[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:   # augment along the path
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+def hungarian_assignment(iou, threshold):
+    # optimal total overlap; pairs below threshold are discarded. Rows and columns without any overlap
+    # >= threshold cannot be paired and are left out of the assignment problem.
+    candidate = iou >= threshold
+    rows = np.nonzero(candidate.any(axis=1))[0]
+    cols = np.nonzero(candidate.any(axis=0))[0]
+    if not len(rows):
+        return rows, cols
+    sub = iou[np.ix_(rows, cols)]
+    r, c = linear_assignment(np.where(sub >= threshold, 1.0 - sub, 1.0 + 1e-6))
+    keep = sub[r, c] >= threshold
+    return rows[r[keep]], cols[c[keep]]
+
+########## IoU Tracker Class ##########     # described by the association settings, the birth and death thresholds and the live tracks
+
+class IouTracker:
+    def __init__(self, iou_threshold=0.3, max_age=10, min_hits=1, birth_confidence=0.0, association='greedy', predict=False, velocity_smoothing=0.5):
+        if association not in ASSOCIATIONS:
+            raise ValueError("association must be one of %s" % (ASSOCIATIONS,))
+        self.iou_threshold = iou_threshold  # least overlap for a box to continue a track
+        self.max_age = max_age      # death; frames a track survives without a match
+        self.min_hits = min_hits    # birth; matched frames before a track is confirmed and reported
+        self.birth_confidence = birth_confidence    # least detection confidence to start a track
+        self.assign = greedy_assignment if association == 'greedy' else hungarian_assignment
+        self.predict = predict      # match against the boxes moved on with the track velocity
+        self.velocity_smoothing = velocity_smoothing    # weight of the previous velocity estimate
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.uint64)
+        self.class_ids = np.zeros(0, dtype=np.int32)
+        self.boxes = np.zeros((0, 4), dtype=np.float64)     # last matched box
+        self.velocity = np.zeros((0, 4), dtype=np.float64)  # box change per frame
+        self.age = np.zeros(0, dtype=np.int32)      # frames since the last match
+        self.hits = np.zeros(0, dtype=np.int32)     # matched frames
+        self.confirmed = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predicted(self):
+        # boxes of the live tracks in the coming frame
+        if not self.predict:
+            return self.boxes
+        return self.boxes + self.velocity * (self.age + 1)[:, None]
+
+    def update(self, boxes, class_id=0, confidence=None):
+        # boxes (n, 4) as left, top, width, height, with a class id and confidence per box or for all; returns the
+        # DETECTION_DTYPE records of the boxes of confirmed tracks, in box order, with their tracking ids
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        n = len(boxes)
+        class_ids = np.broadcast_to(np.asarray(class_id, dtype=np.int32), (n,))
+        confidences = np.broadcast_to(np.asarray(1.0 if confidence is None else confidence, dtype=np.float32), (n,))
+        track_of = np.full(n, -1, dtype=np.intp)    # index of the matched track per box
+        matched = np.zeros(len(self.ids), dtype=bool)
+        if n and len(self.ids):
+            iou = iou_matrix(self.predicted(), boxes)
+            iou[self.class_ids[:, None] != class_ids[None, :]] = 0.0     # no association across classes
+            rows, cols = self.assign(iou, self.iou_threshold)
+            track_of[cols] = rows
+            matched[rows] = True
+            if self.predict:
+                observed = (boxes[cols] - self.boxes[rows]) / (self.age[rows] + 1)[:, None]
+                first = self.hits[rows] == 1    # no velocity estimate yet
+                s = np.where(first, 0.0, self.velocity_smoothing)[:, None]
+                self.velocity[rows] = s * self.velocity[rows] + (1 - s) * observed
+            self.boxes[rows] = boxes[cols]
+            self.hits[rows] += 1
+        self.age[matched] = 0
+        self.age[~matched] += 1
+        self.confirmed |= self.hits >= self.min_hits
+        ids = np.zeros(n, dtype=np.uint64)
+        emitted = track_of >= 0
+        ids[emitted] = self.ids[track_of[emitted]]
+        emitted[emitted] = self.confirmed[track_of[emitted]]
+        alive = (self.age <= self.max_age) & (self.confirmed | (self.age == 0))    # tentative tracks die on their first miss
+        self._keep(alive)
+        born = (track_of < 0) & (confidences >= self.birth_confidence)
+        k = int(born.sum())
+        if k:       # unmatched boxes start new tracks
+            ids[born] = np.arange(self.next_id, self.next_id + k, dtype=np.uint64)
+            self.next_id += k
+            self.ids = np.concatenate((self.ids, ids[born]))
+            self.class_ids = np.concatenate((self.class_ids, class_ids[born]))
+            self.boxes = np.concatenate((self.boxes, boxes[born]))
+            self.velocity = np.concatenate((self.velocity, np.zeros((k, 4))))
+            self.age = np.concatenate((self.age, np.zeros(k, dtype=np.int32)))
+            self.hits = np.concatenate((self.hits, np.ones(k, dtype=np.int32)))
+            confirmed = np.full(k, self.min_hits <= 1)
+            self.confirmed = np.concatenate((self.confirmed, confirmed))
+            emitted[born] = confirmed
+        detections = np.zeros(int(emitted.sum()), dtype=DETECTION_DTYPE)
+        detections['class_id'] = class_ids[emitted]
+        detections['object_id'] = ids[emitted]
+        detections['left'] = boxes[emitted, 0]
+        detections['top'] = boxes[emitted, 1]
+        detections['width'] = boxes[emitted, 2]
+        detections['height'] = boxes[emitted, 3]
+        detections['confidence'] = confidences[emitted]
+        return detections
+
+    def _keep(self, alive):
+        self.ids, self.class_ids, self.boxes = self.ids[alive], self.class_ids[alive], self.boxes[alive]
+        self.velocity, self.age, self.hits, self.confirmed = self.velocity[alive], self.age[alive], self.hits[alive], self.confirmed[alive]
+
+########## IoU Tracker Class ##########
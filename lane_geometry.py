@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Lane geometry for the DeepStream buffer probes. The lane boundaries of the road configuration are
+# polylines in frame coordinates; they are rasterized once into a lane id per pixel (or per scale x scale
+# block), so assigning a lane to a bounding box centre is a single array index, and a whole frame of
+# detections is classified with one fancy-indexing call. The lane id of a point is the number of boundaries
+# to its left, following the slant of every boundary. LaneWindows is the per-lane optimal range [y1, y2] and
+# midpoint table indexed by those lane ids, for filtering and scoring a frame of detections at once.
+
+import numpy as np
+
+########## Lane Map Class ##########     # described by the lane boundary polylines, the frame size and the lane id raster
+
+class LaneMap:
+    def __init__(self, boundaries, width, height, scale=4, max_lane=None):
+        # boundaries: one polyline per lane boundary, from the leftmost; [(x, y), ...] with at least two points
+        self.boundaries = [np.asarray(b, dtype=np.float64).reshape(-1, 2) for b in boundaries]
+        self.width = width
+        self.height = height
+        self.scale = scale      # raster resolution; one lane id per scale x scale pixel block
+        self.max_lane = len(self.boundaries) if max_lane is None else max_lane    # lane ids above this are clipped to it
+        rows = (height + scale - 1) // scale
+        cols = (width + scale - 1) // scale
+        ys = (np.arange(rows) + 0.5) * scale    # block centres
+        xs = (np.arange(cols) + 0.5) * scale
+        self.raster = np.zeros((rows, cols), dtype=np.int8)
+        for b in self.boundaries:
+            order = np.argsort(b[:, 1])
+            boundary_x = np.interp(ys, b[order, 1], b[order, 0])   # boundary x of every raster row; constant beyond the end points
+            self.raster += xs[np.newaxis, :] > boundary_x[:, np.newaxis]
+        np.minimum(self.raster, self.max_lane, out=self.raster)
+
+    def lane(self, x, y):
+        # lane id of one point
+        row = min(max(int(y) // self.scale, 0), self.raster.shape[0] - 1)
+        col = min(max(int(x) // self.scale, 0), self.raster.shape[1] - 1)
+        return int(self.raster[row, col])
+
+    def lanes(self, x, y):
+        # lane ids of arrays of points
+        rows = np.asarray(y, dtype=np.int64) // self.scale
+        cols = np.asarray(x, dtype=np.int64) // self.scale
+        np.minimum(np.maximum(rows, 0, out=rows), self.raster.shape[0] - 1, out=rows)    # points off the frame take the lane of the nearest edge
+        np.minimum(np.maximum(cols, 0, out=cols), self.raster.shape[1] - 1, out=cols)
+        return self.raster[rows, cols]
+
+    @property
+    def nbytes(self):
+        return self.raster.nbytes
+
+########## Lane Map Class ##########
+
+########## Lane Windows Class ##########     # described by the optimal range and midpoint of every lane id
+
+class LaneWindows:
+    def __init__(self, y1, y2, midpoint):
+        # one value per lane id, from 0 to the largest lane id of the LaneMap
+        self.y1 = np.asarray(y1, dtype=np.int32)
+        self.y2 = np.asarray(y2, dtype=np.int32)
+        self.midpoint = np.asarray(midpoint, dtype=np.int32)
+        self.low = int(self.y1.min())   # union of the lane windows; a scalar prefilter before the lane lookup
+        self.high = int(self.y2.max())
+        self.single = bool((self.y1 == self.y1[0]).all() and (self.y2 == self.y2[0]).all() and (self.midpoint == self.midpoint[0]).all())  # one window for every lane
+        self.bands = list(zip(self.y1.tolist(), self.y2.tolist(), self.midpoint.tolist()))     # (y1, y2, midpoint) by lane id as plain ints, for one detection at a time
+
+    @classmethod
+    def uniform(cls, road, max_lane):
+        # every lane uses the optimal range of the road, as before per-lane windows
+        lanes = max_lane + 1
+        return cls([road.y1] * lanes, [road.y2] * lanes, [road.midpoint] * lanes)
+
+    @classmethod
+    def from_records(cls, road, max_lane, records):
+        # lane window records of the server API, {'lane', 'y1', 'y2', 'midpoint'} as strings; lanes without a record use the road's
+        windows = cls.uniform(road, max_lane)
+        for record in records:
+            lane = int(record['lane'])
+            if 0 <= lane <= max_lane:
+                windows.y1[lane], windows.y2[lane], windows.midpoint[lane] = int(record['y1']), int(record['y2']), int(record['midpoint'])
+        return cls(windows.y1, windows.y2, windows.midpoint)
+
+    def inside(self, top, lane_ids):
+        # mask of the detections whose top lies in the optimal range of their lane
+        return (top >= self.y1[lane_ids]) & (top <= self.y2[lane_ids])
+
+    def scores(self, y_center, lane_ids):
+        # optimal frame score of every detection; closer to the midpoint of its lane is better
+        if self.single:
+            return -np.abs(y_center - int(self.midpoint[0]))
+        return -np.abs(y_center - self.midpoint[lane_ids])
+
+    def __repr__(self):
+        return 'LaneWindows(%s)' % ', '.join('%d: [%d, %d] @ %d' % (lane, y1, y2, m) for lane, (y1, y2, m) in enumerate(zip(self.y1.tolist(), self.y2.tolist(), self.midpoint.tolist())))
+
+########## Lane Windows Class ##########
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Per-frame track lifecycle stage for the DeepStream buffer probes. Every live track has one entry in a
+# min-heap keyed on the frame it was last seen in, so a sweep only touches the tracks that may have gone
+# stale and finalizes or drops all of them in one pass. Entries are re-keyed lazily: when a popped entry
+# turns out to be older than the track's real last frame it is pushed back with the newer frame number.
+
+import heapq
+
+FINALIZE = 'finalize'   # tracked long enough; extract the optimal frame
+RECTIFY = 'rectify'     # too few frames in the train; false tracking instance
+EXPIRE = 'expire'       # stale for too long; the optimal frame is no longer usable
+
+########## Track Lifecycle Class ##########     # described by the expiry thresholds and one heap of (last seen frame, tracking id) per source
+
+class TrackLifecycle:
+    def __init__(self, finalize_after=20, expire_after=100, min_frames=6):
+        self.finalize_after = finalize_after    # frames without a detection before a track is resolved
+        self.expire_after = expire_after    # frames without a detection after which a track is dropped instead of finalized
+        self.min_frames = min_frames    # vehicle count rectifier; tracks with this many frames or fewer are dropped
+        self._heaps = {}
+
+    def seen(self, track):
+        # register a track on its first detection; later detections are picked up lazily by sweep()
+        if len(track) == 1:
+            heapq.heappush(self._heaps.setdefault(track.source, []), (track.last_frame, track.vehicle_id))
+
+    def verdict(self, track, frame_lag):
+        if len(track) <= self.min_frames:
+            return RECTIFY
+        if frame_lag >= self.expire_after:
+            return EXPIRE
+        return FINALIZE
+
+    def sweep(self, store, source, frame_number):
+        # retire every track of the source not seen for more than finalize_after frames; returns [(track, verdict)]
+        resolved = []
+        heap = self._heaps.get(source)
+        if not heap:
+            return resolved
+        limit = frame_number - self.finalize_after
+        while heap and heap[0][0] < limit:
+            last_seen, object_id = heapq.heappop(heap)
+            track = store.lookup(source, object_id)
+            if track is None:       # already retired
+                continue
+            if track.last_frame > last_seen:    # seen again since the entry was pushed; re-key it
+                heapq.heappush(heap, (track.last_frame, object_id))
+                continue
+            store.retire(source, object_id)
+            resolved.append((track, self.verdict(track, frame_number - last_seen)))
+        return resolved
+
+    def drain(self, store, source=None):
+        # end of stream; resolve every remaining track as if it had just gone stale
+        resolved = []
+        for track in store.tracks(source):
+            store.retire(track.source, track.vehicle_id)
+            resolved.append((track, RECTIFY if len(track) <= self.min_frames else FINALIZE))
+        if source is None:
+            self._heaps.clear()
+        else:
+            self._heaps.pop(source, None)
+        return resolved
+
+########## Track Lifecycle Class ##########
@@ -1,6 +1,7 @@
 from flask import Flask 
 from flask_restful import Api, Resource, reqparse, abort, fields, marshal_with
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 
 app = Flask(__name__)
 api = Api(app)
@@ -12,7 +13,7 @@ class VehicleModel(db.Model):
 	frame_number = db.Column(db.String(10), nullable=False)
 	lane = db.Column(db.String(10), nullable=False)
 	datetime = db.Column(db.String(30), nullable=False)
-	image_path = db.Column(db.String(100), nullable=False)
+	image_path = db.Column(db.String(200), nullable=False)	# crop file path, or 'pack:<pack path>:<offset>:<length>' locator
 
 	def __repr__(self):
 		return f"Vehicle(frame_number = {frame_number}, lane = {lane}, datetime = {datetime}, image_path = {image_path})"
@@ -51,6 +52,18 @@ class RoadModel(db.Model):
 	def __repr__(self):
 		return f"Road(x11 = {x11}, x12 = {x12}, x13 = {x13}, x14 = {x14}, x21 = {x21}, x22 = {x22}, x23 = {x23}, x24 = {x24}, y11 = {y11}, y22 = {y22}, y1 = {y1}, y2 = {y2})"
 
+class LaneWindowModel(db.Model):	# optimal range and midpoint of one lane of a road; lanes without one use y1 and y2 of the road
+	id = db.Column(db.Integer, primary_key=True)
+	road_id = db.Column(db.Integer, nullable=False, index=True)
+	lane = db.Column(db.Integer, nullable=False)	# lane id, from the leftmost
+	y1 = db.Column(db.String(10), nullable=False)
+	y2 = db.Column(db.String(10), nullable=False)
+	midpoint = db.Column(db.String(10), nullable=False)
+	__table_args__ = (db.UniqueConstraint('road_id', 'lane'),)	# at most one window per lane of a road
+
+	def __repr__(self):
+		return f"LaneWindow(road_id = {road_id}, lane = {lane}, y1 = {y1}, y2 = {y2}, midpoint = {midpoint})"
+
 db.create_all()
 
 vehicle_put_args = reqparse.RequestParser()
@@ -101,6 +114,11 @@ radar_resource_fields = {
 	'location': fields.String
 }
 
+lane_window_put_args = reqparse.RequestParser()
+lane_window_put_args.add_argument("y1", type=str, help="y1 required", required=True)
+lane_window_put_args.add_argument("y2", type=str, help="y2 required", required=True)
+lane_window_put_args.add_argument("midpoint", type=str, help="midpoint required", required=True)
+
 road_resource_fields = {
 	'id': fields.Integer,
 	'x11': fields.String,
@@ -117,6 +135,14 @@ road_resource_fields = {
 	'y2': fields.String
 }
 
+lane_window_resource_fields = {
+	'road_id': fields.Integer,
+	'lane': fields.Integer,
+	'y1': fields.String,
+	'y2': fields.String,
+	'midpoint': fields.String
+}
+
 class Vehicle(Resource):
 	@marshal_with(vehicle_resource_fields)
 	def get(self, vehicle_id):
@@ -228,10 +254,65 @@ class Road(Resource):
 		db.session.commit()
 		return result
 
+class LaneWindow(Resource):
+	@marshal_with(lane_window_resource_fields)
+	def get(self, road_id, lane):
+		result = LaneWindowModel.query.filter_by(road_id=road_id, lane=lane).first()
+		if not result:
+			abort(404, message="Could not find a window for that lane")
+		return result
+
+	@marshal_with(lane_window_resource_fields)
+	def put(self, road_id, lane):
+		args = lane_window_put_args.parse_args()
+		result = LaneWindowModel.query.filter_by(road_id=road_id, lane=lane).first()
+		if result:
+			abort(409, message="Lane window taken...")
+		window = LaneWindowModel(road_id=road_id, lane=lane, y1=args['y1'], y2=args['y2'], midpoint=args['midpoint'])
+		db.session.add(window)
+		try:
+			db.session.commit()
+		except IntegrityError:	# a concurrent PUT of the same lane won
+			db.session.rollback()
+			abort(409, message="Lane window taken...")
+		return window, 201
+
+	@marshal_with(lane_window_resource_fields)
+	def patch(self, road_id, lane):
+		args = lane_window_put_args.parse_args()
+		result = LaneWindowModel.query.filter_by(road_id=road_id, lane=lane).first()
+		if not result:
+			abort(404, message="Lane window does not exist, cannot update...")
+
+		if args['y1']:
+			result.y1 = args['y1']
+		if args['y2']:
+			result.y2 = args['y2']
+		if args['midpoint']:
+			result.midpoint = args['midpoint']
+
+		db.session.commit()
+		return result
+
+	def delete(self, road_id, lane):
+		result = LaneWindowModel.query.filter_by(road_id=road_id, lane=lane).first()
+		if not result:
+			abort(404, message="Could not find a window for that lane")
+		db.session.delete(result)
+		db.session.commit()
+		return '', 204
+
+class LaneWindows(Resource):
+	@marshal_with(lane_window_resource_fields)
+	def get(self, road_id):
+		return LaneWindowModel.query.filter_by(road_id=road_id).order_by(LaneWindowModel.lane).all()	# every lane window of the road, possibly none
+
 api.add_resource(Vehicle, "/vehicle/<int:vehicle_id>")
 api.add_resource(ALPR, "/plate/<int:plate_id>")
 api.add_resource(Radar, "/radar/<int:radar_id>")
 api.add_resource(Road, "/road/<int:road_id>")
+api.add_resource(LaneWindows, "/road/<int:road_id>/lanes")
+api.add_resource(LaneWindow, "/road/<int:road_id>/lane/<int:lane>")
 
 if __name__ == "__main__":
 	app.run(debug=True)
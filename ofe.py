@@ -22,8 +22,6 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-import requests
-from datetime import datetime
 import sys
 sys.path.append('../')
 import gi
@@ -35,10 +33,23 @@ from ctypes import *
 import time
 import sys
 import math
+import signal
 import platform
 from common.is_aarch_64 import is_aarch64
 from common.bus_call import bus_call
 from common.FPS import GETFPS
+from frame_ring import FrameRing
+from roi_buffer import RoiBuffer
+from lifecycle import TrackLifecycle
+from vehicle_output import VehicleOutput, fetch_lane_windows, fetch_road
+from stage_timing import StageTimer
+from source_state import Road, SourceState
+from lane_geometry import LaneMap
+from detections import DetectionBuffer, class_counts, select, walk_vehicles
+from extractor import Extractor, LANE_NAMES
+from frame_scoring import scorer_from_config
+from fragments import linker_from_config
+from recording import DetectionRecorder
 import numpy as np
 import pyds
 import cv2
@@ -46,8 +57,6 @@ import os
 import os.path
 from os import path
 fps_streams={}
-frame_count={}
-saved_count={}
 global PGIE_CLASS_ID_VEHICLE
 PGIE_CLASS_ID_VEHICLE=0
 global PGIE_CLASS_ID_PERSON
@@ -68,76 +77,40 @@ TILED_OUTPUT_HEIGHT=1080
 GST_CAPS_FEATURES_NVMM="memory:NVMM"
 pgie_classes_str= ["Vehicle", "TwoWheeler", "Person","RoadSign"]
 
-road = []   # list to obtain parameters initialized in 'road.txt'
-par = []    # list to split parameters in road[]
-f = open('road.txt', 'r')
-road = f.readlines()
-for r in road:
-    temp = r.split()
-    par.append(int(temp[1]))
-
-x11 = par[0]    # leftmost 'vertical' segment top; lane is to the left of segment
-x12 = par[1]    # second lane from the left 'vertical' segment top
-x13 = par[2]    # third lane from the left 'vertical' segment top
-x14 = par[3]    # last lane from the left 'vertical' segment top
-x21 = par[4]    # leftmost 'vertical' segment bottom
-x22 = par[5]    # second lane from the left 'vertical' segment bottom
-x23 = par[6]    # third lane from the left 'vertical' segment bottom
-x24 = par[7]    # rightmost 'vertical' segment bottom
-y11 = par[8]    # lane top y; for all lanes
-y22 = par[9]    # lane bottom y; for all lanes
-y1 = par[10]    # optimal range filter start 
-y2 = par[11]    # optimal range filter end 
-
-vehicle_list = []   # vehicle bounding box metadata buffer
-rgb_frames_list = []    # video stream image metadata buffer
-vehicle_count = 0   # total vehicles detected in stream
-
-########## Vehicle Class ##########     # vehicle_list[] object class; described by the vehicle's tracking id, the number of frames it is tracked for, the coordinates of its bounding boxes and the lane it is tracked in
-
-class Vehicle:
-    def __init__(self, vehicle_id, frames_list=[], x_list=[], y_list=[], xc_list=[], yc_list=[], width_list=[], height_list=[], lane_list=[]):
-        self.vehicle_id = vehicle_id
-        self.frames_list = frames_list
-        self.x_list = x_list
-        self.y_list = y_list
-        self.xc_list = xc_list
-        self.yc_list = yc_list
-        self.width_list = width_list
-        self.height_list = height_list
-        self.lane_list = lane_list
-
-########## Vehicle Class ##########
-        
-########## RGB Frame Class ##########       # rgb_frames_list[] object class; described by the frame number and the pixel matrix of the frame
-
-class RGB_Frame:
-    def __init__(self, frame_iterator, rgb_image):
-        self.frame_iterator = frame_iterator
-        self.rgb_image = rgb_image
-
-########## RGB Frame Class ##########
-
-response = requests.get(BASE + "road/1")
-x11 = int(response.json()['x11'])
-x12 = int(response.json()['x12'])
-x13 = int(response.json()['x13']) 
-x14 = int(response.json()['x14']) 
-x21 = int(response.json()['x21'])   
-x22 = int(response.json()['x22'])   
-x23 = int(response.json()['x23'])
-x24 = int(response.json()['x24'])   
-y11 = int(response.json()['y11'])   
-y22 = int(response.json()['y22'])  
-y1 = int(response.json()['y1'])   
-y2 = int(response.json()['y2'])   
+default_road = Road.from_file('road.txt')    # road configuration; lane boundary segments and optimal range filter, fields as in 'road.txt'
+
+detection_buffer = DetectionBuffer()   # object metadata of the current frame; reused by every frame
+
+ofe_config = configparser.ConfigParser()     # frame extractor settings in 'config.ini'
+ofe_config.read('config.ini')
+ring_frames = ofe_config.getint('OFEConfig', 'ringFrames', fallback=120)
+ring_megabytes = ofe_config.getfloat('OFEConfig', 'ringMegabytes', fallback=0)
+capture_mode = ofe_config.get('OFEConfig', 'captureMode', fallback='frame')    # 'frame' buffers whole frames, 'roi' buffers vehicle crops only
+roi_padding = ofe_config.getint('OFEConfig', 'roiPadding', fallback=0)
+lane_raster_scale = ofe_config.getint('OFEConfig', 'laneRasterScale', fallback=4)
+roi_buffer = RoiBuffer(roi_padding) if capture_mode == 'roi' else None    # vehicle crop buffer; crops of the vehicles inside the optimal range, keyed by source
+verbose = ofe_config.getboolean('OFEConfig', 'verbose', fallback=True)     # per-detection and per-frame prints; these cost milliseconds per frame
+stage_timer = StageTimer(samples=ofe_config.getint('OFEConfig', 'timingSamples', fallback=4096), report_seconds=ofe_config.getfloat('OFEConfig', 'timingReportSeconds', fallback=60))     # per-stream latency histograms of the probe stages
+vehicle_lifecycle = TrackLifecycle(ofe_config.getint('OFEConfig', 'finalizeAfter', fallback=20), ofe_config.getint('OFEConfig', 'expireAfter', fallback=100),
+                                   ofe_config.getint('OFEConfig', 'minTrainFrames', fallback=6))      # track expiry stage; tracks keyed on the frame they were last seen in
+
+default_road = fetch_road(BASE, 1, default_road)
+vehicle_output = VehicleOutput(ofe_config, BASE)     # event log, crop encoder and storage, server database; off the streaming thread
+
+frame_scorer = scorer_from_config(ofe_config, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT)     # optimal frame scoring; 'quality' also looks at the pixels of the candidates
+extractor = Extractor(vehicle_lifecycle, vehicle_output.submit, LANE_NAMES, roi_buffer, vehicle_output.extension, verbose, scorer=frame_scorer,
+                      linker=linker_from_config(ofe_config), batch_threshold=ofe_config.getint('OFEConfig', 'batchThreshold', fallback=32))   # tracks, optimal frame candidates and per-source state; finalized vehicles go to the output stage
+walk_threshold = ofe_config.getint('OFEConfig', 'walkThreshold', fallback=256)     # frames with fewer objects skip the record array; see walk_vehicles()
+record_path = ofe_config.get('OFEConfig', 'recordDetections', fallback='')
+recorder = DetectionRecorder(record_path) if record_path else None     # per-frame detections for offline replay (see replay.py)
+
+def print_stage_latency():
+    print("Probe stage latency:\n" + stage_timer.report())
+    return True     # keep the signal source installed
 
 # tiler_sink_pad_buffer_probe  will extract metadata received on tiler src pad
 # and update params for drawing rectangle, object information etc.
 def tiler_sink_pad_buffer_probe(pad,info,u_data):
-    global x11, x12, x13, x14, x21, x22, x23, x24
-    global y11, y22, y1, y2
-    global vehicle_count
     frame_number=0
     num_rects=0
     gst_buffer = info.get_buffer()
@@ -163,145 +136,52 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
         except StopIteration:
             break
 
+        t_frame = time.perf_counter()      # stage timing; metadata walk, track update, lifecycle sweep, output enqueue, display meta, frame capture
+        frame_time = time.time()
+        n_frame = None     # surface of this frame; mapped on first use, never carried over from the previous frame of the batch
+        state = extractor.sources[frame_meta.pad_index]   # everything below is partitioned by source
+        road = state.road
         frame_number=frame_meta.frame_num
-        l_obj=frame_meta.obj_meta_list
         num_rects = frame_meta.num_obj_meta
-        obj_counter = {
-        PGIE_CLASS_ID_VEHICLE:0,
-        PGIE_CLASS_ID_PERSON:0,
-        PGIE_CLASS_ID_BICYCLE:0,
-        PGIE_CLASS_ID_ROADSIGN:0
-        }
-        while l_obj is not None:
-            try: 
-                # Casting l_obj.data to pyds.NvDsObjectMeta
-                obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
-                if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:  # vehicle detected
-                    if obj_meta.rect_params.top >= y1 and obj_meta.rect_params.top <= y2:   # optimal range filter
-                        car_found = 0   # vehicle id flag
-                        for x in vehicle_list:
-                            if x.vehicle_id == obj_meta.object_id:      # vehicle metadata lists are already initialized in vehicle_list
-                                x.frames_list.append(frame_number)
-                                x.x_list.append(obj_meta.rect_params.left)
-                                x.y_list.append(obj_meta.rect_params.top)
-                                x.xc_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                                x.yc_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                                x.width_list.append(obj_meta.rect_params.width)
-                                x.height_list.append(obj_meta.rect_params.height)
-                                x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                                if x_center > min(x13, x23):
-                                    x.lane_list.append('shoulder')
-                                elif x_center > min(x12, x22):
-                                    x.lane_list.append('slow')
-                                elif x_center > min(x11, x21):
-                                    x.lane_list.append('medium')
-                                else:
-                                    x.lane_list.append('fast')
-                                car_found = 1   # vehicle metadata lists were already initialized in vehicle_list
-                                break
-                            
-                        if car_found == 0:      # vehicle metadata lists are not initialized in vehicle_list
-                            frames_temp_list = []
-                            frames_temp_list.append(frame_number)
-                            x_temp_list = []
-                            x_temp_list.append(obj_meta.rect_params.left)
-                            y_temp_list = []
-                            y_temp_list.append(obj_meta.rect_params.top)
-                            xc_temp_list = []
-                            xc_temp_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                            yc_temp_list = []
-                            yc_temp_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                            width_temp_list = []
-                            width_temp_list.append(obj_meta.rect_params.width)
-                            height_temp_list = []
-                            height_temp_list.append(obj_meta.rect_params.height)
-                            x_center = int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2))
-                            lane_temp_list = []
-                            if x_center > min(x13, x23):
-                                lane_temp_list.append('shoulder')
-                            elif x_center > min(x12, x22):
-                                lane_temp_list.append('slow')
-                            elif x_center > min(x11, x21):
-                                lane_temp_list.append('medium')
-                            else:
-                                lane_temp_list.append('fast')
-                                
-                            vehicle_list.append(Vehicle(obj_meta.object_id, frames_temp_list, x_temp_list, y_temp_list, xc_temp_list, yc_temp_list, width_temp_list, height_temp_list, lane_temp_list))     # initialize vehicle metadata lists
-                        
-                    print('Vehicle ID = ', obj_meta.object_id, ', Frame Number = ', frame_number, ', Top X = ', obj_meta.rect_params.left,', Top Y = ', obj_meta.rect_params.top, ', Width = ', obj_meta.rect_params.width, ', Height = ', obj_meta.rect_params.height)     # show metadata of vehicle detection instance
-
-                    for i, o in enumerate(vehicle_list):        
-                        frame_lag = abs(int(o.frames_list[-1]) - int(frame_number))     # how far behind is the vehicle object; usually, a difference at least two frames signifies a stop or break in tracking activity
-                        if (frame_lag > 20) and int(len(o.frames_list)) <= 6:   # vehicle count rectifier; eliminates false tracking instances, i.e., ones not tracked long enough for conclusive tracking train resolution
-                            print('inadequate number of frames in train, deleting...', '\n')
-                            del vehicle_list[i]
-                            break
-                        
-                        if frame_lag > 20 and frame_lag < 100:      # optimal frame extractor...the business end
-                            vehicle_count += 1
-                            midpoint = int((y1 + y2) / 2)       # reference point of optimality
-                            my_array = np.array(o.yc_list)
-                            pos = (np.abs(my_array - midpoint)).argmin()    # position of frame - in the vehicle object y coordinates list - closest to the midpoint of optimal range
-                            temp_frame_number = o.frames_list[pos]
-                            temp_id = o.vehicle_id
-                            now = datetime.now()
-                            dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
-                            image_path = folder_name+"/stream_"+str(0)+"/numb_frno_trid="+str(vehicle_count)+'_'+str(temp_frame_number)+'_'+str(temp_id)+".jpg"
-                            response = requests.put(BASE + "vehicle/" + str(o.vehicle_id), {"frame_number": str(o.frames_list[pos]), "lane": str(o.lane_list[pos]), "datetime": str(dt_string), "image_path": str(image_path)})     # add to server database
-                            print(response.json())
-                            with open('optimal_frame_extraction.txt', 'a') as the_file:
-                                the_file.write(str(o.frames_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(o.vehicle_id))
-                                the_file.write(' ')
-                                the_file.write(str(o.width_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(o.height_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(o.x_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(o.y_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(o.lane_list[pos]))
-                                the_file.write(' ')
-                                the_file.write(str(dt_string))
-                                the_file.write('\n')
-                            xx1 = int(o.x_list[pos])
-                            xx2 = int(o.x_list[pos]) + int(o.width_list[pos])
-                            yy1 = int(o.y_list[pos])
-                            yy2 = int(o.y_list[pos]) + int(o.height_list[pos])
-                            del vehicle_list[i]
-                            finder = 0
-                            for f in rgb_frames_list:
-                                if f.frame_iterator == temp_frame_number:
-                                    break
-                                else:
-                                    finder += 1
-                            crop = (rgb_frames_list[finder].rgb_image)[yy1:yy2, xx1:xx2]    # crop the part of the frame bounding the vehicle
-                            cv2.imwrite(folder_name+"/stream_"+str(0)+"/numb_frno_trid="+str(vehicle_count)+'_'+str(temp_frame_number)+'_'+str(temp_id)+".jpg", crop)
-                            break
-                            
-                        if frame_lag > 100:     # vehicle buffer cleaner; eliminates expired tracking instances
-                            print('train expired, deleting...', '\n')
-                            del vehicle_list[i]
-                            break
-                                       
-            except StopIteration:
-                break
-            obj_counter[obj_meta.class_id] += 1
-            
-            try: 
-                l_obj=l_obj.next
-            except StopIteration:
-                break
-
-        print("Frame Number =", frame_number, "Number of Objects in frame =",num_rects,"Vehicles in frame =",obj_counter[PGIE_CLASS_ID_VEHICLE],"Total Vehicles Detected =",vehicle_count)      # metadata overlay
+        if num_rects < walk_threshold and recorder is None and not verbose and not extractor.batched(0):    # small frame; only the vehicles in the lane windows are read, one at a time
+            obj_counter, vehicles = walk_vehicles(frame_meta.obj_meta_list, pyds.NvDsObjectMeta.cast, PGIE_CLASS_ID_VEHICLE, state.windows.low, state.windows.high)
+            t_walk = time.perf_counter()
+            frame_detections = extractor.update_vehicles(state, frame_number, vehicles)     # new best candidates in this frame for 'roi' capture; (tracking id, left, top, width, height)
+        else:
+            detections = detection_buffer.gather(frame_meta.obj_meta_list, pyds.NvDsObjectMeta.cast)    # object metadata of the frame, walked once into a record array
+            obj_counter = class_counts(detections)
+            if recorder is not None:
+                recorder.write(frame_meta.pad_index, frame_number, frame_meta.buf_pts, frame_time, detections)
+            t_walk = time.perf_counter()
+
+            # per-lane optimal range filter, centres, lanes, scores and track updates of all the vehicles in the frame at once
+            n_frame = pyds.get_nvds_buf_surface(hash(gst_buffer),frame_meta.batch_id) if frame_scorer.needs_frame else None    # candidate pixels for the sharpness term
+            frame_detections = extractor.update(state, frame_number, detections, n_frame)     # new best candidates in this frame for 'roi' capture; (tracking id, left, top, width, height)
+            if verbose:
+                for _, object_id, left, top, width, height, _ in select(detections, PGIE_CLASS_ID_VEHICLE).tolist():
+                    print('Vehicle ID = ', object_id, ', Frame Number = ', frame_number, ', Top X = ', left,', Top Y = ', top, ', Width = ', width, ', Height = ', height)     # show metadata of vehicle detection instance
+        t_track = time.perf_counter()
+        stage_timer.record(frame_meta.pad_index, 'metadata', t_walk - t_frame)
+        stage_timer.record(frame_meta.pad_index, 'track', t_track - t_walk)
+
+        # track lifecycle; every track of this stream that went stale is finalized or dropped in one pass
+        resolved = vehicle_lifecycle.sweep(extractor.store, frame_meta.pad_index, frame_number)
+        t_sweep = time.perf_counter()
+        for o, verdict in resolved:
+            extractor.resolve(o, verdict, frame_time)
+        t_output = time.perf_counter()
+        stage_timer.record(frame_meta.pad_index, 'sweep', t_sweep - t_track)
+        stage_timer.record(frame_meta.pad_index, 'output', t_output - t_sweep)
+
+        if verbose:
+            print("Frame Number =", frame_number, "Number of Objects in frame =",num_rects,"Vehicles in frame =",obj_counter[PGIE_CLASS_ID_VEHICLE],"Total Vehicles Detected =",state.vehicle_count)      # metadata overlay
         # Get frame rate through this probe
         fps_streams["stream{0}".format(frame_meta.pad_index)].get_fps()
         #if save_image:
         #    cv2.imwrite(folder_name+"/stream_"+str(frame_meta.pad_index)+"/frame_"+str(frame_number)+".jpg",frame_image)
         #saved_count["stream_"+str(frame_meta.pad_index)]+=1 
         
+        t_display = time.perf_counter()
         # Acquiring a display meta object. The memory ownership remains in
         # the C code so downstream plugins can still access it. Otherwise
         # the garbage collector will claim it when this probe function exits.
@@ -313,7 +193,7 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
         # memory will not be claimed by the garbage collector.
         # Reading the display_text field here will return the C address of the
         # allocated string. Use pyds.get_string() to get the string content.
-        py_nvosd_text_params.display_text = "Frame Number={} Number of Objects={} Vehicle_count={} Total Vehicles Detected={}".format(frame_number, num_rects, obj_counter[PGIE_CLASS_ID_VEHICLE], vehicle_count)
+        py_nvosd_text_params.display_text = "Frame Number={} Number of Objects={} Vehicle_count={} Total Vehicles Detected={}".format(frame_number, num_rects, obj_counter[PGIE_CLASS_ID_VEHICLE], state.vehicle_count)
 
         # Now set the offsets where the string should appear
         py_nvosd_text_params.x_offset = 10
@@ -330,69 +210,72 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
         # set(red, green, blue, alpha); set to Black
         py_nvosd_text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
         # Using pyds.get_string() to get display_text as string
-        print(pyds.get_string(py_nvosd_text_params.display_text))
+        if verbose:
+            print(pyds.get_string(py_nvosd_text_params.display_text))
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
         
         # Draw x11_x21
         py_nvosd_line_params = display_meta.line_params[0]
-        py_nvosd_line_params.x1 = x11
-        py_nvosd_line_params.y1 = y11
-        py_nvosd_line_params.x2 = x21
-        py_nvosd_line_params.y2 = y22
+        py_nvosd_line_params.x1 = road.x11
+        py_nvosd_line_params.y1 = road.y11
+        py_nvosd_line_params.x2 = road.x21
+        py_nvosd_line_params.y2 = road.y22
         py_nvosd_line_params.line_width = 5
         py_nvosd_line_params.line_color.set(0.0, 1.0, 0.0, 1.0)
         display_meta.num_lines = display_meta.num_lines + 1
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        x11 = py_nvosd_line_params.x1
-        x21 = py_nvosd_line_params.x2
 
         # Draw x12_x22
         py_nvosd_line_params = display_meta.line_params[1]
-        py_nvosd_line_params.x1 = x12
-        py_nvosd_line_params.y1 = y11
-        py_nvosd_line_params.x2 = x22
-        py_nvosd_line_params.y2 = y22
+        py_nvosd_line_params.x1 = road.x12
+        py_nvosd_line_params.y1 = road.y11
+        py_nvosd_line_params.x2 = road.x22
+        py_nvosd_line_params.y2 = road.y22
         py_nvosd_line_params.line_width = 5
         py_nvosd_line_params.line_color.set(0.0, 1.0, 0.0, 1.0)
         display_meta.num_lines = display_meta.num_lines + 1
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        x12 = py_nvosd_line_params.x1
-        x22 = py_nvosd_line_params.x2
 
         # Draw x13_x23
         py_nvosd_line_params = display_meta.line_params[2]
-        py_nvosd_line_params.x1 = x13
-        py_nvosd_line_params.y1 = y11
-        py_nvosd_line_params.x2 = x23
-        py_nvosd_line_params.y2 = y22
+        py_nvosd_line_params.x1 = road.x13
+        py_nvosd_line_params.y1 = road.y11
+        py_nvosd_line_params.x2 = road.x23
+        py_nvosd_line_params.y2 = road.y22
         py_nvosd_line_params.line_width = 5
         py_nvosd_line_params.line_color.set(0.0, 1.0, 0.0, 1.0)
         display_meta.num_lines = display_meta.num_lines + 1
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        x13 = py_nvosd_line_params.x1
-        x23 = py_nvosd_line_params.x2
 
         # Draw x14_x24
         py_nvosd_line_params = display_meta.line_params[3]
-        py_nvosd_line_params.x1 = x14
-        py_nvosd_line_params.y1 = y11
-        py_nvosd_line_params.x2 = x24
-        py_nvosd_line_params.y2 = y22
+        py_nvosd_line_params.x1 = road.x14
+        py_nvosd_line_params.y1 = road.y11
+        py_nvosd_line_params.x2 = road.x24
+        py_nvosd_line_params.y2 = road.y22
         py_nvosd_line_params.line_width = 5
         py_nvosd_line_params.line_color.set(0.0, 1.0, 0.0, 1.0)
         display_meta.num_lines = display_meta.num_lines + 1
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        x14 = py_nvosd_line_params.x1
-        x24 = py_nvosd_line_params.x2
+        t_capture = time.perf_counter()
+        stage_timer.record(frame_meta.pad_index, 'display', t_capture - t_display)
         
-        # save current frame to rgb_frames_list
-        n_frame=pyds.get_nvds_buf_surface(hash(gst_buffer),frame_meta.batch_id)
-        frame_image=np.array(n_frame,copy=True,order='C')
-        frame_image=cv2.cvtColor(frame_image,cv2.COLOR_RGBA2BGRA)
-        rgb_frames_list.append(RGB_Frame(frame_number, frame_image))
-        if len(rgb_frames_list) > 120:      # drop expired frames; extend frame life by increasing this value (may cause Jetson to shutdown)
-            for x in range(20):
-                del rgb_frames_list[x]
+        # save current frame to the frame ring; the slot of the oldest frame is reused
+        # in 'roi' capture mode only the bounding boxes of vehicles in the optimal range are copied, and frames without any are not touched
+        if roi_buffer is not None:
+            if frame_detections:
+                if n_frame is None:
+                    n_frame=pyds.get_nvds_buf_surface(hash(gst_buffer),frame_meta.batch_id)
+                roi_buffer.capture(frame_meta.pad_index, frame_number, n_frame, frame_detections)
+        else:
+            if n_frame is None:
+                n_frame=pyds.get_nvds_buf_surface(hash(gst_buffer),frame_meta.batch_id)
+            state.frame_ring.store(frame_number, n_frame)
+        t_end = time.perf_counter()
+        stage_timer.record(frame_meta.pad_index, 'capture', t_end - t_capture)
+        stage_timer.record(frame_meta.pad_index, 'frame', t_end - t_frame)
+        if stage_timer.due():
+            print_stage_latency()
         
         try:
             l_frame=l_frame.next
@@ -481,13 +364,6 @@ def create_source_bin(index,uri):
     return nbin
 
 def main(args):
-    f = open('optimal_frame_extraction.txt', 'w')       # erase previous contents
-    f.close()
-    with open('optimal_frame_extraction.txt', 'a') as the_file:
-        the_file.write(str('f-no v-id wid hei x-top y-left lane date time'))
-        the_file.write('\n')
-    f.close()
-    
     # Check input arguments
     if len(args) < 2:
         sys.stderr.write("usage: %s <uri1> [uri2] ... [uriN] <folder to save frames>\n" % args[0])
@@ -505,6 +381,7 @@ def main(args):
 
     os.mkdir(folder_name)
     print("Frames will be saved in ",folder_name)
+    vehicle_output.open(folder_name)
     # Standard GStreamer initialization
     GObject.threads_init()
     Gst.init(None)
@@ -527,8 +404,12 @@ def main(args):
     pipeline.add(streammux)
     for i in range(number_sources):
         os.mkdir(folder_name+"/stream_"+str(i))
-        frame_count["stream_"+str(i)]=0
-        saved_count["stream_"+str(i)]=0
+        frame_ring = None if roi_buffer is not None else FrameRing(MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, 4, ring_frames, ring_megabytes)   # video stream image buffer; preallocated ring of the most recent frames of this source
+        road = fetch_road(BASE, i + 1, default_road)     # camera i uses road record i + 1, or the default road
+        lanes = LaneMap(road.boundaries(), MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, lane_raster_scale, len(LANE_NAMES) - 1)     # right of the last boundary is still the shoulder
+        windows = fetch_lane_windows(BASE, i + 1, road, lanes.max_lane)     # per-lane optimal ranges; the road's where a lane has none
+        print('stream', i, windows)
+        extractor.add_source(SourceState(i, road, lanes, folder_name+"/stream_"+str(i), frame_ring, windows))
         print("Creating source_bin ",i," \n ")
         uri_name=args[i+1]
         if uri_name.find("rtsp://") == 0 :
@@ -676,6 +557,7 @@ def main(args):
     bus = pipeline.get_bus()
     bus.add_signal_watch()
     bus.connect ("message", bus_call, loop)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, print_stage_latency)     # kill -USR1 <pid> dumps the probe stage latency on demand
 
     tiler_sink_pad=tiler.get_static_pad("sink")
     if not tiler_sink_pad:
@@ -697,9 +579,20 @@ def main(args):
     except:
         pass
 
-    # cleanup
-    print("Exiting app\n")
+    # stop the pipeline first; once it is in NULL the streaming thread has left the probe for good, so the
+    # track store and the recorder are no longer written to while they are drained and closed
     pipeline.set_state(Gst.State.NULL)
 
+    # end of stream; no track is left behind unresolved
+    extractor.drain(time.time())
+    if recorder is not None:
+        recorder.close()
+    vehicle_output.close()
+    for state in extractor.sources.values():
+        print(state)
+    vehicle_output.report()
+    print_stage_latency()
+    print("Exiting app\n")
+
 if __name__ == '__main__':
     sys.exit(main(sys.argv))
\ No newline at end of file
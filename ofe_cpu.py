@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# CPU-only backend of the optimal frame extractor, for machines without DeepStream. Every source (a video
+# file or an RTSP stream) is decoded with cv2.VideoCapture on its own decoder thread and scaled to the
+# nvstreammux output size; a pluggable CPU detector finds the vehicles, the IoU tracker assigns tracking ids,
+# and the same Extractor and vehicle output as ofe.py take it from there.
+#
+# usage: python3 ofe_cpu.py [--detector module:factory] [--no-server] <uri1> [uri2] ... [uriN] <folder to save frames>
+
+import configparser
+import importlib
+import os
+import queue
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from extractor import Extractor, LANE_NAMES
+from frame_ring import FrameRing
+from frame_scoring import scorer_from_config
+from fragments import linker_from_config
+from iou_tracker import IouTracker
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from roi_buffer import RoiBuffer
+from source_state import Road, SourceState
+from stage_timing import StageTimer
+from vehicle_output import VehicleOutput, fetch_lane_windows, fetch_road
+
+BASE = "http://127.0.0.1:5000/"     # local host
+MUXER_OUTPUT_WIDTH = 1920   # road geometry is given in nvstreammux output coordinates
+MUXER_OUTPUT_HEIGHT = 1080
+CPU_STAGES = ('decode', 'detect', 'track', 'sweep', 'capture', 'frame')
+
+########## Background Subtraction Detector Class ##########     # described by the MOG2 background model and the blob filters
+
+class BackgroundSubtractionDetector:
+    def __init__(self, scale=0.5, history=500, var_threshold=25, min_area=1500, max_area=400000):
+        self.scale = scale      # frames are downscaled by this factor before subtraction
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold, detectShadows=True)
+        self.min_area = min_area    # blob area limits, in full-size pixels
+        self.max_area = max_area
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        self.warmup_frames = history    # frames before the background model has settled; archive.py decodes at least this many before a segment
+
+    def detect(self, frame):
+        # returns (boxes (n, 4) as left, top, width, height, confidences (n,))
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA) if self.scale != 1 else frame
+        mask = self.subtractor.apply(small)
+        _, mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)     # drop shadows (127)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        mask = cv2.dilate(mask, self.kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = np.array([cv2.boundingRect(c) for c in contours], dtype=np.float64).reshape(-1, 4) / self.scale
+        area = boxes[:, 2] * boxes[:, 3]
+        keep = (area >= self.min_area) & (area <= self.max_area)
+        return boxes[keep], np.ones(int(keep.sum()), dtype=np.float32)
+
+########## Background Subtraction Detector Class ##########
+
+def load_detector(spec):
+    # 'module:factory'; the factory returns an object with a detect(frame) method like BackgroundSubtractionDetector,
+    # and a warmup_frames attribute if its detections depend on the frames before
+    if not spec:
+        return BackgroundSubtractionDetector()
+    module, _, factory = spec.partition(':')
+    return getattr(importlib.import_module(module), factory)()
+
+def tracker_from_config(config):
+    return IouTracker(config.getfloat('OFEConfig', 'trackerIouThreshold', fallback=0.3), config.getint('OFEConfig', 'trackerMaxAge', fallback=10),
+                      config.getint('OFEConfig', 'trackerMinHits', fallback=2), config.getfloat('OFEConfig', 'trackerBirthConfidence', fallback=0.0),
+                      config.get('OFEConfig', 'trackerAssociation', fallback='greedy'), config.getboolean('OFEConfig', 'trackerPredict', fallback=True))
+
+########## Video Decoder Class ##########     # described by the capture, the output frame size and the bounded queue of decoded frames
+
+class VideoDecoder:
+    def __init__(self, uri, width=MUXER_OUTPUT_WIDTH, height=MUXER_OUTPUT_HEIGHT, maxsize=8):
+        self.uri = uri
+        self.capture = cv2.VideoCapture(uri)
+        if not self.capture.isOpened():
+            raise IOError("unable to open %s" % uri)
+        self.size = (width, height)
+        self.frames = queue.Queue(maxsize)      # (frame number, decode seconds, BGR frame); None at end of stream
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='decoder', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        frame_number = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            if (frame.shape[1], frame.shape[0]) != self.size:   # scale to the muxer output, as nvstreammux does
+                frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+            self.frames.put((frame_number, time.perf_counter() - start, frame))
+            frame_number += 1
+        self.capture.release()
+        self.frames.put(None)
+
+    def stop(self):
+        self._stop.set()
+        try:    # unblock the decoder thread if the queue is full
+            while True:
+                self.frames.get_nowait()
+        except queue.Empty:
+            pass
+
+########## Video Decoder Class ##########
+
+def main(args):
+    parser = ArgumentParser(description='Optimal frame extraction on the CPU with OpenCV decoding.')
+    parser.add_argument('--detector', help="detector factory as 'module:name'; background subtraction if omitted")
+    parser.add_argument('--no-server', action='store_true', help='do not read road records from or put vehicle records to the server')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--road', default='road.txt')
+    parser.add_argument('uris', nargs='+', help='video files or rtsp:// streams, followed by the folder to save frames')
+    options = parser.parse_args(args[1:])
+    if len(options.uris) < 2:
+        parser.error('at least one uri and the output folder are required')
+    uris, folder_name = options.uris[:-1], options.uris[-1]
+    if os.path.exists(folder_name):
+        sys.stderr.write("The output folder %s already exists. Please remove it first.\n" % folder_name)
+        return 1
+    os.mkdir(folder_name)
+    print("Frames will be saved in ", folder_name)
+
+    config = configparser.ConfigParser()     # frame extractor settings, as for ofe.py
+    config.read(options.config)
+    verbose = config.getboolean('OFEConfig', 'verbose', fallback=True)
+    default_road = Road.from_file(options.road)
+    if not options.no_server:
+        default_road = fetch_road(BASE, 1, default_road)
+    lifecycle = TrackLifecycle(config.getint('OFEConfig', 'finalizeAfter', fallback=20), config.getint('OFEConfig', 'expireAfter', fallback=100),
+                               config.getint('OFEConfig', 'minTrainFrames', fallback=6))
+    roi_buffer = RoiBuffer(config.getint('OFEConfig', 'roiPadding', fallback=0)) if config.get('OFEConfig', 'captureMode', fallback='frame') == 'roi' else None
+    vehicle_output = VehicleOutput(config, BASE, server=not options.no_server)
+    vehicle_output.open(folder_name)
+    extractor = Extractor(lifecycle, vehicle_output.submit, LANE_NAMES, roi_buffer, vehicle_output.extension, verbose,
+                          scorer=scorer_from_config(config, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT), linker=linker_from_config(config),
+                          batch_threshold=config.getint('OFEConfig', 'batchThreshold', fallback=32))
+    stage_timer = StageTimer(CPU_STAGES, config.getint('OFEConfig', 'timingSamples', fallback=4096), config.getfloat('OFEConfig', 'timingReportSeconds', fallback=60))
+
+    pipelines = {}  # source: (decoder, detector, tracker)
+    for i, uri in enumerate(uris):
+        print(i, ": ", uri)
+        os.mkdir(folder_name + "/stream_" + str(i))
+        road = default_road if options.no_server else fetch_road(BASE, i + 1, default_road)
+        lanes = LaneMap(road.boundaries(), MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, config.getint('OFEConfig', 'laneRasterScale', fallback=4), len(LANE_NAMES) - 1)
+        frame_ring = None if roi_buffer is not None else FrameRing(MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT, 3, config.getint('OFEConfig', 'ringFrames', fallback=120),
+                                                                   config.getfloat('OFEConfig', 'ringMegabytes', fallback=0))
+        windows = None if options.no_server else fetch_lane_windows(BASE, i + 1, road, lanes.max_lane)    # per-lane optimal ranges; the road's without the server
+        extractor.add_source(SourceState(i, road, lanes, folder_name + "/stream_" + str(i), frame_ring, windows))
+        pipelines[i] = (VideoDecoder(uri), load_detector(options.detector), tracker_from_config(config))
+
+    start = time.perf_counter()
+    frames = 0
+    try:
+        while pipelines:
+            for source in list(pipelines):      # one frame of every source in turn, like an nvstreammux batch
+                decoder, detector, tracker = pipelines[source]
+                item = decoder.frames.get()
+                if item is None:    # end of stream
+                    del pipelines[source]
+                    continue
+                frame_number, decode_seconds, frame = item
+                state = extractor.sources[source]
+                t_frame = time.perf_counter()
+                boxes, confidence = detector.detect(frame)
+                t_detect = time.perf_counter()
+                detections = tracker.update(boxes, 0, confidence)
+                candidates = extractor.update(state, frame_number, detections, frame)
+                t_track = time.perf_counter()
+                extractor.sweep(state, frame_number, time.time())
+                t_sweep = time.perf_counter()
+                if roi_buffer is not None:
+                    if candidates:
+                        roi_buffer.capture(source, frame_number, frame, candidates, code=None)
+                else:
+                    state.frame_ring.store(frame_number, frame, code=None)
+                t_end = time.perf_counter()
+                for stage, seconds in (('decode', decode_seconds), ('detect', t_detect - t_frame), ('track', t_track - t_detect),
+                                       ('sweep', t_sweep - t_track), ('capture', t_end - t_sweep), ('frame', t_end - t_frame)):
+                    stage_timer.record(source, stage, seconds)
+                if verbose:
+                    print("Stream", source, "Frame Number =", frame_number, "Vehicles in frame =", len(detections), "Total Vehicles Detected =", state.vehicle_count)
+                frames += 1
+                if stage_timer.due():
+                    print("Stage latency:\n" + stage_timer.report())
+    except KeyboardInterrupt:
+        for decoder, _, _ in pipelines.values():
+            decoder.stop()
+    elapsed = time.perf_counter() - start
+
+    # end of stream; no track is left behind unresolved
+    extractor.drain(time.time())
+    vehicle_output.close()
+    for state in extractor.sources.values():
+        print(state)
+    vehicle_output.report()
+    print("Stage latency:\n" + stage_timer.report())
+    print(frames, "frames in", "{0:.1f}".format(elapsed), "s,", "{0:.1f}".format(frames / elapsed if elapsed else 0), "frames/s")
+    print("Exiting app\n")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
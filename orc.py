@@ -37,6 +37,9 @@ import platform
 from common.is_aarch_64 import is_aarch64
 from common.bus_call import bus_call
 from common.FPS import GETFPS
+from detections import DetectionBuffer, centers, class_counts
+from calibration import Calibrator, fit_lanes, publish_road, publish_window, road_from_lanes
+from source_state import Road
 import numpy as np
 import pyds
 import cv2
@@ -64,20 +67,49 @@ TILED_OUTPUT_HEIGHT=1080
 GST_CAPS_FEATURES_NVMM="memory:NVMM"
 pgie_classes_str= ["Vehicle", "TwoWheeler", "Person","RoadSign"]
 
-vehicle_list = []   # vehicle metadata list
-
-########## Vehicle Class ##########     # vehicle metadata class; described by tracking id, list of frames it is tracked for and the coordinates of bounding boxes in the tracking instances
-
-class Vehicle:
-    def __init__(self, vehicle_id, frames_list=[], x_list=[], y_list=[], xc_list=[], yc_list=[], width_list=[], height_list=[], lane_list=[]):
-        self.vehicle_id = vehicle_id
-        self.frames_list = frames_list
-        self.x_list = x_list
-        self.y_list = y_list
-        self.xc_list = xc_list
-        self.yc_list = yc_list
-
-########## Vehicle Class ##########
+BASE = "http://127.0.0.1:5000/"     # local host
+detection_buffer = DetectionBuffer()   # object metadata of the current frame; reused by every frame
+
+orc_config = configparser.ConfigParser()     # calibration settings in 'config.ini'
+orc_config.read('config.ini')
+calibration_max_frames = orc_config.getint('OFEConfig', 'calibrationMaxFrames', fallback=9000)     # calibration stops here even if it has not converged
+calibrate_lanes = orc_config.getboolean('OFEConfig', 'calibrateLanes', fallback=True)     # fit the lane boundaries too, for a complete road configuration
+max_lanes = orc_config.getint('OFEConfig', 'calibrationMaxLanes', fallback=4)
+calibrators = {}    # Calibrator by source index
+main_loop = None    # quit from the probe once calibration is done
+calibration_done = False
+
+def new_calibrator():
+    return Calibrator(orc_config.getint('OFEConfig', 'calibrationMinFrames', fallback=10), orc_config.getfloat('OFEConfig', 'calibrationEntryQuantile', fallback=0.95),
+                      orc_config.getfloat('OFEConfig', 'calibrationExitQuantile', fallback=0.05), orc_config.getint('OFEConfig', 'calibrationMargin', fallback=100),
+                      orc_config.getint('OFEConfig', 'calibrationTolerance', fallback=4), orc_config.getint('OFEConfig', 'calibrationStableTracks', fallback=50),
+                      orc_config.getint('OFEConfig', 'calibrationMinTracks', fallback=100), orc_config.getint('OFEConfig', 'finalizeAfter', fallback=20),
+                      orc_config.getint('OFEConfig', 'calibrationLaneTracks', fallback=5000))
+
+def finish_calibration():
+    # publish the optimal range of every source to the server, with the fitted lanes as a complete road
+    # configuration when lane calibration is on, then stop the pipeline from the main loop
+    global calibration_done
+    calibration_done = True
+    default_road = Road.from_file('road.txt') if os.path.exists('road.txt') else None
+    for source, calibrator in sorted(calibrators.items()):
+        calibrator.flush()
+        print('stream', source, calibrator)
+        if calibrator.estimate is None:
+            print('stream', source, 'saw no vehicles, nothing to publish')
+            continue
+        y1, y2 = calibrator.estimate
+        print('Optimal Frame Range:')
+        print('y:', y1, y2)
+        lanes = fit_lanes(calibrator.lines, max_lanes) if calibrate_lanes else None
+        if lanes is not None:
+            road = road_from_lanes(*lanes, y1, y2, MUXER_OUTPUT_WIDTH)
+            print('Lanes:', len(lanes[0]), road)
+            response = publish_road(BASE, source + 1, road)     # camera i is road configuration i + 1
+        else:
+            response = publish_window(BASE, source + 1, y1, y2, default_road)
+        print(response.json())
+    GLib.idle_add(main_loop.quit)
 
 # tiler_sink_pad_buffer_probe  will extract metadata received on tiler src pad
 # and update params for drawing rectangle, object information etc.
@@ -108,54 +140,18 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
             break
 
         frame_number=frame_meta.frame_num
-        l_obj=frame_meta.obj_meta_list
         num_rects = frame_meta.num_obj_meta
-        obj_counter = {
-        PGIE_CLASS_ID_VEHICLE:0,
-        PGIE_CLASS_ID_PERSON:0,
-        PGIE_CLASS_ID_BICYCLE:0,
-        PGIE_CLASS_ID_ROADSIGN:0
-        }
-        while l_obj is not None:
-            try: 
-                # Casting l_obj.data to pyds.NvDsObjectMeta
-                obj_meta=pyds.NvDsObjectMeta.cast(l_obj.data)
-                if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:  # vehicle detected
-                    if obj_meta.rect_params.top > (0.25 * 1080):    # discard detection instances for vehicles too far from the camera
-                        car_found = 0   # vehicle id flag
-                        for x in vehicle_list:
-                            if x.vehicle_id == obj_meta.object_id:  # vehicle id found in the list of vehicle metadata
-                                x.frames_list.append(frame_number)
-                                x.x_list.append(int(obj_meta.rect_params.left))
-                                x.y_list.append(int(obj_meta.rect_params.top))
-                                x.xc_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                                x.yc_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                                car_found = 1   # vehicle metadata was already initialized 
-                                break
-                            
-                        if car_found == 0:      # vehicle metadata was not initialized in the list
-                            frames_temp_list = []
-                            frames_temp_list.append(frame_number)
-                            x_temp_list = []
-                            x_temp_list.append(int(obj_meta.rect_params.left))
-                            y_temp_list = []
-                            y_temp_list.append(int(obj_meta.rect_params.top))
-                            xc_temp_list = []
-                            xc_temp_list.append(int(obj_meta.rect_params.left + (obj_meta.rect_params.width / 2)))
-                            yc_temp_list = []
-                            yc_temp_list.append(int(obj_meta.rect_params.top + (obj_meta.rect_params.height / 2)))
-                            vehicle_list.append(Vehicle(obj_meta.object_id, frames_temp_list, x_temp_list, y_temp_list, xc_temp_list, yc_temp_list))
-                            
-                        print('Vehicle ID = ', obj_meta.object_id, ', Frame Number = ', frame_number, ', Top X = ', obj_meta.rect_params.left,', Top Y = ', obj_meta.rect_params.top, ', Width = ', obj_meta.rect_params.width, ', Height = ', obj_meta.rect_params.height)     # initialize vehicle metadata
-                        
-            except StopIteration:
-                break
-            obj_counter[obj_meta.class_id] += 1
-            
-            try: 
-                l_obj=l_obj.next
-            except StopIteration:
-                break
+        detections = detection_buffer.gather(frame_meta.obj_meta_list, pyds.NvDsObjectMeta.cast)    # object metadata of the frame, walked once into a record array
+        obj_counter = class_counts(detections)
+        vehicles = detections[(detections['class_id'] == PGIE_CLASS_ID_VEHICLE) & (detections['top'] > (0.25 * 1080))]    # discard detection instances for vehicles too far from the camera
+        vehicles['left'] = np.trunc(vehicles['left'])
+        vehicles['top'] = np.trunc(vehicles['top'])
+        calibrator = calibrators[frame_meta.pad_index]
+        x_centers, y_centers = centers(vehicles)
+        calibrator.update(frame_number, vehicles['object_id'].tolist(), vehicles['top'].tolist(), x_centers.tolist(), y_centers.tolist(), vehicles['width'].tolist())     # entry and exit tops and centre line sums of the live tracks only
+        calibrator.sweep(frame_number)    # retired tracks go into the quantile sketches
+        for _, object_id, left, top, width, height, _ in vehicles.tolist():
+            print('Vehicle ID = ', object_id, ', Frame Number = ', frame_number, ', Top X = ', left,', Top Y = ', top, ', Width = ', width, ', Height = ', height)     # initialize vehicle metadata
 
         print("Frame Number =", frame_number, "Number of Objects in frame =",num_rects,"Vehicles in frame =",obj_counter[PGIE_CLASS_ID_VEHICLE])    # object bounding box metadata overlay
         # Get frame rate through this probe
@@ -192,30 +188,9 @@ def tiler_sink_pad_buffer_probe(pad,info,u_data):
         print(pyds.get_string(py_nvosd_text_params.display_text))
         pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
         
-        if frame_number == 500:     # when the stream should stop; increase this value to extend the life of video stream
-            y_min_list = []
-            y_max_list = []
-            for car_object in vehicle_list:
-                if len(car_object.frames_list) > 10:    # ignore tracking instances with a life of less than ten frames
-                    print(car_object.vehicle_id, car_object.frames_list, car_object.y_list, len(car_object.frames_list), '\n', sep=' ')
-                    y_min_list.append(min(car_object.y_list))
-                    y_max_list.append(max(car_object.y_list))
-            y_min_list.sort()
-            y_max_list.sort()
-            print('y_min:', y_min_list, len(y_min_list), '\n')
-            print('y_max:', y_max_list, len(y_max_list), '\n')
-            print('Optimal Frame Range:')
-            print('y:', min(y_max_list)-100, max(y_min_list))
-            
-            with open('/opt/nvidia/deepstream/deepstream-5.0/sources/deepstream_python_apps/apps/optimal_frame_extractor/road.txt', 'r') as file:   # input file of the frame extractor application
-                data = file.readlines()    
-            data[10] = str('y1 ') + str(min(y_max_list)-100) + str(' #opt_frm_inf_start') + str('\n')
-            data[11] = str('y2 ') + str(max(y_min_list)) + str(' #opt_frm_inf_end')
-            with open('/opt/nvidia/deepstream/deepstream-5.0/sources/deepstream_python_apps/apps/optimal_frame_extractor/road.txt', 'w') as file:
-                file.writelines(data)
-            
-            sys.exit()
-        
+        if not calibration_done and (all(c.converged for c in calibrators.values()) or frame_number >= calibration_max_frames):
+            finish_calibration()    # stable estimate for every source, or out of frames
+
         try:
             l_frame=l_frame.next
         except StopIteration:
@@ -336,6 +311,7 @@ def main(args):
     for i in range(number_sources):
         frame_count["stream_"+str(i)]=0
         saved_count["stream_"+str(i)]=0
+        calibrators[i] = new_calibrator()
         print("Creating source_bin ",i," \n ")
         uri_name=args[i+1]
         if uri_name.find("rtsp://") == 0 :
@@ -479,7 +455,9 @@ def main(args):
         nvosd.link(sink)
 
     # create an event loop and feed gstreamer bus mesages to it
+    global main_loop
     loop = GObject.MainLoop()
+    main_loop = loop
     bus = pipeline.get_bus()
     bus.add_signal_watch()
     bus.connect ("message", bus_call, loop)
@@ -503,11 +481,11 @@ def main(args):
         loop.run()
     except:
         pass
-    
-    def cleanup():
+    if not calibration_done:    # end of stream before convergence
+        finish_calibration()
     # cleanup
-        print("Exiting app\n")
-        pipeline.set_state(Gst.State.NULL)
+    print("Exiting app\n")
+    pipeline.set_state(Gst.State.NULL)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv))
\ No newline at end of file
+    sys.exit(main(sys.argv))
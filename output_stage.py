@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Asynchronous output stage for the DeepStream buffer probes. The probe only enqueues an event for each
+# finalized vehicle; worker threads hand the event to every output handler (server database, extraction
+# log, crop files) off the GStreamer streaming thread. The queue is bounded, and when it is full the
+# back-pressure policy decides whether the probe blocks, the oldest event is dropped, or events spill to disk.
+
+import collections
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+POLICIES = ('block', 'drop-oldest', 'spill')
+_STOP = object()    # worker shutdown sentinel
+
+########## Output Stage Class ##########     # described by the output handlers, the bounded event queue and its worker threads
+
+class OutputStage:
+    def __init__(self, handlers, workers=2, maxsize=256, policy='block', spill_path='output_spill.pkl', latency_samples=1024):
+        if policy not in POLICIES:
+            raise ValueError("unknown back-pressure policy %r; expected one of %s" % (policy, ', '.join(POLICIES)))
+        self.handlers = list(handlers)      # callables taking one event, run in order by a worker thread
+        self.policy = policy
+        self.spill_path = spill_path
+        if os.path.exists(spill_path):  # left by a run that was killed before it drained; truncated, as replaying its events would write old vehicles again
+            os.remove(spill_path)
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()   # guards the spill file, _spilled and the counters
+        self._spilled = 0   # events currently waiting in the spill file
+        self.counters = collections.Counter()   # submitted, processed, dropped, spilled, errors; updated by the streaming thread and the workers
+        self.max_depth = 0
+        self._latency = {'queue': collections.deque(maxlen=latency_samples)}    # seconds; time spent waiting in the queue, then per handler
+        for handler in self.handlers:
+            self._latency[self._name(handler)] = collections.deque(maxlen=latency_samples)
+        self._workers = [threading.Thread(target=self._run, name='output-stage-%d' % i, daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @staticmethod
+    def _name(handler):
+        return getattr(handler, '__name__', type(handler).__name__)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def submit(self, event):
+        # called from the streaming thread; only enqueues
+        item = (time.perf_counter(), event)
+        self._count('submitted')
+        if self.policy == 'block':
+            self._queue.put(item)
+        elif self.policy == 'drop-oldest':
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                        self._count('dropped')
+                    except queue.Empty:
+                        pass
+        else:
+            with self._lock:    # a worker may be draining the spill file; decide and spill while it cannot
+                try:
+                    if self._spilled:       # keep the order; once spilling, spill until the file is drained
+                        raise queue.Full
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    self._spill(item)
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _spill(self, item):
+        # with the lock held
+        with open(self.spill_path, 'ab') as spill_file:
+            pickle.dump(item, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled += 1
+        self.counters['spilled'] += 1
+
+    def _unspill(self):
+        # hand back every spilled event and truncate the spill file
+        with self._lock:
+            if not self._spilled:
+                return []
+            items = []
+            with open(self.spill_path, 'rb') as spill_file:
+                while True:
+                    try:
+                        items.append(pickle.load(spill_file))
+                    except EOFError:
+                        break
+            os.remove(self.spill_path)
+            self._spilled = 0
+            return items
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                spilled = self._unspill()   # queue drained; catch up with the spill file
+                for spilled_item in spilled:
+                    self._handle(spilled_item)
+                if spilled:
+                    continue
+                try:
+                    item = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            self._handle(item)
+            self._queue.task_done()
+
+    def _handle(self, item):
+        enqueued, event = item
+        start = time.perf_counter()
+        self._latency['queue'].append(start - enqueued)
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                self._count('errors')
+                sys.stderr.write("Output handler %s failed: %s\n" % (self._name(handler), e))
+            end = time.perf_counter()
+            self._latency[self._name(handler)].append(end - start)
+            start = end
+        self._count('processed')
+
+    @property
+    def depth(self):
+        with self._lock:
+            return self._queue.qsize() + self._spilled
+
+    def metrics(self):
+        # queue depth, event counters and p50/p95/p99 latency in milliseconds per stage
+        with self._lock:
+            result = {'depth': self._queue.qsize() + self._spilled, 'max_depth': self.max_depth}
+            result.update(self.counters)
+        for name, samples in self._latency.items():
+            if samples:
+                p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), (50, 95, 99)) * 1000
+                result[name + '_ms'] = {'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3)}
+        return result
+
+    def close(self, timeout=None):
+        # drain the queue and the spill file, then stop the workers
+        self._queue.join()
+        for spilled in self._unspill():
+            self._handle(spilled)
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
+
+########## Output Stage Class ##########
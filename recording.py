@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Detection metadata recorder for the DeepStream buffer probes. Every frame the probe sees is appended to a
+# compact binary log as a FRAME_DTYPE header (stream, frame number, PTS, wall clock time, detection count)
+# followed by its DETECTION_DTYPE records, including frames without any detection so that a replay sees the
+# same frame sequence as the live run. See replay.py for feeding a recording back through the extractor.
+
+import numpy as np
+
+from detections import DETECTION_DTYPE
+
+MAGIC = b'OFEDET01'
+FRAME_DTYPE = np.dtype([('stream', '<u2'), ('frame', '<u8'), ('pts', '<u8'), ('time', '<f8'), ('count', '<u4')])
+
+########## Detection Recorder Class ##########     # described by the recording file
+
+class DetectionRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb', buffering=1024 * 1024)
+        self._file.write(MAGIC)
+        self.frames = 0
+        self.detections = 0
+
+    def write(self, stream, frame_number, pts, timestamp, detections):
+        # one frame; detections is a DETECTION_DTYPE array, possibly empty
+        header = np.array([(stream, frame_number, pts, timestamp, len(detections))], dtype=FRAME_DTYPE)
+        self._file.write(header.tobytes())
+        if len(detections):
+            self._file.write(np.ascontiguousarray(detections, dtype=DETECTION_DTYPE).tobytes())
+        self.frames += 1
+        self.detections += len(detections)
+
+    def close(self):
+        self._file.close()
+
+########## Detection Recorder Class ##########
+
+def read_recording(path):
+    # (frame header, detections) per recorded frame, in recording order
+    data = np.fromfile(path, dtype=np.uint8)
+    if data[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError("%s is not a detection recording" % path)
+    offset = len(MAGIC)
+    while offset + FRAME_DTYPE.itemsize <= len(data):
+        header = np.frombuffer(data, dtype=FRAME_DTYPE, count=1, offset=offset)[0]
+        offset += FRAME_DTYPE.itemsize
+        count = int(header['count'])
+        if offset + count * DETECTION_DTYPE.itemsize > len(data):     # truncated last frame; the recorder was killed
+            break
+        detections = np.frombuffer(data, dtype=DETECTION_DTYPE, count=count, offset=offset)
+        offset += count * DETECTION_DTYPE.itemsize
+        yield header, detections
+
+def load_recording(path):
+    # whole recording at once; returns (FRAME_DTYPE headers, DETECTION_DTYPE detections of all frames, frame index of every detection)
+    data = np.fromfile(path, dtype=np.uint8)
+    if data[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError("%s is not a detection recording" % path)
+    raw = data.tobytes()
+    count_at = FRAME_DTYPE.fields['count'][1]
+    header_offsets = []
+    counts = []
+    offset = len(MAGIC)
+    while offset + FRAME_DTYPE.itemsize <= len(raw):     # only the counts are read per frame; everything else is gathered in bulk
+        count = int.from_bytes(raw[offset + count_at:offset + count_at + 4], 'little')
+        if offset + FRAME_DTYPE.itemsize + count * DETECTION_DTYPE.itemsize > len(raw):     # truncated last frame
+            break
+        header_offsets.append(offset)
+        counts.append(count)
+        offset += FRAME_DTYPE.itemsize + count * DETECTION_DTYPE.itemsize
+    header_offsets = np.array(header_offsets, dtype=np.int64)
+    counts = np.array(counts, dtype=np.int64)
+    headers = data[header_offsets[:, None] + np.arange(FRAME_DTYPE.itemsize)].view(FRAME_DTYPE).ravel() if len(counts) else np.zeros(0, dtype=FRAME_DTYPE)
+    frame_index = np.repeat(np.arange(len(counts)), counts)
+    starts = np.repeat(header_offsets + FRAME_DTYPE.itemsize, counts) + (np.arange(len(frame_index)) - np.repeat(np.cumsum(counts) - counts, counts)) * DETECTION_DTYPE.itemsize
+    detections = data[starts[:, None] + np.arange(DETECTION_DTYPE.itemsize)].view(DETECTION_DTYPE).ravel() if len(starts) else np.zeros(0, dtype=DETECTION_DTYPE)
+    return headers, detections, frame_index
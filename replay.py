@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Offline replay of a detection recording (see recording.py) through the tracking and optimal frame
+# extraction logic of ofe.py, on a plain CPU machine and as fast as the CPU allows. The finalized vehicle
+# events go to an event log like the live run's, so a recording replayed with the live settings reproduces
+# its event log, and replays with other road geometry or expiry thresholds can be compared against it. Every
+# stream gets its camera's road configuration and per-lane windows as in ofe.py: from the server (--server,
+# camera i is road record i + 1) or from files given per stream, falling back to the default road file.
+#
+# usage: python3 replay.py <recording> [--road road.txt] [--stream-road 1 road_1.txt] [--lane-windows 1 lanes_1.json]
+#                          [--server http://127.0.0.1:5000/] [--config config.ini] [--events replay] [--format bin]
+
+import configparser
+import json
+import sys
+import time
+from argparse import ArgumentParser
+
+from event_log import EventLogger
+from extractor import Extractor, LANE_NAMES
+from frame_scoring import scorer_from_config
+from fragments import linker_from_config
+from lane_geometry import LaneMap, LaneWindows
+from lifecycle import TrackLifecycle
+from recording import read_recording
+from source_state import Road, SourceState
+from vehicle_output import fetch_lane_windows, fetch_road
+
+def lifecycle_from_config(config):
+    return TrackLifecycle(config.getint('OFEConfig', 'finalizeAfter', fallback=20), config.getint('OFEConfig', 'expireAfter', fallback=100),
+                          config.getint('OFEConfig', 'minTrainFrames', fallback=6))
+
+def replay(recording, road, lifecycle, submit, width=1920, height=1080, lane_scale=4, folder='replay', scorer=None, linker=None, source_config=None,
+           batch_threshold=32):
+    # feed a recording through an Extractor; returns (extractor, frames replayed, recorded seconds). source_config(stream)
+    # gives (road, LaneWindows or None) of a stream, as ofe.py sets up its cameras; without it every stream
+    # uses road with its optimal range for every lane. A recording has no pixels, so a scorer only gets the geometric terms.
+    # batch_threshold is batchThreshold of the live run, so that every frame takes the same update path as in the probe
+    extractor = Extractor(lifecycle, submit, LANE_NAMES, scorer=scorer, linker=linker, batch_threshold=batch_threshold)
+    lane_maps = {}  # LaneMap by road; streams of the same camera geometry share one raster
+    frames = 0
+    first_time = last_time = None
+    for header, detections in read_recording(recording):
+        stream = int(header['stream'])
+        state = extractor.sources.get(stream)
+        if state is None:
+            stream_road, windows = source_config(stream) if source_config is not None else (road, None)
+            lanes = lane_maps.get(stream_road)
+            if lanes is None:
+                lanes = lane_maps[stream_road] = LaneMap(stream_road.boundaries(), width, height, lane_scale, len(LANE_NAMES) - 1)
+            state = extractor.add_source(SourceState(stream, stream_road, lanes, folder + "/stream_" + str(stream), windows=windows))
+        timestamp = float(header['time'])
+        extractor.update(state, int(header['frame']), detections)
+        extractor.sweep(state, int(header['frame']), timestamp)
+        frames += 1
+        if first_time is None:
+            first_time = timestamp
+        last_time = timestamp
+    if last_time is not None:
+        extractor.drain(last_time)
+    return extractor, frames, 0.0 if first_time is None else last_time - first_time
+
+def main(args):
+    parser = ArgumentParser(description='Replay a detection recording through the optimal frame extractor.')
+    parser.add_argument('recording')
+    parser.add_argument('--road', default='road.txt', help="default road configuration file, in the 'road.txt' format")
+    parser.add_argument('--stream-road', nargs=2, action='append', default=[], metavar=('STREAM', 'FILE'), help="road configuration file of one stream")
+    parser.add_argument('--lane-windows', nargs=2, action='append', default=[], metavar=('STREAM', 'FILE'),
+                        help='per-lane windows of one stream; a JSON list of {lane, y1, y2, midpoint} records as served by /road/<id>/lanes')
+    parser.add_argument('--server', help='server base URL; streams without a file take their road and lane windows from it, as ofe.py does')
+    parser.add_argument('--config', default='config.ini', help='frame extractor settings; thresholds are read from [OFEConfig]')
+    parser.add_argument('--events', default='replay', help='event log prefix')
+    parser.add_argument('--format', default='bin', choices=('bin', 'csv'), help='event log format')
+    parser.add_argument('--width', type=int, default=1920, help='frame width of the recorded streams')
+    parser.add_argument('--height', type=int, default=1080, help='frame height of the recorded streams')
+    options = parser.parse_args(args[1:])
+
+    config = configparser.ConfigParser()
+    config.read(options.config)
+    event_log = EventLogger(options.events, options.format, rotate_bytes=0, rotate_seconds=0)
+
+    def log_vehicle_event(event):
+        event_log.log(event['timestamp'], event['stream'], event['vehicle_id'], event['frame_number'], event['x'], event['y'],
+                      event['width'], event['height'], event['lane_id'])
+
+    default_road = Road.from_file(options.road)
+    stream_roads = {int(stream): Road.from_file(path) for stream, path in options.stream_road}
+    stream_windows = {}
+    for stream, path in options.lane_windows:
+        with open(path, 'r') as windows_file:
+            stream_windows[int(stream)] = json.load(windows_file)
+
+    def source_config(stream):
+        # road and lane windows of one stream: its files first, then the server record of its camera, then the default road
+        road = stream_roads.get(stream)
+        if road is None:
+            road = fetch_road(options.server, stream + 1, default_road) if options.server else default_road
+        max_lane = len(LANE_NAMES) - 1
+        if stream in stream_windows:
+            windows = LaneWindows.from_records(road, max_lane, stream_windows[stream])
+        elif options.server:
+            windows = fetch_lane_windows(options.server, stream + 1, road, max_lane)
+        else:
+            windows = LaneWindows.uniform(road, max_lane)
+        print('stream', stream, road, windows)
+        return road, windows
+
+    start = time.perf_counter()
+    extractor, frames, recorded_seconds = replay(options.recording, default_road, lifecycle_from_config(config), log_vehicle_event,
+                                                 options.width, options.height, config.getint('OFEConfig', 'laneRasterScale', fallback=4),
+                                                 scorer=scorer_from_config(config, options.width, options.height), linker=linker_from_config(config),
+                                                 source_config=source_config, batch_threshold=config.getint('OFEConfig', 'batchThreshold', fallback=32))
+    elapsed = time.perf_counter() - start
+    event_log.close()
+    for state in extractor.sources.values():
+        print(state)
+    print(frames, 'frames replayed in', '{0:.2f}'.format(elapsed), 's,', '{0:.0f}'.format(frames / elapsed if elapsed else 0), 'frames/s,',
+          '{0:.1f}x real time'.format(recorded_seconds / elapsed if elapsed else 0))
+    print('events written to', event_log.path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Region-of-interest capture for the DeepStream buffer probes. Instead of buffering whole frames until a
+# vehicle is finalized, only the bounding box regions of the vehicles inside the optimal range are copied
+# out of the NvBufSurface and colour-converted, optionally with some padding around the box.
+
+import cv2
+
+########## ROI Buffer Class ##########     # vehicle crops; indexed by (source, tracking id) and then by frame number
+
+class RoiBuffer:
+    def __init__(self, padding=0):
+        self.padding = padding      # pixels added on every side of the bounding box, clipped to the frame
+        self.nbytes = 0     # total size of the buffered crops
+        self._crops = {}
+
+    def capture(self, source, frame_number, surface, detections, code=cv2.COLOR_RGBA2BGRA):
+        # detections is an iterable of (object_id, left, top, width, height) seen in this frame
+        frame_height, frame_width = surface.shape[:2]
+        p = self.padding
+        for object_id, left, top, width, height in detections:
+            xx1 = max(int(left) - p, 0)
+            xx2 = min(int(left) + int(width) + p, frame_width)
+            yy1 = max(int(top) - p, 0)
+            yy2 = min(int(top) + int(height) + p, frame_height)
+            if xx2 <= xx1 or yy2 <= yy1:    # bounding box entirely outside of the frame
+                continue
+            crop = surface[yy1:yy2, xx1:xx2].copy() if code is None else cv2.cvtColor(surface[yy1:yy2, xx1:xx2], code)
+            self.put(source, object_id, frame_number, crop)
+
+    def put(self, source, object_id, frame_number, crop):
+        track_crops = self._crops.setdefault((source, object_id), {})
+        old = track_crops.get(frame_number)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        track_crops[frame_number] = crop
+        self.nbytes += crop.nbytes
+
+    def get(self, source, object_id, frame_number):
+        track_crops = self._crops.get((source, object_id))
+        if track_crops is None:
+            return None
+        return track_crops.get(frame_number)
+
+    def discard(self, source, object_id, frame_number):
+        track_crops = self._crops.get((source, object_id))
+        if track_crops is not None:
+            crop = track_crops.pop(frame_number, None)
+            if crop is not None:
+                self.nbytes -= crop.nbytes
+
+    def release(self, source, object_id):
+        # drop every crop of a retired track
+        track_crops = self._crops.pop((source, object_id), None)
+        if track_crops is not None:
+            for crop in track_crops.values():
+                self.nbytes -= crop.nbytes
+        return track_crops
+
+    def __len__(self):
+        return len(self._crops)
+
+########## ROI Buffer Class ##########
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Per-source state of the optimal frame extractor. Every camera batched through nvstreammux gets its own
+# road geometry, lane map and per-lane windows, frame buffer, counters and output folder, looked up by frame_meta.pad_index,
+# so tracking ids and frame numbers of different cameras never collide and memory grows linearly with the
+# sources.
+
+import collections
+
+from lane_geometry import LaneWindows
+
+ROAD_KEYS = ('x11', 'x12', 'x13', 'x14', 'x21', 'x22', 'x23', 'x24', 'y11', 'y22', 'y1', 'y2')
+
+########## Road Class ##########     # road configuration of one camera; lane boundary segments from (x1i, y11) to (x2i, y22) and the optimal range [y1, y2]
+
+class Road(collections.namedtuple('Road', ROAD_KEYS)):
+    __slots__ = ()
+
+    @classmethod
+    def from_file(cls, path):
+        # 'road.txt'; one '<name> <value>' line per parameter, in ROAD_KEYS order
+        with open(path, 'r') as road_file:
+            return cls(*(int(line.split()[1]) for line in road_file if line.strip()))
+
+    @classmethod
+    def from_json(cls, record):
+        # road record of the server API (values are strings)
+        return cls(*(int(record[k]) for k in ROAD_KEYS))
+
+    @property
+    def midpoint(self):
+        return int((self.y1 + self.y2) / 2)     # reference point of optimality
+
+    def boundaries(self):
+        # lane boundary polylines for LaneMap, from the leftmost
+        return [((self.x11, self.y11), (self.x21, self.y22)), ((self.x12, self.y11), (self.x22, self.y22)),
+                ((self.x13, self.y11), (self.x23, self.y22)), ((self.x14, self.y11), (self.x24, self.y22))]
+
+########## Road Class ##########
+
+########## Source State Class ##########     # described by the source index, its road geometry, lane map and lane windows, frame buffer, output folder and counters
+
+class SourceState:
+    __slots__ = ('source', 'road', 'lanes', 'windows', 'folder', 'frame_ring', 'vehicle_count', 'frame_count', 'saved_count', 'merged_count', 'duplicate_count')
+
+    def __init__(self, source, road, lanes, folder, frame_ring=None, windows=None):
+        self.source = source    # frame_meta.pad_index
+        self.road = road
+        self.lanes = lanes      # LaneMap of the road
+        self.windows = windows if windows is not None else LaneWindows.uniform(road, lanes.max_lane)     # optimal range and midpoint by lane id
+        self.folder = folder    # crops of this source are written here
+        self.frame_ring = frame_ring    # ring of the most recent frames of this source; None in 'roi' capture mode
+        self.vehicle_count = 0  # vehicles finalized in this source
+        self.frame_count = 0    # frames seen by the probe
+        self.saved_count = 0    # crops handed to the output stage
+        self.merged_count = 0   # track fragments merged into the track they continue
+        self.duplicate_count = 0    # vehicle events the merges saved; fragments that would have been finalized as vehicles of their own
+
+    def __repr__(self):
+        return 'SourceState(source=%d, vehicles=%d, frames=%d, merged=%d, duplicates=%d, duplicate rate=%.2f%%)' % (
+            self.source, self.vehicle_count, self.frame_count, self.merged_count, self.duplicate_count, self.duplicate_rate * 100)
+
+    @property
+    def duplicate_rate(self):
+        # share of the vehicle events that would have been duplicates without fragment merging
+        return self.duplicate_count / max(self.vehicle_count + self.duplicate_count, 1)
+
+########## Source State Class ##########
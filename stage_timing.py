@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Per-stage latency histograms for the DeepStream buffer probes. Each stream keeps a preallocated ring of
+# the most recent samples of every stage, so recording a sample is one perf_counter() difference and one
+# array store; percentiles are only computed when a report is asked for, periodically or on demand.
+
+import time
+
+import numpy as np
+
+PROBE_STAGES = ('metadata', 'track', 'sweep', 'capture', 'display', 'output', 'frame')     # stages timed in tiler_sink_pad_buffer_probe; 'frame' is the whole probe per frame
+
+########## Stage Timer Class ##########     # described by the stage names, the sample ring of every stream and the report interval
+
+class StageTimer:
+    def __init__(self, stages=PROBE_STAGES, samples=4096, report_seconds=0):
+        self.stages = tuple(stages)
+        self._index = {stage: i for i, stage in enumerate(self.stages)}
+        self.samples = samples      # most recent samples kept per stage and stream
+        self.report_seconds = report_seconds    # due() turns true this often; 0 reports on demand only
+        self._rings = {}    # stream: (seconds per stage and sample, samples recorded per stage)
+        self._next_report = time.perf_counter() + report_seconds
+
+    def _ring(self, stream):
+        ring = self._rings.get(stream)
+        if ring is None:
+            ring = (np.zeros((len(self.stages), self.samples), dtype=np.float64), np.zeros(len(self.stages), dtype=np.int64))
+            self._rings[stream] = ring
+        return ring
+
+    def record(self, stream, stage, seconds):
+        samples, counts = self._ring(stream)
+        i = self._index[stage]
+        samples[i, counts[i] % self.samples] = seconds
+        counts[i] += 1
+
+    def due(self):
+        # true once every report_seconds; called from the probe
+        if not self.report_seconds:
+            return False
+        now = time.perf_counter()
+        if now < self._next_report:
+            return False
+        self._next_report = now + self.report_seconds
+        return True
+
+    def percentiles(self):
+        # {stream: {stage: {'count', 'p50', 'p95', 'p99'}}}; milliseconds over the samples still in the ring
+        result = {}
+        for stream, (samples, counts) in sorted(self._rings.items()):
+            stages = {}
+            for i, stage in enumerate(self.stages):
+                n = int(counts[i])
+                if not n:
+                    continue
+                p50, p95, p99 = np.percentile(samples[i, :min(n, self.samples)], (50, 95, 99)) * 1000
+                stages[stage] = {'count': n, 'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3)}
+            result[stream] = stages
+        return result
+
+    def report(self):
+        lines = []
+        for stream, stages in self.percentiles().items():
+            lines.append('stream %s' % stream)
+            for stage, p in stages.items():
+                lines.append('  %-9s n=%-8d p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms' % (stage, p['count'], p['p50'], p['p95'], p['p99']))
+        return '\n'.join(lines)
+
+    def clear(self):
+        self._rings.clear()
+
+########## Stage Timer Class ##########
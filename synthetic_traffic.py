@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Synthetic traffic for the optimal frame extractor. Vehicles arrive in every lane of a road configuration
+# at a configurable rate, drive down their lane at their own speed and grow with perspective; detections
+# drop out while a vehicle is occluded, and the tracker can switch a vehicle to a new tracking id. The frames come out as DETECTION_DTYPE batches, ready for the Extractor, and can be
+# written as a detection recording (see replay.py) together with the road configuration.
+#
+# usage: python3 synthetic_traffic.py <recording> [--road road.txt] [--frames 9000] [--rate 0.5] ...
+
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+from detections import DETECTION_DTYPE
+from recording import DetectionRecorder
+from source_state import Road
+
+DEFAULT_ROAD = Road(x11=540, x12=840, x13=1110, x14=1410, x21=340, x22=760, x23=1170, x24=1610, y11=300, y22=1080, y1=384, y2=633)
+
+########## Traffic Generator Class ##########     # described by the road, the traffic parameters and the vehicles on the road
+
+class TrafficGenerator:
+    def __init__(self, road=DEFAULT_ROAD, lanes=3, fps=30, rate=0.5, speed=8.0, speed_spread=0.25, occlusion=0.01, occlusion_frames=8,
+                 id_switch=0.002, clutter=0.5, width=1920, height=1080, seed=0):
+        self.road = road
+        self.lanes = min(lanes, len(road.boundaries()))     # lanes from the leftmost; a boundary is the right edge of its lane, as in LaneMap
+        self.fps = fps
+        self.rate = rate    # mean arrivals per second and lane (Poisson)
+        self.speed = speed  # mean speed in pixels per frame, down the frame
+        self.speed_spread = speed_spread    # relative standard deviation of the speed
+        self.occlusion = occlusion  # chance per vehicle and frame to become occluded
+        self.occlusion_frames = occlusion_frames    # longest occlusion, in frames
+        self.id_switch = id_switch  # chance per vehicle and frame that the tracker assigns it a new id
+        self.clutter = clutter      # mean non-vehicle detections per frame
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.next_id = 1
+        self.vehicles = np.zeros(0, dtype=[('object_id', '<u8'), ('lane', 'i1'), ('offset', '<f4'), ('y', '<f4'), ('speed', '<f4'),
+                                           ('size', '<f4'), ('occluded', '<i4'), ('vehicle', '<u8')])
+        self.arrived = 0    # ground truth; vehicles that entered the road
+        b = np.array(road.boundaries(), dtype=np.float64)       # boundary, end point, (x, y)
+        self._top = np.concatenate(([0], b[:, 0, 0]))     # lane i lies between edges i and i + 1; lane 0 starts at the left border of the frame
+        self._bottom = np.concatenate(([0], b[:, 1, 0]))
+
+    def _lane_x(self, lane, offset, y):
+        # x at height y of a point at the relative offset (0 left edge, 1 right edge) across a lane
+        t = np.clip((y - self.road.y11) / max(self.road.y22 - self.road.y11, 1), 0, 1)
+        left = self._top[lane] + (self._bottom[lane] - self._top[lane]) * t
+        right = self._top[lane + 1] + (self._bottom[lane + 1] - self._top[lane + 1]) * t
+        return left + (right - left) * offset
+
+    def frame(self):
+        # advance one frame; returns the DETECTION_DTYPE detections of the frame
+        rng = self.rng
+        arrivals = rng.poisson(self.rate / self.fps, self.lanes)
+        n = int(arrivals.sum())
+        if n:
+            new = np.zeros(n, dtype=self.vehicles.dtype)
+            new['object_id'] = np.arange(self.next_id, self.next_id + n)
+            new['vehicle'] = np.arange(self.arrived, self.arrived + n)
+            new['lane'] = np.repeat(np.arange(self.lanes), arrivals)
+            new['offset'] = rng.uniform(0.3, 0.7, n)
+            new['y'] = self.road.y11 - rng.uniform(0, self.speed, n)
+            new['speed'] = np.maximum(self.speed * (1 + self.speed_spread * rng.standard_normal(n)), 0.5)
+            new['size'] = rng.uniform(0.8, 1.2, n)
+            self.next_id += n
+            self.arrived += n
+            self.vehicles = np.concatenate((self.vehicles, new))
+        v = self.vehicles
+        v['y'] += v['speed']
+        v = v[v['y'] < self.height]     # left the frame
+        switched = rng.random(len(v)) < self.id_switch      # tracker id switches
+        k = int(switched.sum())
+        if k:
+            v['object_id'][switched] = np.arange(self.next_id, self.next_id + k)
+            self.next_id += k
+        v['occluded'] = np.maximum(v['occluded'] - 1, 0)
+        hidden = (v['occluded'] == 0) & (rng.random(len(v)) < self.occlusion)
+        v['occluded'][hidden] = rng.integers(1, self.occlusion_frames + 1, int(hidden.sum()))
+        self.vehicles = v
+        visible = v[(v['occluded'] == 0) & (v['y'] >= self.road.y11)]
+        scale = 0.4 + 0.6 * (visible['y'] - self.road.y11) / max(self.road.y22 - self.road.y11, 1)    # perspective; vehicles grow towards the bottom
+        width = 160 * visible['size'] * scale
+        height = 120 * visible['size'] * scale
+        x_center = self._lane_x(visible['lane'], visible['offset'], visible['y'])
+        clutter = rng.poisson(self.clutter)
+        detections = np.zeros(len(visible) + clutter, dtype=DETECTION_DTYPE)
+        detections['class_id'][:len(visible)] = 0
+        detections['object_id'][:len(visible)] = visible['object_id']
+        detections['left'][:len(visible)] = x_center - width / 2
+        detections['top'][:len(visible)] = visible['y'] - height / 2
+        detections['width'][:len(visible)] = width
+        detections['height'][:len(visible)] = height
+        detections['confidence'][:len(visible)] = rng.uniform(0.5, 1.0, len(visible))
+        if clutter:     # people, bicycles and road signs
+            detections['class_id'][len(visible):] = rng.integers(1, 4, clutter)
+            detections['object_id'][len(visible):] = np.arange(self.next_id, self.next_id + clutter)
+            self.next_id += clutter
+            detections['left'][len(visible):] = rng.uniform(0, self.width - 60, clutter)
+            detections['top'][len(visible):] = rng.uniform(0, self.height - 60, clutter)
+            detections['width'][len(visible):] = 40
+            detections['height'][len(visible):] = 60
+            detections['confidence'][len(visible):] = rng.uniform(0.3, 1.0, clutter)
+        return detections
+
+    def frames(self, count):
+        # (frame number, detections) for count frames
+        for frame_number in range(count):
+            yield frame_number, self.frame()
+
+########## Traffic Generator Class ##########
+
+def write_road(road, path):
+    # road configuration in the 'road.txt' format
+    with open(path, 'w') as road_file:
+        for key, value in zip(road._fields, road):
+            road_file.write('%s %d\n' % (key, value))
+
+def main(args):
+    parser = ArgumentParser(description='Generate a synthetic detection recording for replay.py and the benchmarks.')
+    parser.add_argument('recording')
+    parser.add_argument('--road', help="road configuration file in the 'road.txt' format; a built-in road if omitted")
+    parser.add_argument('--write-road', help='also write the road configuration used to this file')
+    parser.add_argument('--streams', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=9000)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--lanes', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=0.5, help='arrivals per second and lane')
+    parser.add_argument('--speed', type=float, default=8.0, help='mean speed in pixels per frame')
+    parser.add_argument('--occlusion', type=float, default=0.01, help='chance per vehicle and frame to become occluded')
+    parser.add_argument('--id-switch', type=float, default=0.002, help='chance per vehicle and frame of a tracker id switch')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(args[1:])
+
+    road = Road.from_file(options.road) if options.road else DEFAULT_ROAD
+    if options.write_road:
+        write_road(road, options.write_road)
+    generators = [TrafficGenerator(road, options.lanes, options.fps, options.rate, options.speed, occlusion=options.occlusion,
+                                   id_switch=options.id_switch, seed=options.seed + s) for s in range(options.streams)]
+    recorder = DetectionRecorder(options.recording)
+    for frame_number in range(options.frames):
+        for stream, generator in enumerate(generators):
+            recorder.write(stream, frame_number, int(frame_number * 1e9 / options.fps), frame_number / options.fps, generator.frame())
+    recorder.close()
+    print(recorder.frames, 'frames,', recorder.detections, 'detections,', sum(g.arrived for g in generators), 'vehicles written to', options.recording)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,7 @@
+# pytest configuration. The modules under test are flat top-level modules of the repository root, so the root
+# goes on sys.path; run with 'python -m pytest -q' from the root.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,15 @@
+# Segment planning of archive.py: every segment decodes at least the detector and tracker warm-up before its first frame.
+
+import configparser
+
+from archive import plan_segments, warmup_frames
+
+def test_warmup_frames():
+    config = configparser.ConfigParser()
+    config.read_string('[OFEConfig]\ntrackerMinHits = 3\n')
+    assert warmup_frames(config, None) == 500 + 3   # background model history, then the frames to confirm a track
+
+def test_plan_segments():
+    assert plan_segments(1000, 300, 100) == [(0, 0, 300), (200, 300, 600), (500, 600, 900), (800, 900, None)]
+    assert plan_segments(1000, 300, 502) == [(0, 0, 300), (0, 300, 600), (98, 600, 900), (398, 900, None)]
+    assert plan_segments(1000, 300, 100, keys=[0, 150, 250, 450, 750]) == [(0, 0, 300), (150, 300, 600), (450, 600, 900), (750, 900, None)]
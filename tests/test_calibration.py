@@ -0,0 +1,92 @@
+# Streaming calibration (calibration.py): P² quantile estimates against exact quantiles, the optimal range
+# estimate of the Calibrator, and lanes fitted from synthetic traffic in the road schema's convention.
+
+import numpy as np
+import pytest
+
+from calibration import Calibrator, P2Quantile, fit_lanes, road_from_lanes
+from lane_geometry import LaneMap
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+@pytest.mark.parametrize('p', [0.05, 0.5, 0.95])
+@pytest.mark.parametrize('distribution', ['uniform', 'normal', 'exponential'])
+def test_p2_quantile_tracks_the_exact_quantile(p, distribution):
+    rng = np.random.default_rng(0)
+    samples = getattr(rng, distribution)(size=20000)
+    sketch = P2Quantile(p)
+    for x in samples.tolist():
+        sketch.add(x)
+    exact = np.quantile(samples, p)
+    spread = np.quantile(samples, 0.99) - np.quantile(samples, 0.01)
+    assert abs(sketch.value() - exact) < 0.02 * spread
+
+def test_p2_quantile_is_exact_for_a_few_samples():
+    sketch = P2Quantile(0.5)
+    assert sketch.value() is None
+    for x in (5, 1, 3):
+        sketch.add(x)
+    assert sketch.value() == 3
+
+def test_calibrator_estimate():
+    # tracks enter between tops 300 and 340 and leave between 900 and 940; y1 = exit quantile - margin, y2 = entry quantile
+    rng = np.random.default_rng(1)
+    calibrator = Calibrator(min_frames=10, entry_quantile=0.95, exit_quantile=0.05, margin=100, min_tracks=100, stable_tracks=50, retire_after=20)
+    frame_number = 0
+    for object_id in range(400):
+        entry, exit = rng.uniform(300, 340), rng.uniform(900, 940)
+        for top in np.linspace(entry, exit, 30).tolist():
+            calibrator.update(frame_number, [object_id], [top], [960.0], [top + 50], [120.0])
+            frame_number += 1
+        calibrator.sweep(frame_number)
+    calibrator.update(frame_number, [10 ** 6], [500.0], [960.0], [550.0], [120.0])    # a false track, too short to count
+    calibrator.flush()
+    y1, y2 = calibrator.estimate
+    assert abs(y1 - (902 - 100)) <= 3 and abs(y2 - 338) <= 3
+    assert calibrator.converged
+    assert calibrator.tracks == 400
+
+def calibrated(lanes, frames=6000, seed=2):
+    # Calibrator fed with synthetic traffic in the given number of lanes; returns (calibrator, generator)
+    generator = TrafficGenerator(lanes=lanes, rate=1.0, occlusion=0, id_switch=0, clutter=0, seed=seed)
+    calibrator = Calibrator()
+    for frame_number in range(frames):
+        detections = generator.frame()
+        x_center = detections['left'] + detections['width'] / 2
+        y_center = detections['top'] + detections['height'] / 2
+        calibrator.update(frame_number, detections['object_id'].tolist(), detections['top'].tolist(), x_center.tolist(), y_center.tolist(),
+                          detections['width'].tolist())
+        calibrator.sweep(frame_number)
+    calibrator.flush()
+    return calibrator, generator
+
+@pytest.mark.parametrize('lanes', [2, 3, 4])
+def test_fitted_lanes_classify_like_the_generated_ones(lanes):
+    # fit_lanes gives the right edge of every lane, x11 being the right edge of lane 0, so LaneMap on the
+    # fitted road puts every vehicle back into the lane it was generated in
+    calibrator, _ = calibrated(lanes)
+    edges, y_top, y_bottom = fit_lanes(calibrator.lines, max_lanes=4)
+    assert len(edges) == lanes
+    road = road_from_lanes(edges, y_top, y_bottom, 384, 633, width=1920)
+    tops, bottoms = list(road[0:4]), list(road[4:8])
+    assert list(zip(tops, bottoms))[:lanes] == edges
+    assert tops[lanes:] == bottoms[lanes:] == [1920] * (4 - lanes)     # missing lanes sit at the frame border
+    lane_map = LaneMap(road.boundaries(), 1920, 1080, 4, 3)
+    generator = TrafficGenerator(lanes=lanes, rate=1.0, occlusion=0, id_switch=0, clutter=0, seed=3)
+    right = total = 0
+    for _ in range(1500):
+        detections = generator.frame()
+        truth = dict(zip(generator.vehicles['object_id'].tolist(), generator.vehicles['lane'].tolist()))
+        classified = lane_map.lanes(detections['left'] + detections['width'] / 2, detections['top'] + detections['height'] / 2)
+        right += sum(int(lane) == truth[object_id] for lane, object_id in zip(classified.tolist(), detections['object_id'].tolist()))
+        total += len(detections)
+    assert right >= 0.99 * total
+
+def test_inner_edges_are_close_to_the_truth():
+    calibrator, _ = calibrated(4)
+    edges, _, _ = fit_lanes(calibrator.lines, max_lanes=4)
+    truth = [(DEFAULT_ROAD.x12, DEFAULT_ROAD.x22), (DEFAULT_ROAD.x13, DEFAULT_ROAD.x23), (DEFAULT_ROAD.x14, DEFAULT_ROAD.x24)]
+    for (top, bottom), (true_top, true_bottom) in zip(edges[1:], truth):
+        assert abs(top - true_top) <= 15 and abs(bottom - true_bottom) <= 15
+
+def test_too_few_tracks_fit_no_lanes():
+    assert fit_lanes(np.zeros((3, 8))) is None
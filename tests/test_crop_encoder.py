@@ -0,0 +1,17 @@
+# Crop encoder (crop_encoder.py): consumers get the encoded bytes; fallback consumers still get the event when encoding fails.
+
+import numpy as np
+
+from crop_encoder import CropEncoder
+
+def test_consumers_and_fallbacks():
+    encoder = CropEncoder(workers=1)
+    stored, recorded = [], []
+    encoder.add_consumer(lambda event, data: stored.append((event['vehicle_id'], data)))
+    encoder.add_consumer(lambda event, data: recorded.append((event['vehicle_id'], data)), fallback=True)
+    assert encoder.submit({'vehicle_id': 1, 'crop': np.full((40, 60, 3), 128, dtype=np.uint8)}).result() is not None
+    assert encoder.submit({'vehicle_id': 2, 'crop': np.zeros((0, 0, 3), dtype=np.uint8)}).result() is None    # nothing to encode
+    encoder.close()
+    assert [vehicle_id for vehicle_id, _ in stored] == [1]
+    assert [(vehicle_id, data is None) for vehicle_id, data in recorded] == [(1, False), (2, True)]
+    assert encoder.metrics()['crops'] == 1 and encoder.metrics()['errors'] == 1
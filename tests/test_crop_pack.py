@@ -0,0 +1,65 @@
+# Crop pack storage (crop_pack.py): crops appended through PackWriter come back byte for byte through their
+# locators, PackReader lookups and iteration, and export_pack(); a new period rotates to a new pack file.
+
+import os
+
+import pytest
+
+import crop_pack
+from crop_pack import PackReader, PackWriter, export_pack, image_extension, parse_locator, read_locator
+
+JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 3
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 17
+WEBP = b'RIFF\x10\x00\x00\x00WEBPVP8 ' + b'\x01' * 9
+
+def test_round_trip(tmp_path):
+    writer = PackWriter(str(tmp_path))
+    crops = {(0, 7, 120): JPEG, (0, 9, 131): PNG, (1, 7, 120): WEBP, (0, 12, 140): b''}
+    locators = {key: writer.append(*key, data) for key, data in crops.items()}
+    writer.close()
+
+    for key, data in crops.items():
+        assert read_locator(locators[key]) == data
+    packs = {stream: parse_locator(locators[(stream, 7, 120)])[0] for stream in (0, 1)}
+    reader = PackReader(packs[0])
+    assert len(reader) == 3
+    assert reader.get(0, 9, 131) == PNG
+    assert reader.get(0, 9, 132) is None
+    assert [(stream, track, frame) for stream, track, frame, _ in reader] == [(0, 7, 120), (0, 9, 131), (0, 12, 140)]
+    assert [data for _, _, _, data in PackReader(packs[1])] == [WEBP]
+
+    assert export_pack(packs[0], str(tmp_path / 'export')) == 3
+    with open(tmp_path / 'export' / 'stream_0_frno_trid=131_9.png', 'rb') as crop_file:
+        assert crop_file.read() == PNG
+
+def test_appends_to_an_existing_pack(tmp_path):
+    first = PackWriter(str(tmp_path))
+    locator = first.append(0, 1, 10, JPEG)
+    first.close()
+    second = PackWriter(str(tmp_path))
+    second.append(0, 2, 20, PNG)
+    second.close()
+    reader = PackReader(parse_locator(locator)[0])
+    assert [(track, data) for _, track, _, data in reader] == [(1, JPEG), (2, PNG)]
+
+def test_rotation(tmp_path, monkeypatch):
+    period = ['2026101809']
+    monkeypatch.setattr(crop_pack.time, 'strftime', lambda fmt: period[0])
+    writer = PackWriter(str(tmp_path), 'hourly')
+    before = writer.append(0, 1, 10, JPEG)
+    period[0] = '2026101810'
+    after = writer.append(0, 2, 20, PNG)
+    writer.close()
+    assert os.path.basename(parse_locator(before)[0]) == '2026101809.pack'
+    assert os.path.basename(parse_locator(after)[0]) == '2026101810.pack'
+    assert read_locator(before) == JPEG and read_locator(after) == PNG
+    assert len(PackReader(parse_locator(before)[0])) == 1
+
+def test_locator_paths_may_contain_colons():
+    assert parse_locator(crop_pack.make_locator('C:/crops/stream_0/2026101809.pack', 512, 64)) == ('C:/crops/stream_0/2026101809.pack', 512, 64)
+    with pytest.raises(ValueError):
+        parse_locator('crops/stream_0/frame.jpg')
+
+@pytest.mark.parametrize('data, extension', [(JPEG, '.jpg'), (PNG, '.png'), (WEBP, '.webp'), (b'\x00\x01', '.bin')])
+def test_image_extension(data, extension):
+    assert image_extension(data) == extension
@@ -0,0 +1,79 @@
+# Extractor paths (extractor.py, detections.py): small frames go one detection at a time, large ones as a NumPy
+# batch; both must extend the same tracks, pick the same candidates and emit the same events.
+
+from types import SimpleNamespace
+
+import pytest
+
+from detections import DetectionBuffer, class_counts, walk_vehicles
+from extractor import Extractor, LANE_NAMES
+from fragments import FragmentLinker
+from frame_scoring import QualityScorer
+from lane_geometry import LaneMap, LaneWindows
+from lifecycle import TrackLifecycle
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+WINDOWS = LaneWindows([384, 400, 420, 384], [600, 620, 633, 633], [492, 510, 526, 508])
+
+def object_list(detections):
+    # the detections of a frame as a linked list of object metadata, like frame_meta.obj_meta_list
+    l_obj = None
+    for class_id, object_id, left, top, width, height, confidence in reversed(detections.tolist()):
+        meta = SimpleNamespace(class_id=class_id, object_id=object_id, confidence=confidence,
+                               rect_params=SimpleNamespace(left=left, top=top, width=width, height=height))
+        l_obj = SimpleNamespace(data=meta, next=l_obj)
+    return l_obj
+
+def run(path, windows=None, linking=False, frames=1500):
+    # path: 'batched', 'per-detection' or 'walk' (the probe's small frame path); returns (events, candidates, state)
+    events = []
+    extractor = Extractor(TrackLifecycle(), events.append, LANE_NAMES, linker=FragmentLinker() if linking else None,
+                          batch_threshold=0 if path == 'batched' else 10 ** 9)
+    state = extractor.add_source(SourceState(0, DEFAULT_ROAD, LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1), 'paths', windows=windows))
+    generator = TrafficGenerator(DEFAULT_ROAD, lanes=4, rate=1.0, id_switch=0.005, seed=7)
+    candidates = []
+    for frame_number in range(frames):
+        detections = generator.frame()
+        if path == 'walk':
+            counts, vehicles = walk_vehicles(object_list(detections), lambda data: data, extractor.vehicle_class, state.windows.low, state.windows.high)
+            candidates.append(extractor.update_vehicles(state, frame_number, vehicles))
+        else:
+            candidates.append(extractor.update(state, frame_number, detections))
+        extractor.sweep(state, frame_number, frame_number / 30.0)
+    extractor.drain(frames / 30.0)
+    return events, candidates, state
+
+@pytest.mark.parametrize('windows', [None, WINDOWS], ids=['road window', 'lane windows'])
+@pytest.mark.parametrize('linking', [False, True], ids=['unlinked', 'linked'])
+def test_every_path_gives_the_same_result(windows, linking):
+    events, candidates, state = run('batched', windows, linking)
+    assert len(events) > 50
+    for path in ('per-detection', 'walk'):
+        other_events, other_candidates, other_state = run(path, windows, linking)
+        assert [dict(e, crop=None) for e in other_events] == [dict(e, crop=None) for e in events]
+        assert other_candidates == candidates
+        assert (other_state.vehicle_count, other_state.merged_count, other_state.duplicate_count) == \
+               (state.vehicle_count, state.merged_count, state.duplicate_count)
+
+def test_batch_threshold():
+    extractor = Extractor(TrackLifecycle(), None, batch_threshold=32)
+    assert not extractor.batched(31)
+    assert extractor.batched(32)
+    extractor = Extractor(TrackLifecycle(), None, scorer=QualityScorer(), batch_threshold=32)
+    assert extractor.batched(1)     # no one-detection-at-a-time score()
+
+def test_walk_vehicles():
+    generator = TrafficGenerator(DEFAULT_ROAD, lanes=4, rate=3.0, clutter=2.0, seed=3)
+    for _ in range(200):
+        detections = generator.frame()
+        counts, vehicles = walk_vehicles(object_list(detections), lambda data: data, 0, 384, 633)
+        assert counts == [int((detections['class_id'] == c).sum()) for c in range(4)]
+        assert vehicles == [(o, l, t, w, h) for c, o, l, t, w, h, _ in detections.tolist() if c == 0 and 384 <= t <= 633]
+
+def test_walk_vehicles_counts_every_class_id():
+    # detector class ids beyond the four of the sample model are counted as class_counts() counts them
+    detections = DetectionBuffer().fill([(0, 1, 500, 400, 80, 60, 0.9), (6, 2, 900, 400, 20, 20, 0.5), (2, 3, 100, 100, 10, 30, 0.7)])
+    counts, vehicles = walk_vehicles(object_list(detections), lambda data: data, 0, 384, 633)
+    assert counts == class_counts(detections).tolist() == [1, 0, 1, 0, 0, 0, 1]
+    assert [vehicle[0] for vehicle in vehicles] == [1]
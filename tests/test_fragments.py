@@ -0,0 +1,67 @@
+# Fragment re-association (fragments.py): a vehicle the tracker loses and re-issues under a new id is one
+# event with the linker, unless the new track is in another lane or of another size.
+
+import pytest
+
+from detections import DetectionBuffer
+from extractor import Extractor, LANE_NAMES
+from fragments import FragmentLinker
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from source_state import SourceState
+from synthetic_traffic import DEFAULT_ROAD
+
+def run(script, linker, frames=80):
+    # script: frame number -> [(object_id, left, top, width, height)]; returns the events
+    events = []
+    extractor = Extractor(TrackLifecycle(), events.append, LANE_NAMES, linker=linker)
+    state = extractor.add_source(SourceState(0, DEFAULT_ROAD, LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1), 'linker'))
+    buffer = DetectionBuffer()
+    for frame_number in range(frames):
+        detections = buffer.fill([(0, object_id, left, top, width, height, 0.9) for object_id, left, top, width, height in script.get(frame_number, [])])
+        extractor.update(state, frame_number, detections)
+        extractor.sweep(state, frame_number, frame_number / 30.0)
+    extractor.drain(frames / 30.0)
+    return events, state
+
+def id_switch(after=(0, 0), size=1.0, gap=2, switch=20):
+    # one vehicle moving down lane 1 at 5 px per frame; from frame switch + gap on it is tracked as id 2,
+    # moved by after and scaled by size
+    script = {}
+    for frame_number in range(46):
+        if switch <= frame_number < switch + gap:
+            continue
+        left, top, width, height = 600.0, 390.0 + 5 * frame_number, 100.0, 80.0
+        object_id = 1
+        if frame_number >= switch:
+            left, top, width, height, object_id = left + after[0], top + after[1], width * size, height * size, 2
+        script[frame_number] = [(object_id, left, top, width, height)]
+    return script
+
+def test_an_id_switch_is_merged_into_one_vehicle():
+    events, state = run(id_switch(), None)
+    assert [event['vehicle_id'] for event in events] == [1, 2]
+    linker = FragmentLinker()
+    events, state = run(id_switch(), linker)
+    assert len(events) == 1
+    assert events[0]['vehicle_id'] == 1 and events[0]['fragments'] == 1
+    assert linker.merges == 1 and state.merged_count == 1
+    assert state.duplicate_count == 1   # both fragments were long enough to be finalized on their own
+
+def test_the_best_frame_of_the_fragment_wins():
+    # the vehicle reaches the midpoint of the optimal range after its id switch
+    events, _ = run(id_switch(switch=10), FragmentLinker())
+    assert len(events) == 1
+    assert events[0]['y'] + events[0]['height'] // 2 == pytest.approx(DEFAULT_ROAD.midpoint, abs=5)
+
+@pytest.mark.parametrize('after, size', [((-300, 0), 1.0), ((0, 0), 1.8), ((0, -90), 1.0)], ids=['other lane', 'other size', 'far off'])
+def test_an_unrelated_track_is_not_merged(after, size):
+    linker = FragmentLinker()
+    events, _ = run(id_switch(after, size), linker)
+    assert linker.merges == 0
+    assert sorted(event['vehicle_id'] for event in events) == [1, 2]
+
+def test_a_gap_longer_than_max_gap_is_not_merged():
+    linker = FragmentLinker(max_gap=5)
+    events, _ = run(id_switch(gap=8), linker)
+    assert linker.merges == 0 and len(events) == 2
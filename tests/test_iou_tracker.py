@@ -0,0 +1,100 @@
+# IoU tracker (iou_tracker.py): the assignment methods, and the birth, continuity and death of tracks.
+
+import itertools
+
+import numpy as np
+import pytest
+
+from iou_tracker import IouTracker, greedy_assignment, hungarian_assignment, iou_matrix, linear_assignment
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [100, 100, 10, 10]], dtype=np.float64)
+    b = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float64)
+    assert iou_matrix(a, b) == pytest.approx(np.array([[1.0, 50 / 150, 0.0], [0.0, 0.0, 0.0]]))
+
+@pytest.mark.parametrize('shape', [(4, 4), (3, 5), (5, 3)])
+def test_linear_assignment_is_optimal(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        cost = rng.random(shape)
+        rows, cols = linear_assignment(cost)
+        assert len(rows) == min(shape) and len(set(cols.tolist())) == min(shape)
+        if shape[0] <= shape[1]:
+            best = min(cost[np.arange(shape[0]), list(p)].sum() for p in itertools.permutations(range(shape[1]), shape[0]))
+        else:
+            best = min(cost[list(p), np.arange(shape[1])].sum() for p in itertools.permutations(range(shape[0]), shape[1]))
+        assert cost[rows, cols].sum() == pytest.approx(best)
+
+def test_hungarian_beats_greedy_on_total_overlap():
+    # greedy takes the best overlap (0.9) and leaves the second row without a match
+    iou = np.array([[0.9, 0.8], [0.85, 0.0]])
+    rows, cols = greedy_assignment(iou, 0.3)
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 0)]
+    rows, cols = hungarian_assignment(iou, 0.3)
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 0)]
+
+def test_unknown_association():
+    with pytest.raises(ValueError):
+        IouTracker(association='nearest')
+
+def moving(frame_number, left=100.0, speed=4.0):
+    return [left, 200.0 + speed * frame_number, 80.0, 60.0]
+
+@pytest.mark.parametrize('association', ['greedy', 'hungarian'])
+def test_a_track_keeps_its_id(association):
+    tracker = IouTracker(association=association)
+    ids = set()
+    for frame_number in range(50):
+        detections = tracker.update([moving(frame_number), moving(frame_number, left=600)])
+        assert len(detections) == 2
+        ids.update(detections['object_id'].tolist())
+    assert ids == {1, 2}
+
+def test_birth_after_min_hits():
+    tracker = IouTracker(min_hits=3)
+    counts = [len(tracker.update([moving(frame_number)])) for frame_number in range(5)]
+    assert counts == [0, 0, 1, 1, 1]
+
+def test_a_tentative_track_dies_on_its_first_miss():
+    tracker = IouTracker(min_hits=3)
+    tracker.update([moving(0)])
+    tracker.update([])
+    assert len(tracker) == 0
+    tracker.update([moving(2)])
+    assert tracker.next_id == 3     # a new track
+
+def test_death_after_max_age():
+    tracker = IouTracker(max_age=3)
+    tracker.update([moving(0)])
+    for _ in range(3):
+        tracker.update([])
+    assert len(tracker) == 1
+    assert tracker.update([moving(0)])['object_id'].tolist() == [1]   # back within max_age
+    for _ in range(4):
+        tracker.update([])
+    assert len(tracker) == 0
+
+def test_birth_confidence():
+    tracker = IouTracker(birth_confidence=0.5)
+    detections = tracker.update([moving(0), moving(0, left=600)], confidence=[0.4, 0.9])
+    assert detections['left'].tolist() == [600.0]
+
+def test_no_association_across_classes():
+    tracker = IouTracker()
+    tracker.update([moving(0)], class_id=0)
+    assert tracker.update([moving(1)], class_id=2)['object_id'].tolist() == [2]
+
+def test_prediction_follows_a_fast_vehicle():
+    # 25 px per frame on a 60 px high box; without prediction the overlap after a missed frame is too small
+    ids = {}
+    for predict in (False, True):
+        tracker = IouTracker(predict=predict)
+        seen = set()
+        for frame_number in range(20):
+            if frame_number == 10:
+                tracker.update([])
+                continue
+            seen.update(tracker.update([moving(frame_number, speed=25.0)])['object_id'].tolist())
+        ids[predict] = seen
+    assert len(ids[False]) > 1
+    assert ids[True] == {1}
@@ -0,0 +1,58 @@
+# Lane classification (lane_geometry.py) against the if-chain of the original probe, where boundary i of the
+# road configuration is the right edge of lane i:
+#   x_center > min(x13, x23) -> 3, > min(x12, x22) -> 2, > min(x11, x21) -> 1, else 0.
+# With upright boundaries that chain is exact; LaneMap also follows slanted boundaries.
+
+import numpy as np
+import pytest
+
+from lane_geometry import LaneMap
+from source_state import Road
+
+UPRIGHT = Road(x11=540, x12=840, x13=1110, x14=1410, x21=540, x22=840, x23=1110, x24=1410, y11=0, y22=1080, y1=384, y2=633)
+SLANTED = Road(x11=540, x12=840, x13=1110, x14=1410, x21=340, x22=760, x23=1170, x24=1610, y11=300, y22=1080, y1=384, y2=633)
+
+def baseline_lane(road, x_center):
+    if x_center > min(road.x13, road.x23):
+        return 3
+    elif x_center > min(road.x12, road.x22):
+        return 2
+    elif x_center > min(road.x11, road.x21):
+        return 1
+    return 0
+
+def boundary_x(road, i, y):
+    # x of boundary i (0 is x11-x21) at height y
+    top, bottom = (road.x11, road.x12, road.x13, road.x14)[i], (road.x21, road.x22, road.x23, road.x24)[i]
+    t = np.clip((y - road.y11) / (road.y22 - road.y11), 0, 1)
+    return top + (bottom - top) * t
+
+@pytest.mark.parametrize('scale', [1, 4, 8])
+def test_upright_boundaries_match_the_baseline_chain(scale):
+    lanes = LaneMap(UPRIGHT.boundaries(), 1920, 1080, scale, 3)
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 1920, 20000)
+    y = rng.integers(0, 1080, 20000)
+    away = np.min(np.abs(x[:, None] - np.array([540, 840, 1110])[None, :]), axis=1) > scale    # a raster block straddling a boundary may go either way
+    expected = np.array([baseline_lane(UPRIGHT, xc) for xc in x[away].tolist()])
+    assert (lanes.lanes(x[away], y[away]) == expected).all()
+    assert [lanes.lane(xc, yc) for xc, yc in zip(x[away][:200].tolist(), y[away][:200].tolist())] == expected[:200].tolist()
+
+def test_lane_ids_follow_the_road_schema():
+    lanes = LaneMap(UPRIGHT.boundaries(), 1920, 1080, 4, 3)
+    assert lanes.lane(100, 500) == 0        # left of x11: lane 0, 'fast'
+    assert lanes.lane(700, 500) == 1
+    assert lanes.lane(1000, 500) == 2
+    assert lanes.lane(1300, 500) == 3
+    assert lanes.lane(1800, 500) == 3       # right of x14 is still the shoulder
+
+def test_slanted_boundaries_are_followed():
+    lanes = LaneMap(SLANTED.boundaries(), 1920, 1080, 4, 3)
+    for y in (300, 500, 700, 900, 1079):
+        edges = [boundary_x(SLANTED, i, y) for i in range(4)]
+        for lane, (left, right) in enumerate(zip([0] + edges[:3], edges)):
+            assert lanes.lane(int((left + right) / 2), y) == lane, (y, lane)
+
+def test_points_off_the_frame_take_the_nearest_edge():
+    lanes = LaneMap(UPRIGHT.boundaries(), 1920, 1080, 4, 3)
+    assert lanes.lanes(np.array([-50, 5000]), np.array([-10, 5000])).tolist() == [0, 3]
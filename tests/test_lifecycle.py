@@ -0,0 +1,76 @@
+# Track lifecycle thresholds (lifecycle.py) against the expiry rules of the original per-frame loop: a track
+# is resolved once it has not been seen for more than finalizeAfter frames; it is rectified with minTrainFrames
+# frames or fewer, expired once expireAfter frames or more behind, and finalized otherwise.
+
+import pytest
+
+from lifecycle import TrackLifecycle, FINALIZE, RECTIFY, EXPIRE
+from track_store import TrackStore
+
+def add_track(store, lifecycle, object_id, first_frame, length, source=0):
+    for frame_number in range(first_frame, first_frame + length):
+        lifecycle.seen(store.append(source, object_id, frame_number, 100, 100, 50, 40))
+    return store.lookup(source, object_id)
+
+def baseline_verdict(frame_lag, length, finalize_after=20, expire_after=100, min_frames=6):
+    # the original loop's decision for a track frame_lag frames behind; None keeps it
+    if frame_lag <= finalize_after:
+        return None
+    if length <= min_frames:
+        return RECTIFY
+    if frame_lag < expire_after:
+        return FINALIZE
+    return EXPIRE
+
+def test_not_resolved_until_finalize_after_is_exceeded():
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    add_track(store, lifecycle, 1, 0, 10)     # last seen in frame 9
+    assert lifecycle.sweep(store, 0, 29) == []
+    assert (0, 1) in store
+    assert [verdict for _, verdict in lifecycle.sweep(store, 0, 30)] == [FINALIZE]
+    assert (0, 1) not in store
+
+@pytest.mark.parametrize('length, verdict', [(6, RECTIFY), (7, FINALIZE)])
+def test_min_frames_edge(length, verdict):
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    track = add_track(store, lifecycle, 1, 0, length)
+    assert lifecycle.sweep(store, 0, track.last_frame + 21) == [(track, verdict)]
+
+@pytest.mark.parametrize('frame_lag, verdict', [(99, FINALIZE), (100, EXPIRE), (150, EXPIRE)])
+def test_expire_after_edge(frame_lag, verdict):
+    # a track first swept this far behind, e.g. after a gap in the frames of its source
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    track = add_track(store, lifecycle, 1, 0, 10)
+    assert lifecycle.sweep(store, 0, track.last_frame + frame_lag) == [(track, verdict)]
+
+def test_matches_the_baseline_rules():
+    for length in range(1, 10):
+        for frame_lag in range(0, 130):
+            store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+            track = add_track(store, lifecycle, 1, 0, length)
+            resolved = lifecycle.sweep(store, 0, track.last_frame + frame_lag)
+            expected = baseline_verdict(frame_lag, length)
+            assert resolved == ([] if expected is None else [(track, expected)]), (length, frame_lag)
+
+def test_a_track_seen_again_is_rekeyed_not_resolved():
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    add_track(store, lifecycle, 1, 0, 10)
+    add_track(store, lifecycle, 1, 25, 5)      # the same tracking id again; its heap entry still says frame 9
+    assert lifecycle.sweep(store, 0, 40) == []
+    assert len(store.lookup(0, 1)) == 15
+    assert [verdict for _, verdict in lifecycle.sweep(store, 0, 50)] == [FINALIZE]
+
+def test_sweep_only_touches_its_source():
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    add_track(store, lifecycle, 1, 0, 10, source=0)
+    add_track(store, lifecycle, 1, 0, 10, source=1)
+    assert len(lifecycle.sweep(store, 0, 40)) == 1
+    assert (1, 1) in store
+
+def test_drain_resolves_every_track():
+    store, lifecycle = TrackStore(), TrackLifecycle(20, 100, 6)
+    short = add_track(store, lifecycle, 1, 0, 3)
+    long = add_track(store, lifecycle, 2, 0, 12)
+    assert sorted(lifecycle.drain(store), key=lambda r: r[0].vehicle_id) == [(short, RECTIFY), (long, FINALIZE)]
+    assert len(store) == 0
+    assert lifecycle.sweep(store, 0, 1000) == []
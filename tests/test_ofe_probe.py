@@ -0,0 +1,147 @@
+# Buffer probe of ofe.py on both sides of walkThreshold. DeepStream is not available here, so gi, pyds and the
+# sample app's common package are replaced by fakes that hand the probe a batch of frames from two sources;
+# the probe must capture every frame from its own surface and emit the same vehicles on either path.
+
+import importlib
+import sys
+import types
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import requests
+
+from extractor import Extractor, LANE_NAMES
+from frame_ring import FrameRing
+from lane_geometry import LaneMap
+from lifecycle import TrackLifecycle
+from roi_buffer import RoiBuffer
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD, write_road
+
+SOURCES = 2
+FRAMES = 200
+
+class Anything:
+    # display meta parameters; any attribute is another one, any call does nothing
+    def __getattr__(self, name):
+        value = Anything()
+        setattr(self, name, value)
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return None
+
+class FakePyds(types.ModuleType):
+    def __init__(self):
+        super().__init__('pyds')
+        self.buffers = {}   # hash of the GstBuffer: (batch meta, surfaces by batch id)
+        self.maps = 0   # get_nvds_buf_surface calls
+        self.NvDsFrameMeta = SimpleNamespace(cast=lambda data: data)
+        self.NvDsObjectMeta = SimpleNamespace(cast=lambda data: data)
+
+    def gst_buffer_get_nvds_batch_meta(self, address):
+        return self.buffers[address][0]
+
+    def get_nvds_buf_surface(self, address, batch_id):
+        self.maps += 1
+        return self.buffers[address][1][batch_id]
+
+    def nvds_acquire_display_meta_from_pool(self, batch_meta):
+        return SimpleNamespace(num_labels=0, num_lines=0, text_params=[Anything()], line_params=[Anything() for _ in range(4)])
+
+    def nvds_add_display_meta_to_frame(self, frame_meta, display_meta):
+        pass
+
+    def get_string(self, text):
+        return str(text)
+
+def linked(items):
+    # a GList of metadata, as frame_meta_list and obj_meta_list
+    head = None
+    for item in reversed(items):
+        head = SimpleNamespace(data=item, next=head)
+    return head
+
+def object_list(detections):
+    return linked([SimpleNamespace(class_id=class_id, object_id=object_id, confidence=confidence,
+                                   rect_params=SimpleNamespace(left=left, top=top, width=width, height=height))
+                   for class_id, object_id, left, top, width, height, confidence in detections.tolist()])
+
+def shade(source, frame_number):
+    # every surface is filled with a value of its own, so a capture shows which surface it came from
+    return (source * 97 + frame_number) % 251 + 1
+
+@pytest.fixture(scope='module')
+def ofe(tmp_path_factory):
+    # import ofe.py against the fakes, with verbose off as in production, from a folder with its road.txt and config.ini
+    folder = tmp_path_factory.mktemp('ofe')
+    write_road(DEFAULT_ROAD, str(folder / 'road.txt'))
+    (folder / 'config.ini').write_text('[OFEConfig]\nverbose = no\noutputSpillPath = %s\neventLogPrefix = %s\n' % (folder / 'spill.pkl', folder / 'events'))
+    gi = types.ModuleType('gi')
+    gi.require_version = lambda name, version: None
+    repository = types.ModuleType('gi.repository')
+    repository.GObject, repository.GLib = SimpleNamespace(), SimpleNamespace()
+    repository.Gst = SimpleNamespace(PadProbeReturn=SimpleNamespace(OK='ok'))
+    gi.repository = repository
+    common = types.ModuleType('common')
+    fakes = {'gi': gi, 'gi.repository': repository, 'pyds': FakePyds(), 'common': common,
+             'common.is_aarch_64': SimpleNamespace(is_aarch64=lambda: False), 'common.bus_call': SimpleNamespace(bus_call=None),
+             'common.FPS': SimpleNamespace(GETFPS=lambda stream: SimpleNamespace(get_fps=lambda: None))}
+    with pytest.MonkeyPatch.context() as patch:
+        for name, module in fakes.items():
+            patch.setitem(sys.modules, name, module)
+        patch.setattr(requests, 'get', lambda url, *args, **kwargs: SimpleNamespace(status_code=404))     # no server; the road of road.txt
+        patch.chdir(folder)
+        patch.delitem(sys.modules, 'ofe', raising=False)
+        module = importlib.import_module('ofe')
+        assert module.verbose is False
+        yield module
+        module.vehicle_output.close()
+
+def run_probe(ofe, patch, walk_threshold, capture_mode):
+    # a batch of one frame per source per probe call; returns (events, frames mapped, frames captured wrongly)
+    events = []
+    roi_buffer = RoiBuffer() if capture_mode == 'roi' else None
+    lifecycle = TrackLifecycle()
+    extractor = Extractor(lifecycle, events.append, LANE_NAMES, roi_buffer, '.jpg', False, batch_threshold=32)
+    lanes = LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1)
+    for source in range(SOURCES):
+        extractor.add_source(SourceState(source, DEFAULT_ROAD, lanes, 'probe/stream_' + str(source), None if roi_buffer is not None else FrameRing(1920, 1080, 4, 2)))
+    for name, value in (('extractor', extractor), ('vehicle_lifecycle', lifecycle), ('roi_buffer', roi_buffer), ('walk_threshold', walk_threshold),
+                        ('fps_streams', {'stream%d' % source: SimpleNamespace(get_fps=lambda: None) for source in range(SOURCES)})):
+        patch.setattr(ofe, name, value)
+    pyds = sys.modules['pyds']
+    pyds.maps = 0
+    generators = [TrafficGenerator(DEFAULT_ROAD, lanes=4, rate=1.0, seed=11 + source) for source in range(SOURCES)]
+    wrong = 0
+    for frame_number in range(FRAMES):
+        frame_metas, surfaces = [], []
+        for source in range(SOURCES):
+            detections = generators[source].frame()
+            frame_metas.append(SimpleNamespace(pad_index=source, batch_id=source, frame_num=frame_number, buf_pts=frame_number, num_obj_meta=len(detections),
+                                               obj_meta_list=object_list(detections)))
+            surfaces.append(np.full((1080, 1920, 4), shade(source, frame_number), dtype=np.uint8))
+        gst_buffer = object()
+        pyds.buffers = {hash(gst_buffer): (SimpleNamespace(frame_meta_list=linked(frame_metas)), surfaces)}
+        assert ofe.tiler_sink_pad_buffer_probe(None, SimpleNamespace(get_buffer=lambda: gst_buffer), None) == 'ok'
+        if roi_buffer is None:
+            for source in range(SOURCES):
+                captured = extractor.sources[source].frame_ring.get(frame_number)
+                wrong += int((captured != shade(source, frame_number)).any())
+    extractor.drain(FRAMES / 30.0)
+    return events, pyds.maps, wrong
+
+@pytest.mark.parametrize('capture_mode', ['frame', 'roi'])
+def test_probe_on_both_sides_of_the_walk_threshold(ofe, monkeypatch, capture_mode):
+    results = {}
+    for walk_threshold in (0, 10 ** 6):     # every frame gathered into the record array; every frame walked
+        events, maps, wrong = run_probe(ofe, monkeypatch, walk_threshold, capture_mode)
+        assert wrong == 0
+        assert maps <= SOURCES * FRAMES     # a surface is mapped at most once per frame
+        if capture_mode == 'roi':
+            for event in events:    # the crop comes from the surface of the vehicle's own source and frame
+                assert event['crop'] is not None and (event['crop'] == shade(event['stream'], event['frame_number'])).all()
+        results[walk_threshold] = [dict(event, crop=None, datetime=None, timestamp=None) for event in events]     # the probe stamps events with the wall clock
+    assert len(results[0]) > 10
+    assert results[10 ** 6] == results[0]
@@ -0,0 +1,24 @@
+# Output stage (output_stage.py): every event is handled once, in order when spilling, and a stale spill file is not replayed.
+
+import pickle
+import threading
+
+from output_stage import OutputStage
+
+def test_a_stale_spill_file_is_truncated(tmp_path):
+    spill_path = str(tmp_path / 'spill.pkl')
+    with open(spill_path, 'wb') as spill_file:     # left by a killed run
+        pickle.dump((0.0, 'stale'), spill_file)
+    handled = []
+    release = threading.Event()
+    def slow(event):
+        release.wait()
+        handled.append(event)
+    stage = OutputStage([slow], workers=1, maxsize=2, policy='spill', spill_path=spill_path)
+    for event in range(10):
+        stage.submit(event)
+    release.set()
+    stage.close()
+    assert handled == list(range(10))
+    metrics = stage.metrics()
+    assert metrics['submitted'] == metrics['processed'] == 10 and metrics['spilled'] > 0
@@ -0,0 +1,77 @@
+# Replay equivalence (replay.py): a detection recording made while the Extractor runs live reproduces the live
+# vehicle events when it is replayed with the same settings.
+
+import pytest
+
+from extractor import Extractor, LANE_NAMES
+from fragments import FragmentLinker
+from lane_geometry import LaneMap, LaneWindows
+from lifecycle import TrackLifecycle
+from recording import DetectionRecorder
+from replay import replay
+from source_state import SourceState
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+FPS = 30.0
+BATCH_THRESHOLD = 6     # not the default; replay must follow the live setting
+
+def live_run(path, streams, frames, road=DEFAULT_ROAD, windows=None, linker=None, seed=0):
+    # the probe's loop: record every frame, extend the tracks and sweep; returns the events
+    events = []
+    extractor = Extractor(TrackLifecycle(), events.append, LANE_NAMES, linker=linker, batch_threshold=BATCH_THRESHOLD)
+    generators = []
+    for stream in range(streams):
+        stream_road = road[stream] if isinstance(road, dict) else road
+        lanes = LaneMap(stream_road.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1)
+        extractor.add_source(SourceState(stream, stream_road, lanes, 'replay/stream_' + str(stream), windows=(windows or {}).get(stream)))
+        generators.append(TrafficGenerator(stream_road, lanes=4, rate=1.0, id_switch=0.005, seed=seed + stream))
+    recorder = DetectionRecorder(path)
+    for frame_number in range(frames):
+        for stream, generator in enumerate(generators):
+            detections = generator.frame()
+            timestamp = frame_number / FPS
+            recorder.write(stream, frame_number, int(timestamp * 1e9), timestamp, detections)
+            state = extractor.sources[stream]
+            extractor.update(state, frame_number, detections)
+            extractor.sweep(state, frame_number, timestamp)
+    recorder.close()
+    extractor.drain((frames - 1) / FPS)
+    return events
+
+def comparable(events):
+    return sorted(tuple(sorted((k, v) for k, v in event.items() if k != 'crop')) for event in events)
+
+@pytest.mark.parametrize('linking', [False, True])
+def test_replay_reproduces_the_live_events(tmp_path, linking):
+    path = str(tmp_path / 'live.det')
+    live = live_run(path, 2, 2000, linker=FragmentLinker() if linking else None)
+    replayed = []
+    extractor, frames, seconds = replay(path, DEFAULT_ROAD, TrackLifecycle(), replayed.append, linker=FragmentLinker() if linking else None, batch_threshold=BATCH_THRESHOLD)
+    assert extractor.batch_threshold == BATCH_THRESHOLD
+    assert frames == 4000
+    assert seconds == pytest.approx(1999 / FPS)
+    assert len(live) > 50
+    assert comparable(replayed) == comparable(live)
+
+def test_replay_of_a_truncated_recording(tmp_path):
+    # a recorder killed mid-frame; the partial last frame is skipped
+    path = str(tmp_path / 'live.det')
+    live_run(path, 1, 300)
+    with open(path, 'r+b') as recording:
+        recording.truncate(recording.seek(0, 2) - 5)
+    _, frames, _ = replay(path, DEFAULT_ROAD, TrackLifecycle(), lambda event: None, batch_threshold=BATCH_THRESHOLD)
+    assert frames == 299
+
+def test_replay_with_the_road_and_lane_windows_of_every_stream(tmp_path):
+    # stream 1 looks at the road from another camera and has per-lane optimal ranges; replaying it with the
+    # default road would not reproduce its events
+    path = str(tmp_path / 'live.det')
+    roads = {0: DEFAULT_ROAD, 1: DEFAULT_ROAD._replace(x11=600, x12=900, x13=1150, x14=1450, y1=450, y2=750)}
+    windows = {1: LaneWindows([450, 470, 500, 520], [700, 720, 750, 750], [575, 595, 625, 635])}
+    live = live_run(path, 2, 2000, road=roads, windows=windows)
+    replayed = []
+    replay(path, DEFAULT_ROAD, TrackLifecycle(), replayed.append, source_config=lambda stream: (roads[stream], windows.get(stream)), batch_threshold=BATCH_THRESHOLD)
+    assert comparable(replayed) == comparable(live)
+    default = []
+    replay(path, DEFAULT_ROAD, TrackLifecycle(), default.append, batch_threshold=BATCH_THRESHOLD)
+    assert comparable(default) != comparable(live)
@@ -0,0 +1,25 @@
+# Synthetic traffic (synthetic_traffic.py) is generated in the lane convention of the live classifier: a
+# vehicle generated in lane i is classified as lane i by LaneMap.
+
+import numpy as np
+import pytest
+
+from lane_geometry import LaneMap
+from synthetic_traffic import TrafficGenerator, DEFAULT_ROAD
+
+@pytest.mark.parametrize('lanes', [1, 3, 4])
+def test_generated_lanes_match_lane_map(lanes):
+    lane_map = LaneMap(DEFAULT_ROAD.boundaries(), 1920, 1080, 4, 3)
+    generator = TrafficGenerator(lanes=lanes, rate=2.0, occlusion=0, id_switch=0, clutter=0, seed=1)
+    seen = set()
+    for _ in range(1500):
+        detections = generator.frame()
+        if not len(detections):
+            continue
+        truth = dict(zip(generator.vehicles['object_id'].tolist(), generator.vehicles['lane'].tolist()))
+        x_center = detections['left'] + detections['width'] / 2
+        y_center = detections['top'] + detections['height'] / 2
+        expected = np.array([truth[object_id] for object_id in detections['object_id'].tolist()])
+        assert (lane_map.lanes(x_center, y_center) == expected).all()
+        seen.update(expected.tolist())
+    assert seen == set(range(lanes))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Track store shared by the DeepStream buffer probes (ofe.py, orc.py, deepstream_imagedata-multistream.py
+# and deepstream_test_2.py). Tracks are indexed by (source, object_id) so a detection finds its track in
+# O(1), and the per-detection bounding box metadata of a track lives in growable NumPy columns instead of
+# parallel Python lists.
+
+import numpy as np
+
+TRACK_COLUMNS = (    # column name, dtype
+    ('frames', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('xc', np.int32),
+    ('yc', np.int32),
+    ('width', np.float32),
+    ('height', np.float32),
+    ('lane', np.int8),
+)
+
+########## Track Class ##########     # one tracking instance; described by its source, its tracking id and the columns of its bounding box metadata
+
+class Track:
+    __slots__ = ('source', 'vehicle_id', 'length', '_frames', '_x', '_y', '_xc', '_yc', '_width', '_height', '_lane',
+                 'best_score', 'best_frame', 'best_x', 'best_y', 'best_width', 'best_height', 'best_lane')
+
+    def __init__(self, source, vehicle_id, capacity=32):
+        self.source = source
+        self.vehicle_id = vehicle_id
+        self.length = 0
+        for name, dtype in TRACK_COLUMNS:
+            setattr(self, '_' + name, np.empty(capacity, dtype=dtype))
+        self.best_score = float('-inf')     # running best candidate for the optimal frame; higher score is better
+        self.best_frame = -1
+        self.best_x = 0
+        self.best_y = 0
+        self.best_width = 0
+        self.best_height = 0
+        self.best_lane = -1
+
+    def append(self, frame_number, left, top, width, height, lane=-1):
+        i = self.length
+        if i == len(self._frames):      # columns are full; double their capacity
+            self._grow()
+        self._frames[i] = frame_number
+        self._x[i] = left
+        self._y[i] = top
+        self._xc[i] = int(left + (width / 2))
+        self._yc[i] = int(top + (height / 2))
+        self._width[i] = width
+        self._height[i] = height
+        self._lane[i] = lane
+        self.length = i + 1
+
+    def set_best(self, score, frame_number, left, top, width, height, lane=-1):
+        # replace the best candidate; callers compare against best_score first so that a tie keeps the earlier frame
+        self.best_score = score
+        self.best_frame = frame_number
+        self.best_x = left
+        self.best_y = top
+        self.best_width = width
+        self.best_height = height
+        self.best_lane = lane
+
+    def _grow(self):
+        for name, dtype in TRACK_COLUMNS:
+            old = getattr(self, '_' + name)
+            new = np.empty(2 * len(old), dtype=dtype)
+            new[:self.length] = old[:self.length]
+            setattr(self, '_' + name, new)
+
+    def __len__(self):
+        return self.length
+
+    # views over the filled part of each column; valid until the next append
+    @property
+    def frames(self):
+        return self._frames[:self.length]
+
+    @property
+    def x(self):
+        return self._x[:self.length]
+
+    @property
+    def y(self):
+        return self._y[:self.length]
+
+    @property
+    def xc(self):
+        return self._xc[:self.length]
+
+    @property
+    def yc(self):
+        return self._yc[:self.length]
+
+    @property
+    def width(self):
+        return self._width[:self.length]
+
+    @property
+    def height(self):
+        return self._height[:self.length]
+
+    @property
+    def lane(self):
+        return self._lane[:self.length]
+
+    @property
+    def first_frame(self):
+        return int(self._frames[0])
+
+    @property
+    def last_frame(self):
+        return int(self._frames[self.length - 1])
+
+########## Track Class ##########
+
+########## Track Store Class ##########     # hash index of the live tracks; keyed by (source, object_id)
+
+class TrackStore:
+    def __init__(self, capacity=32):
+        self.capacity = capacity    # initial column capacity of new tracks
+        self._tracks = {}
+
+    def append(self, source, object_id, frame_number, left, top, width, height, lane=-1):
+        key = (source, object_id)
+        track = self._tracks.get(key)
+        if track is None:       # first detection of this tracking id
+            track = Track(source, object_id, self.capacity)
+            self._tracks[key] = track
+        track.append(frame_number, left, top, width, height, lane)
+        return track
+
+    def extend(self, source, frame_number, detections, lanes=None):
+        # append a batch of detections (DETECTION_DTYPE records) of one frame; returns their tracks in the same order
+        rows = zip(detections['object_id'].tolist(), detections['left'].tolist(), detections['top'].tolist(),
+                   detections['width'].tolist(), detections['height'].tolist(), [-1] * len(detections) if lanes is None else lanes.tolist())
+        return [self.append(source, object_id, frame_number, left, top, width, height, lane) for object_id, left, top, width, height, lane in rows]
+
+    def lookup(self, source, object_id):
+        return self._tracks.get((source, object_id))
+
+    def retire(self, source, object_id):
+        return self._tracks.pop((source, object_id), None)
+
+    def tracks(self, source=None):
+        # snapshot, so tracks can be retired while iterating
+        if source is None:
+            return list(self._tracks.values())
+        return [t for t in self._tracks.values() if t.source == source]
+
+    def clear(self):
+        self._tracks.clear()
+
+    def __iter__(self):
+        return iter(self.tracks())
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, key):
+        return key in self._tracks
+
+########## Track Store Class ##########
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Output side of the optimal frame extractor, shared by the DeepStream (ofe.py) and CPU (ofe_cpu.py)
+# backends. Finalized vehicle events go through the output stage to the event log and the crop encoder;
+# encoded crops are stored as files or in pack files and the vehicle record is put to the server database.
+
+import requests
+
+from crop_encoder import CropEncoder, write_crop_file
+from crop_pack import PackWriter
+from event_log import EventLogger
+from output_stage import OutputStage
+from lane_geometry import LaneWindows
+from source_state import Road
+
+def fetch_road(base, road_id, fallback):
+    # road configuration of one camera from the server; cameras without their own record use the fallback
+    response = requests.get(base + "road/" + str(road_id))
+    if response.status_code != 200:
+        return fallback
+    return Road.from_json(response.json())
+
+def fetch_lane_windows(base, road_id, road, max_lane):
+    # per-lane optimal ranges of one camera from the server; lanes without their own window use the road's
+    response = requests.get(base + "road/" + str(road_id) + "/lanes")
+    if response.status_code != 200:
+        return LaneWindows.uniform(road, max_lane)
+    return LaneWindows.from_records(road, max_lane, response.json())
+
+########## Vehicle Output Class ##########     # described by the server, the crop encoder and storage, the event log and the output stage
+
+class VehicleOutput:
+    def __init__(self, config, base, server=True):
+        self.base = base
+        self.server = server    # put vehicle records to the server database
+        self.crop_storage = config.get('OFEConfig', 'cropStorage', fallback='files')    # 'files' writes one file per crop, 'pack' appends to rotating pack files
+        self.pack_rotation = config.get('OFEConfig', 'packRotation', fallback='hourly')
+        self.crop_pack = None   # created by open() once the output folder is known
+        self.crop_encoder = CropEncoder(config.getint('OFEConfig', 'cropWorkers', fallback=2), config.get('OFEConfig', 'cropFormat', fallback='jpg'),
+                                        config.getint('OFEConfig', 'cropQuality', fallback=90), config.getint('OFEConfig', 'cropMaxWidth', fallback=0))     # crop encoding thread pool
+        self.crop_encoder.add_consumer(self.store_crop)
+        self.crop_encoder.add_consumer(self.put_vehicle_record, fallback=True)     # the record goes to the database even if the crop fails to encode
+        if config.getboolean('OFEConfig', 'verbose', fallback=True):     # a line per crop; the crop encoder metrics cover it otherwise
+            self.crop_encoder.add_consumer(self.report_crop)
+        self.event_log = EventLogger(config.get('OFEConfig', 'eventLogPrefix', fallback='optimal_frame_extraction'), config.get('OFEConfig', 'eventLogFormat', fallback='bin'),
+                                     config.getint('OFEConfig', 'eventLogFlushRows', fallback=64), config.getfloat('OFEConfig', 'eventLogFlushSeconds', fallback=5),
+                                     int(config.getfloat('OFEConfig', 'eventLogRotateMegabytes', fallback=64) * 1024 * 1024), config.getint('OFEConfig', 'eventLogRotateSeconds', fallback=86400))    # finalized vehicle events; replaces optimal_frame_extraction.txt
+        self.output_stage = OutputStage([self.log_vehicle_event, self.write_crop], config.getint('OFEConfig', 'outputWorkers', fallback=2),
+                                        config.getint('OFEConfig', 'outputQueueSize', fallback=256), config.get('OFEConfig', 'outputPolicy', fallback='block'),
+                                        config.get('OFEConfig', 'outputSpillPath', fallback='output_spill.pkl'))     # database writes, log lines and crop files off the streaming thread
+
+    @property
+    def extension(self):
+        return self.crop_encoder.extension
+
+    def open(self, folder):
+        if self.crop_storage == 'pack':
+            self.crop_pack = PackWriter(folder, self.pack_rotation)
+
+    def submit(self, event):
+        # called from the streaming thread; only enqueues
+        self.output_stage.submit(event)
+
+    # output handlers; run by the output stage worker threads for every finalized vehicle event
+    def put_vehicle_record(self, event, data=None):
+        if not self.server:
+            return
+        response = requests.put(self.base + "vehicle/" + str(event['vehicle_id']), {"frame_number": str(event['frame_number']), "lane": event['lane'], "datetime": event['datetime'], "image_path": event['image_path']})     # add to server database
+        print(response.json())
+
+    def log_vehicle_event(self, event):
+        self.event_log.log(event['timestamp'], event['stream'], event['vehicle_id'], event['frame_number'], event['x'], event['y'],
+                           event['width'], event['height'], event['lane_id'])    # buffered; written in blocks by the event logger
+
+    def write_crop(self, event):
+        if event['crop'] is None:     # optimal frame already overwritten in the frame ring, or never captured
+            print('optimal frame', event['frame_number'], 'no longer buffered, skipping crop...', '\n')
+            self.put_vehicle_record(event)
+        else:
+            self.crop_encoder.submit(event)      # encoded on the crop encoder pool; the bytes go to the crop consumers
+
+    # crop consumers; run by the crop encoder threads with the encoded bytes
+    def store_crop(self, event, data):
+        if self.crop_pack is not None:       # append to the stream's pack file; the database points at the pack locator
+            event['image_path'] = self.crop_pack.append(event['stream'], event['vehicle_id'], event['frame_number'], data)
+        else:
+            write_crop_file(event, data)
+
+    def report_crop(self, event, data):
+        print('crop of vehicle', event['vehicle_id'], 'encoded in', '{0:.2f}'.format(event['encode_ms']), 'ms,', len(data), 'bytes written to', event['image_path'])
+
+    def close(self):
+        # drain the output stage, then the encoder; the event log goes last
+        self.output_stage.close()
+        self.crop_encoder.close()
+        if self.crop_pack is not None:
+            self.crop_pack.close()
+        self.event_log.close()
+
+    def report(self):
+        print("Event log:", self.event_log.path)
+        print("Output stage:", self.output_stage.metrics())
+        print("Crop encoder:", self.crop_encoder.metrics())
+
+########## Vehicle Output Class ##########
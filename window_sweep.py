@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+# Optimal window parameter sweep. orc.py derives the optimal range [y1, y2] of a camera from one heuristic;
+# this tool instead evaluates thousands of (y1, y2, midpoint) candidates against recorded vehicle tracks
+# (detection recordings, see recording.py) and ranks them. For every candidate and track it works out what
+# the Extractor would do: whether the track has enough detections with their top inside the window to be
+# finalized, and which detection would win as the optimal frame (the one whose centre is closest to the
+# midpoint). A candidate is scored on
+#   coverage  - fraction of the tracks that would be finalized,
+#   clipped   - fraction of the winning crops touching the frame border,
+#   size      - mean winning crop area, relative to the best candidate,
+#   offset    - mean distance of the winning crop centre from the midpoint, in crop heights,
+# as  coverage * (1 - clipped) + sizeWeight * size - offsetWeight * offset.
+# Per-track detection counts in the window come from cumulative counts over top bins, and the winning
+# detection from the per-track detection closest to the midpoint, or the first or last detection inside the
+# window when that one lies outside (vehicle centres move monotonically with their tops); everything is
+# evaluated on blocks of candidates at once. A day of tracks is sampled down to --max-tracks tracks.
+# With --lanes, every track is assigned the lane most of its detections are in (lane geometry of the road)
+# and each lane is swept on its own tracks; the best candidate of every lane, midpoint included, is a per-lane
+# window (see LaneWindows in lane_geometry.py).
+#
+# usage: python3 window_sweep.py <recording> [recording ...] [--stream 0] [--step 24] [--top 20] [--patch ROAD_ID] [--road-file road.txt] [--lanes]
+
+import configparser
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from calibration import publish_lane_window, publish_window
+from detections import centers
+from extractor import LANE_NAMES
+from lane_geometry import LaneMap
+from recording import load_recording
+from source_state import Road
+from vehicle_output import fetch_road
+
+BASE = "http://127.0.0.1:5000/"     # local host
+RESULT_DTYPE = np.dtype([('y1', '<i4'), ('y2', '<i4'), ('midpoint', '<i4'), ('coverage', '<f4'), ('clipped', '<f4'), ('area', '<f4'),
+                         ('offset', '<f4'), ('score', '<f4')])
+
+def vehicle_tracks(paths, stream=0, vehicle_class=0, max_tracks=0, seed=0):
+    # the vehicle detections of one stream, tracks keyed by (recording, object id); returns (track index per detection, detections),
+    # sorted by track and then by top
+    tracks, detections = [], []
+    for r, path in enumerate(paths):
+        headers, d, frame_index = load_recording(path)
+        keep = (headers['stream'][frame_index] == stream) & (d['class_id'] == vehicle_class)
+        detections.append(d[keep])
+        tracks.append((np.uint64(r) << np.uint64(48)) | d['object_id'][keep])
+    detections = np.concatenate(detections) if detections else np.zeros(0)
+    keys, track = np.unique(np.concatenate(tracks) if tracks else np.zeros(0, dtype=np.uint64), return_inverse=True)
+    if max_tracks and len(keys) > max_tracks:   # uniform sample of the tracks; coverage is a fraction, so it is estimated without bias
+        chosen = np.zeros(len(keys), dtype=bool)
+        chosen[np.random.default_rng(seed).choice(len(keys), max_tracks, replace=False)] = True
+        renumber = np.cumsum(chosen) - 1
+        keep = chosen[track]
+        track, detections = renumber[track[keep]], detections[keep]
+    order = np.lexsort((detections['top'], track))
+    return track[order], detections[order]
+
+def track_lanes(track, detections, lanes):
+    # lane of every track; the one most of its detections are in
+    x_center, y_center = centers(detections)
+    votes = np.zeros((int(track.max()) + 1 if len(track) else 0, lanes.max_lane + 1), dtype=np.int64)
+    np.add.at(votes, (track, lanes.lanes(x_center, y_center)), 1)
+    return votes.argmax(axis=1)
+
+def candidates(lo, hi, step, midpoint_step):
+    # (y1, y2, midpoint) on the step grid with lo <= y1 < midpoint < y2 <= hi; y2 is the last pixel of its bin
+    a, b = np.meshgrid(np.arange(lo // step, hi // step + 1), np.arange(lo // step, hi // step + 1), indexing='ij')
+    a, b = a[a < b], b[a < b]
+    midpoints = np.arange(0, hi + midpoint_step, midpoint_step)
+    y1, y2 = a * step, (b + 1) * step - 1
+    inside = (midpoints[None, :] > y1[:, None]) & (midpoints[None, :] < y2[:, None])
+    pair, m = np.nonzero(inside)
+    return a[pair], b[pair], m, midpoints
+
+def sweep(track, detections, width=1920, height=1080, step=24, midpoint_step=24, min_frames=6, size_weight=0.25, offset_weight=0.25, block=64):
+    # score every candidate window; returns RESULT_DTYPE records ranked by score
+    n = int(track.max()) + 1 if len(track) else 0
+    if not n:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    top = detections['top']
+    _, yc = centers(detections)
+    h = np.maximum(detections['height'], 1)
+    area = (detections['width'] * detections['height']).astype(np.float64)
+    clipped = (detections['left'] <= 0) | (detections['left'] + detections['width'] >= width - 1) | (top <= 0) | (top + detections['height'] >= height - 1)
+    lengths = np.bincount(track, minlength=n)
+    starts = np.cumsum(lengths) - lengths
+    bins_total = -(-height // step)
+    bins = np.clip((top // step).astype(np.int64), 0, bins_total - 1)
+    cumulative = np.zeros((bins_total + 1, n), dtype=np.int32)    # detections of each track with their top below each bin; bin-major, so a bin is one contiguous row
+    cumulative[1:] = np.cumsum(np.bincount(bins * n + track, minlength=n * bins_total).reshape(bins_total, n), axis=0)
+
+    lo, hi = int(np.percentile(top, 0.5)), min(int(np.percentile(top + h, 99.5)), height - 1)
+    a, b, m, midpoints = candidates(lo, hi, step, midpoint_step)
+    best = np.empty((len(midpoints), n), dtype=np.int64)    # per midpoint and track, the detection whose centre is closest to it
+    for i, midpoint in enumerate(midpoints):
+        distance = np.abs(yc - midpoint)
+        is_min = distance == np.repeat(np.minimum.reduceat(distance, starts), lengths)
+        first = np.flatnonzero(is_min)
+        _, at = np.unique(track[first], return_index=True)
+        best[i] = first[at]
+    best_bin = bins[best]
+    # the winning detection of a track is its best one for the midpoint, or else the first or last one inside the window
+    # (detections are in top order, and vehicle centres move monotonically with their tops); tables of the crop values
+    # for each case, indexed by midpoint or bin, so that a block of candidates only gathers whole rows
+    last = starts + np.maximum(lengths - 1, 0)
+    first_in = np.minimum(starts + cumulative, last)   # first detection at or after each bin
+    last_in = np.maximum(starts + cumulative - 1, starts)     # last detection before each bin
+    values = (clipped.astype(np.float32), area.astype(np.float32), yc.astype(np.float32), (1 / h).astype(np.float32))
+    tables = [(v[best], v[first_in], v[last_in]) for v in values]
+
+    results = np.zeros(len(a), dtype=RESULT_DTYPE)
+    results['y1'], results['y2'], results['midpoint'] = a * step, (b + 1) * step - 1, midpoints[m]
+    for s in range(0, len(a), block):
+        ab, bb, mb = a[s:s + block], b[s:s + block], m[s:s + block]
+        covered = (cumulative[bb + 1] - cumulative[ab] > min_frames).astype(np.float32)     # (candidates, tracks); tracks the Extractor would finalize
+        best_at = best_bin[mb]
+        before, after = best_at < ab[:, None], best_at > bb[:, None]
+        clip_w, area_w, yc_w, inv_h_w = (np.where(before, f[ab], np.where(after, l[bb + 1], v[mb])) for v, f, l in tables)
+        yc_w -= midpoints[mb][:, None].astype(np.float32)
+        np.abs(yc_w, out=yc_w)
+        yc_w *= inv_h_w
+        finalized = covered.sum(axis=1)
+        count = np.maximum(finalized, 1)
+        results['coverage'][s:s + block] = finalized / n
+        results['clipped'][s:s + block] = np.einsum('kn,kn->k', covered, clip_w) / count
+        results['area'][s:s + block] = np.einsum('kn,kn->k', covered, area_w) / count
+        results['offset'][s:s + block] = np.einsum('kn,kn->k', covered, yc_w) / count
+    size = results['area'] / max(float(results['area'].max()), 1.0)
+    results['score'] = results['coverage'] * (1 - results['clipped']) + size_weight * size - offset_weight * results['offset']
+    return results[np.lexsort((results['y2'] - results['y1'], -results['score']))]     # ties go to the narrower window
+
+def centred(results, tolerance):
+    # candidates whose midpoint is the centre of the window, as the Extractor uses it (Road.midpoint)
+    return results[np.abs(results['midpoint'] - (results['y1'] + results['y2']) // 2) <= tolerance]
+
+def main(args):
+    parser = ArgumentParser(description='Rank candidate optimal windows (y1, y2, midpoint) against recorded vehicle tracks.')
+    parser.add_argument('recordings', nargs='+')
+    parser.add_argument('--stream', type=int, default=0)
+    parser.add_argument('--step', type=int, default=24, help='grid step of y1 and y2, in pixels')
+    parser.add_argument('--midpoint-step', type=int, default=24, help='grid step of the midpoint, in pixels')
+    parser.add_argument('--min-frames', type=int, help='minTrainFrames of config.ini if omitted; 0 counts every track with a detection in the window')
+    parser.add_argument('--size-weight', type=float, default=0.25)
+    parser.add_argument('--offset-weight', type=float, default=0.25)
+    parser.add_argument('--max-tracks', type=int, default=10000, help='sample of tracks to evaluate; 0 for all')
+    parser.add_argument('--top', type=int, default=20, help='ranked candidates to print')
+    parser.add_argument('--output', help='write every candidate to this CSV file')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--patch', type=int, metavar='ROAD_ID', help='write the best centred window to /road/<ROAD_ID>')
+    parser.add_argument('--road-file', help="also write it to this road configuration file ('road.txt' format)")
+    parser.add_argument('--lanes', action='store_true', help='sweep every lane on its own tracks; --patch then writes per-lane windows')
+    parser.add_argument('--road', default='road.txt', help='lane geometry for --lanes, unless the server has a record for --patch')
+    options = parser.parse_args(args[1:])
+    config = configparser.ConfigParser()
+    config.read(options.config)
+    min_frames = options.min_frames if options.min_frames is not None else config.getint('OFEConfig', 'minTrainFrames', fallback=6)
+
+    start = time.perf_counter()
+    track, detections = vehicle_tracks(options.recordings, options.stream, max_tracks=options.max_tracks)
+    if options.lanes:
+        return sweep_lanes(options, track, detections, min_frames)
+    loaded = time.perf_counter()
+    results = sweep(track, detections, step=options.step, midpoint_step=options.midpoint_step, min_frames=min_frames,
+                    size_weight=options.size_weight, offset_weight=options.offset_weight)
+    swept = time.perf_counter()
+    print(len(np.unique(track)), 'tracks,', len(detections), 'detections loaded in', '{0:.2f}'.format(loaded - start), 's;',
+          len(results), 'candidates swept in', '{0:.2f}'.format(swept - loaded), 's')
+    print('%4s %6s %6s %8s %9s %8s %10s %8s %8s' % ('rank', 'y1', 'y2', 'midpoint', 'coverage', 'clipped', 'area px', 'offset', 'score'))
+    for rank, r in enumerate(results[:options.top], 1):
+        print('%4d %6d %6d %8d %9.3f %8.3f %10.0f %8.3f %8.3f' % (rank, r['y1'], r['y2'], r['midpoint'], r['coverage'], r['clipped'], r['area'], r['offset'], r['score']))
+    if options.output:
+        np.savetxt(options.output, results, delimiter=',', header=','.join(RESULT_DTYPE.names), comments='', fmt=['%d'] * 3 + ['%.5f'] * 5)
+
+    if options.patch is not None or options.road_file:
+        chosen = centred(results, options.midpoint_step // 2)   # the road record has no midpoint of its own
+        if not len(chosen):
+            sys.stderr.write("no candidate with a centred midpoint\n")
+            return 1
+        y1, y2 = int(chosen[0]['y1']), int(chosen[0]['y2'])
+        print('chosen: y1', y1, 'y2', y2, '(best centred candidate, rank', int(np.flatnonzero(results == chosen[0])[0]) + 1, ')')
+        if options.patch is not None:
+            print(publish_window(BASE, options.patch, y1, y2).json())
+        if options.road_file:
+            road = Road.from_file(options.road_file)._replace(y1=y1, y2=y2)
+            with open(options.road_file, 'w') as road_file:
+                for key, value in zip(road._fields, road):
+                    road_file.write('%s %d\n' % (key, value))
+    return 0
+
+def sweep_lanes(options, track, detections, min_frames):
+    road = Road.from_file(options.road) if os.path.exists(options.road) else None
+    if options.patch is not None:
+        road = fetch_road(BASE, options.patch, road)
+    if road is None:
+        sys.stderr.write("no lane geometry; --road file or a server road record for --patch\n")
+        return 1
+    lanes = LaneMap(road.boundaries(), 1920, 1080, 4, len(LANE_NAMES) - 1)
+    lane_of = track_lanes(track, detections, lanes)
+    print('%4s %8s %7s %6s %6s %8s %9s %8s %8s' % ('lane', 'name', 'tracks', 'y1', 'y2', 'midpoint', 'coverage', 'clipped', 'score'))
+    for lane in range(lanes.max_lane + 1):
+        keep = lane_of[track] == lane
+        if not keep.any():
+            continue
+        tracks, lane_track = np.unique(track[keep], return_inverse=True)    # renumbered from 0 for the sweep
+        results = sweep(lane_track, detections[keep], step=options.step, midpoint_step=options.midpoint_step, min_frames=min_frames,
+                        size_weight=options.size_weight, offset_weight=options.offset_weight)
+        if not len(results):
+            continue
+        r = results[0]
+        print('%4d %8s %7d %6d %6d %8d %9.3f %8.3f %8.3f' % (lane, LANE_NAMES[lane], len(tracks), r['y1'], r['y2'], r['midpoint'], r['coverage'], r['clipped'], r['score']))
+        if options.patch is not None:
+            print(publish_lane_window(BASE, options.patch, lane, int(r['y1']), int(r['y2']), int(r['midpoint'])).json())
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))